@@ -1,6 +1,33 @@
+import os
+import sys
+
 from django.apps import AppConfig
 
 
+def serving_process(argv=None):
+    """
+    Return whether the process serves the requests, so its warm-up can start as soon as the application is loaded.
+
+    The management commands (tests included) and the autoreloader of `runserver` do not serve requests. Neither does
+    the master of gunicorn, which loads the application before forking the workers with `--preload`: the thread and
+    the JVM of the warm-up would not survive the fork, so the workers start it with the `post_worker_init` hook of
+    `gunicorn.conf.py` instead. The other servers (e.g. uvicorn) load the application in each worker.
+    """
+    argv = sys.argv if argv is None else argv
+    program = argv[0] if argv else ""
+    if os.path.basename(program) == "gunicorn" or program.endswith(os.path.join("gunicorn", "__main__.py")):
+        return False
+    if os.path.basename(program) in ("manage.py", "django-admin"):
+        # the autoreloader runs the server in a child process, with RUN_MAIN set
+        return argv[1:2] == ["runserver"] and (os.environ.get("RUN_MAIN") == "true" or "--noreload" in argv)
+    return True
+
+
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        if serving_process():
+            from .services import start_warm_up
+            start_warm_up()
@@ -0,0 +1,43 @@
+import secrets
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class SearchCursors:
+    """
+    Server-side store of the ranked docnos of the searches.
+
+    The ranking of a query is computed once and stored under an opaque token (the cursor), which is then sent back by
+    the client to request the next pages. The store is a Django cache, bounded in size and in age of the entries: when
+    a cursor has expired (or was created by another process) the search is simply performed again.
+    """
+
+    def __init__(self, cache_alias):
+        self.cache_alias = cache_alias
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def create(self, query, docnos):
+        """
+        Store the ranked docnos of `query`, returning the cursor that identifies them.
+        """
+        cursor = secrets.token_urlsafe(16)
+        self.cache.set(cursor, (query, [int(docno) for docno in docnos]))
+        return cursor
+
+    def get(self, cursor, query):
+        """
+        Return the ranked docnos stored for `cursor`, None if the cursor is unknown, expired or belongs to another query.
+        """
+        if not cursor:
+            return None
+        entry = self.cache.get(cursor)
+        if entry is None or entry[0] != query:
+            return None
+        return entry[1]
+
+
+search_cursors = SearchCursors(settings.SEARCH_CURSORS_CACHE)
@@ -0,0 +1,60 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+
+class ExecutorSaturated(Exception):
+    """
+    Raised when too many tasks are already running or waiting in a `BoundedExecutor`.
+    """
+
+
+class BoundedExecutor:
+    """
+    Runs blocking functions (the Terrier queries) from async views on a pool of `max_workers` threads, so that the event
+    loop keeps serving the other requests while a query runs.
+
+    At most `max_queue` tasks wait for a free thread: when the queue is full, new tasks are rejected immediately with
+    `ExecutorSaturated` instead of piling up, so the views can answer 503 and the clients retry later.
+
+    Threads are used instead of processes because the index (and the JVM holding it) is loaded once per process.
+    """
+
+    def __init__(self, max_workers=4, max_queue=32, name="retrieval"):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.pending = 0  # tasks running or waiting
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Run `func(*args, **kwargs)` on the pool and wait for its result.
+
+        :raises ExecutorSaturated: if `max_queue` tasks are already waiting
+        """
+        with self._lock:
+            if self.pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturated()
+            self.pending += 1
+
+        try:
+            future = self.executor.submit(functools.partial(func, *args, **kwargs))
+        except BaseException:
+            self._done(None)
+            raise
+        # the task stays pending until it ends on the pool, even if the view waiting for it is cancelled
+        future.add_done_callback(self._done)
+        return await asyncio.wrap_future(future)
+
+    def _done(self, future):
+        with self._lock:
+            self.pending -= 1
+
+
+retrieval_executor = BoundedExecutor(settings.RETRIEVAL_WORKERS, settings.RETRIEVAL_MAX_QUEUE)
@@ -0,0 +1,166 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Max
+from rest_framework.renderers import JSONRenderer
+
+from core.models import Movie, DataSource
+
+from .serializers import MovieSerializer
+
+
+def render_fragment(data):
+    """
+    Render the serialized data of a movie as JSON, exactly as the API renders it in a response.
+    """
+    return JSONRenderer().render(data)
+
+
+def join_fragments(fragments):
+    """
+    Return the JSON list of the rendered movies.
+    """
+    return b"[" + b",".join(fragments) + b"]"
+
+
+class MovieFragments:
+    """
+    Cache of the rendered JSON of each movie (the output of `MovieSerializer`), so that the responses are assembled by
+    concatenating the cached fragments instead of loading and serializing the movies at every request.
+
+    A movie only changes when the scraper writes it, which updates `last_crawled` of its data sources: the version of a
+    fragment is the latest `last_crawled` of the movie, and a fragment whose version is not the current one is rendered
+    again. Checking the versions of a page costs a single query.
+
+    The fragments are kept in an in-process LRU of `max_size` movies and, if `path` is set, in a sqlite file shared by
+    the processes of the server and kept across restarts. The sqlite file is only a cache: when it cannot be read or
+    written (e.g. locked by another process for too long), the fragments are served from the LRU or rendered again.
+    """
+
+    def __init__(self, max_size=10000, path=None):
+        self.max_size = max_size
+        self.path = path
+        self.fragments = OrderedDict()  # movie id -> (version, fragment)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()  # a sqlite connection for each thread
+
+        if path:
+            try:
+                with sqlite3.connect(path) as db:
+                    # the readers of the other processes are not blocked by a write
+                    db.execute("PRAGMA journal_mode=WAL")
+                    db.execute("""
+                        CREATE TABLE IF NOT EXISTS fragments (movie_id INTEGER PRIMARY KEY, version TEXT, fragment BLOB)
+                        """)
+            except sqlite3.Error as e:
+                print(f"Cannot open the movie fragments file {path}, using only the in-process cache: {e}")
+                self.path = None
+
+    @property
+    def db(self):
+        if not self.path:
+            return None
+        if getattr(self._local, "db", None) is None:
+            self._local.db = sqlite3.connect(self.path)
+        return self._local.db
+
+    @staticmethod
+    def versions(ids):
+        """
+        Return the current version of the movies with the given ids.
+        """
+        rows = DataSource.objects.filter(movie_id__in=ids).values('movie_id').annotate(version=Max('last_crawled'))
+        return {row['movie_id']: row['version'].isoformat() if row['version'] else "" for row in rows}
+
+    def _get_local(self, movie_id, version):
+        with self._lock:
+            entry = self.fragments.get(movie_id)
+            if entry is None or entry[0] != version:
+                return None
+            self.fragments.move_to_end(movie_id)
+            return entry[1]
+
+    def _put_local(self, movie_id, version, fragment):
+        with self._lock:
+            self.fragments[movie_id] = (version, fragment)
+            self.fragments.move_to_end(movie_id)
+            while len(self.fragments) > self.max_size:
+                self.fragments.popitem(last=False)
+
+    def _get_stored(self, ids, versions):
+        if not self.path or not ids:
+            return {}
+        try:
+            rows = self.db.execute(f"SELECT movie_id, version, fragment FROM fragments WHERE movie_id IN "
+                                   f"({','.join('?' * len(ids))})", ids).fetchall()
+        except sqlite3.Error as e:
+            print(f"Cannot read the movie fragments: {e}")
+            return {}
+        return {movie_id: bytes(fragment) for movie_id, version, fragment in rows
+                if version == versions.get(movie_id, "")}
+
+    def _put_stored(self, entries):
+        if not self.path or not entries:
+            return
+        try:
+            with self.db:
+                self.db.executemany("INSERT OR REPLACE INTO fragments (movie_id, version, fragment) VALUES (?, ?, ?)",
+                                    entries)
+        except sqlite3.Error as e:
+            # the fragments are still in the in-process cache
+            print(f"Cannot store the movie fragments: {e}")
+
+    def get_many(self, ids):
+        """
+        Return the rendered JSON of the movies with the given ids, in the same order; the ids of movies that do not
+        exist are skipped.
+        """
+        ids = [int(pk) for pk in ids]
+        versions = self.versions(ids)
+
+        found = {}
+        for movie_id in ids:
+            fragment = self._get_local(movie_id, versions.get(movie_id, ""))
+            if fragment is not None:
+                found[movie_id] = fragment
+
+        missing = [movie_id for movie_id in ids if movie_id not in found]
+        stored = self._get_stored(missing, versions)
+        for movie_id, fragment in stored.items():
+            self._put_local(movie_id, versions.get(movie_id, ""), fragment)
+        found.update(stored)
+
+        missing = [movie_id for movie_id in missing if movie_id not in found]
+        with self._lock:
+            self.hits += len(ids) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            rendered = []
+            movies = Movie.retrieve_sorted(missing)
+            for movie, data in zip(movies, MovieSerializer(movies, many=True).data):
+                fragment = render_fragment(data)
+                version = versions.get(movie.id, "")
+                self._put_local(movie.id, version, fragment)
+                rendered.append((movie.id, version, fragment))
+                found[movie.id] = fragment
+            self._put_stored(rendered)
+
+        return [found[movie_id] for movie_id in ids if movie_id in found]
+
+    def clear(self):
+        with self._lock:
+            self.fragments.clear()
+        if self.path:
+            try:
+                with self.db:
+                    self.db.execute("DELETE FROM fragments")
+            except sqlite3.Error as e:
+                print(f"Cannot clear the movie fragments: {e}")
+
+
+movie_fragments = MovieFragments(settings.MOVIE_FRAGMENTS_MAX_SIZE, settings.MOVIE_FRAGMENTS_PATH) \
+    if settings.MOVIE_FRAGMENTS_MAX_SIZE > 0 else None
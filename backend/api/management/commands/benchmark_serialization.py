@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from core.models import Movie
+
+from api.fragments import MovieFragments, join_fragments
+from api.serializers import MovieSerializer
+
+
+class Command(BaseCommand):
+    help = "Measure the cost of rendering a page of movies with MovieSerializer and with the cache of rendered movies"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, default=50, help="number of pages rendered")
+        parser.add_argument("--page-size", type=int, default=20, help="number of movies in each page")
+
+    def measure(self, pages, render):
+        start = time.perf_counter()
+        for page in pages:
+            render(page)
+        return (time.perf_counter() - start) / len(pages) * 1000
+
+    def handle(self, *args, **options):
+        page_size = options["page_size"]
+        ids = list(Movie.objects.order_by("id").values_list("id", flat=True)[:options["pages"] * page_size])
+        pages = [ids[i:i + page_size] for i in range(0, len(ids), page_size)]
+        if not pages:
+            self.stdout.write("No movies in the database")
+            return
+
+        fragments = MovieFragments(max_size=len(ids))
+
+        def serialize(page):
+            return JSONRenderer().render(MovieSerializer(Movie.retrieve_sorted(page), many=True).data)
+
+        def from_fragments(page):
+            return join_fragments(fragments.get_many(page))
+
+        serializer_ms = self.measure(pages, serialize)
+        cold_ms = self.measure(pages, from_fragments)  # every movie is rendered and cached
+        warm_ms = self.measure(pages, from_fragments)
+
+        self.stdout.write(f"{len(pages)} pages of {page_size} movies")
+        self.stdout.write(f"MovieSerializer:         {serializer_ms:8.2f} ms/page")
+        self.stdout.write(f"fragments (cold cache):  {cold_ms:8.2f} ms/page")
+        self.stdout.write(f"fragments (warm cache):  {warm_ms:8.2f} ms/page")
@@ -0,0 +1,39 @@
+from django.http import HttpResponse
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.urls import replace_query_param
+
+
+class SearchCursorPagination(PageNumberPagination):
+    """
+    Page number pagination over the ranked docnos of a search.
+
+    The links to the next and previous pages carry the cursor of the search (set by the view as `view.cursor`), so
+    that the following pages are sliced from the stored ranking instead of performing the search again.
+    """
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor = getattr(view, 'cursor', None)
+        return super().paginate_queryset(queryset, request, view)
+
+    def add_cursor(self, url):
+        if url is None or self.cursor is None:
+            return url
+        return replace_query_param(url, self.cursor_query_param, self.cursor)
+
+    def get_next_link(self):
+        return self.add_cursor(super().get_next_link())
+
+    def get_previous_link(self):
+        return self.add_cursor(super().get_previous_link())
+
+    def get_paginated_fragments_response(self, fragments):
+        """
+        Same as `get_paginated_response`, with the results of the page already rendered as JSON (see `api.fragments`):
+        they are concatenated in the response as they are.
+        """
+        envelope = JSONRenderer().render({'count': self.page.paginator.count, 'next': self.get_next_link(),
+                                          'previous': self.get_previous_link()})
+        body = envelope[:-1] + b',"results":[' + b','.join(fragments) + b']}'
+        return HttpResponse(body, content_type='application/json')
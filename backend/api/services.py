@@ -1,14 +1,132 @@
 import sys
 import os
+import threading
+import time
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
 
-from retrieval.retriever import perform_query, load_index, recommend
+from django.conf import settings
 
-index = load_index()
+from retrieval.client import RetrievalClient, RetrievalSaturated
+from retrieval.retriever import load_retriever, default_index_path, DocumentStore
+
+# with RETRIEVAL_SERVER the queries are performed by the retrieval server, which holds the only copy of the index;
+# otherwise each process loads its own, on the first query (or at the warm-up), so importing this module does not
+# start the JVM
+retrieval_client = RetrievalClient(settings.RETRIEVAL_SERVER, timeout=settings.RETRIEVAL_SERVER_TIMEOUT) \
+    if settings.RETRIEVAL_SERVER else None
+_retriever = None
+_retriever_lock = threading.Lock()
+document_store = DocumentStore(default_index_path())
+
+def get_retriever():
+    """
+    Return the retriever of the process, loading the index the first time.
+    """
+    global _retriever
+    if _retriever is None:
+        with _retriever_lock:
+            if _retriever is None:
+                start_time = time.time()
+                _retriever = load_retriever()
+                print(f"Index loaded in {time.time() - start_time:.2f} seconds")
+    return _retriever
 
 def perform_search(query, *args, **kwargs):
-    return perform_query(index, query, *args, **kwargs)["docno"]
+    if retrieval_client is not None:
+        return retrieval_client.search(query, *args, **kwargs)
+    return get_retriever().perform_query(query, *args, **kwargs)["docno"]
 
 def retrieve_recommended(q):
-    return recommend(index, q)["docno"]
+    if retrieval_client is not None:
+        return retrieval_client.recommend(q)
+    return get_retriever().recommend(q)["docno"]
+
+def movie_records(docnos):
+    """
+    Return the JSON of the movies with the given docnos from the document store of the index, in the same order, as
+    `MovieSerializer` would render them. None if the store is disabled or not available: the movies have to be loaded
+    from the database.
+    """
+    if not settings.SEARCH_DOCUMENT_STORE:
+        return None
+    return document_store.get_records(docnos)
+
+
+class WarmUp:
+    """
+    Warm-up of the process: loads the index and replays the queries of RETRIEVAL_WARMUP_QUERIES through
+    `batch_retrieve` and `recommend`, so that the JIT of the JVM has compiled the retrieval code and the pipelines are
+    built before the first request. The searches skip the result cache, so each one runs the whole pipeline.
+
+    It runs in a thread started when the worker starts (see `start_warm_up`); the readiness endpoint only reports its
+    status.
+    """
+
+    def __init__(self, queries):
+        self.queries = list(queries)
+        self.status = "not started"  # then "running", "ready" or "failed"; "disabled" without RETRIEVAL_WARMUP
+        self.error = None
+        self.started_at = None
+        self.duration = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.status in ("ready", "disabled")
+
+    def start(self):
+        """
+        Start the warm-up in a background thread, if not already started.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.status = "running"
+            self.started_at = time.time()
+            self._thread = threading.Thread(target=self.run, name="warm-up", daemon=True)
+            self._thread.start()
+
+    def run(self):
+        start_time = time.perf_counter()
+        try:
+            if retrieval_client is not None:
+                # the retrieval server is warmed up by its own queries: check that it answers
+                retrieval_client.ping()
+                retrieval_client.search_many(self.queries)
+                for query in self.queries:
+                    retrieval_client.recommend(query)
+            else:
+                retriever = get_retriever()
+                for query in self.queries:
+                    retriever.batch_retrieve(query, use_cache=False)
+                    retriever.recommend(query)
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            self.status = "failed"
+            print(f"Warm-up failed: {self.error}")
+        else:
+            self.status = "ready"
+        finally:
+            self.duration = time.perf_counter() - start_time
+        print(f"Warm-up {self.status} in {self.duration:.2f} seconds ({len(self.queries)} queries)")
+
+    def report(self):
+        return {"status": self.status, "ready": self.ready, "queries": len(self.queries),
+                "started_at": self.started_at, "duration": self.duration, "error": self.error}
+
+
+warm_up = WarmUp(settings.RETRIEVAL_WARMUP_QUERIES)
+
+def start_warm_up():
+    """
+    Start the warm-up of the process, when a worker of the server starts: called by `ApiConfig.ready` in the processes
+    serving the requests, and by the `post_worker_init` hook of `gunicorn.conf.py` in the workers of gunicorn.
+    """
+    if warm_up.status != "not started":
+        return
+    if settings.RETRIEVAL_WARMUP:
+        warm_up.start()
+    else:
+        warm_up.status = "disabled"
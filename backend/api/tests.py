@@ -1,3 +1,607 @@
+import asyncio
+import concurrent.futures
+import json
+import socket
+import threading
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+import os
+import runpy
+import sys
+import tempfile
+import time
+
+import pandas as pd
+from django.db import connection
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from core.models import Movie, DataSource, Review
+
+from .cursors import search_cursors
+from .executor import BoundedExecutor, ExecutorSaturated
+from .fragments import MovieFragments, join_fragments
+from .serializers import MovieSerializer
+from .apps import serving_process
+from .services import WarmUp, start_warm_up, warm_up
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from retrieval.client import HEADER, RetrievalClient, RetrievalError, RetrievalSaturated
+from retrieval.loader import DATA_QUERY, DOCUMENTS_QUERY, ID_RANGE_CONDITION, data_query, document_record
+from retrieval.retriever import DocumentStore, ResultCache
+
+# the modules run as scripts from the retrieval folder import their siblings directly
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'retrieval')))
+
+from server import RetrievalServer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'scraper')))
+
+from scraper import items
+from scraper.pipelines import PostgresBulkPipeline
+
+
+class UnmanagedModelsTestCase(TestCase):
+    """
+    The models are not managed by Django, so their tables are created in the test database for the duration of the
+    tests.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as schema_editor:
+            schema_editor.create_model(Movie)
+            schema_editor.create_model(DataSource)
+            schema_editor.create_model(Review)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as schema_editor:
+            schema_editor.delete_model(Review)
+            schema_editor.delete_model(DataSource)
+            schema_editor.delete_model(Movie)
+
+
+class RetrieveSortedTestCase(UnmanagedModelsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(30):
+            movie = Movie.objects.create(title=f"Movie {i}", release=2000 + i, duration=90, genres=["Drama"])
+            for name in ["IMDb", "Metacritic"]:
+                DataSource.objects.create(movie=movie, name=name, url=f"https://{name.lower()}.com/{i}", score=7.5)
+
+    def test_keeps_rank_order(self):
+        ids = list(Movie.objects.values_list("id", flat=True))[::-1]
+        movies = Movie.retrieve_sorted([str(pk) for pk in ids])
+        self.assertEqual([movie.id for movie in movies], ids)
+
+    def test_skips_missing_ids(self):
+        ids = list(Movie.objects.values_list("id", flat=True))[:3]
+        movies = Movie.retrieve_sorted([ids[0], -1, ids[2]])
+        self.assertEqual([movie.id for movie in movies], [ids[0], ids[2]])
+
+    def test_page_query_count(self):
+        ids = list(Movie.objects.values_list("id", flat=True))[:20]
+
+        # one query for the movies, one for all their data sources
+        with self.assertNumQueries(2):
+            data = MovieSerializer(Movie.retrieve_sorted(ids), many=True).data
+
+        self.assertEqual(len(data), 20)
+        self.assertEqual(set(data[0]["data_sources"].keys()), {"imdb", "metacritic"})
+
+
+class DataQueryTestCase(UnmanagedModelsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.movie = Movie.objects.create(title="Reviewed", release=2001)
+        for name in ["IMDb", "Rotten Tomatoes", "Metacritic"]:
+            DataSource.objects.create(movie=cls.movie, name=name, url=f"https://{name.lower()}.com/reviewed",
+                                      page_title=f"Reviewed - {name}")
+        for i in range(4):
+            Review.objects.create(id=f"review-{i}", movie=cls.movie, title=f"Review {i}", content="Great")
+        cls.other = Movie.objects.create(title="Not reviewed", release=2002)
+        DataSource.objects.create(movie=cls.other, name="IMDb", url="https://imdb.com/not-reviewed")
+
+    def rows(self, query, params=None):
+        with connection.cursor() as cursor:
+            cursor.execute(query, params)
+            columns = [column[0] for column in cursor.description]
+            return {row[0]: dict(zip(columns, row)) for row in cursor.fetchall()}
+
+    def test_reviews_counted_once(self):
+        rows = self.rows(DATA_QUERY)
+        self.assertEqual(sorted(rows[self.movie.id]["reviews"]), [f"Review {i} - Great" for i in range(4)])
+        self.assertEqual(len(rows[self.movie.id]["urls"]), 3)
+        self.assertEqual(len(rows[self.movie.id]["page_titles"]), 3)
+
+    def test_movie_without_reviews(self):
+        rows = self.rows(DATA_QUERY)
+        self.assertIsNone(rows[self.other.id]["reviews"])
+        self.assertEqual(rows[self.other.id]["urls"], ["https://imdb.com/not-reviewed"])
+
+    def test_filtered_query(self):
+        rows = self.rows(data_query(ID_RANGE_CONDITION), {"min_id": self.movie.id, "max_id": self.movie.id + 1})
+        self.assertEqual(list(rows), [self.movie.id])
+        self.assertEqual(len(rows[self.movie.id]["reviews"]), 4)
+
+
+class BulkPipelineTestCase(UnmanagedModelsTestCase):
+    @staticmethod
+    def movie_item(source_name, release=None, description=None):
+        url = f"https://{source_name.lower()}.com/movie"
+        return items.Movie(movie_id=f"{source_name}-1", title="Movie", description=description, release=release,
+                           duration=None, genres=["Drama"], score=None, critic_score=None, directors=["Director"],
+                           actors=[], metadata=items.Movie.Metadata(url, source_name, None, "Movie"))
+
+    def write_movies(self, movies):
+        # only the staging tables and the cursor are used, not the connections of the pipeline
+        pipeline = PostgresBulkPipeline.__new__(PostgresBulkPipeline)
+        with connection.cursor() as cursor:
+            pipeline.create_staging_tables(cursor)
+            pipeline.write_movies(cursor, movies)
+
+    def test_movie_without_release(self):
+        self.write_movies([self.movie_item("IMDb")])
+        self.write_movies([self.movie_item("Metacritic", description="A movie")])
+        self.write_movies([self.movie_item("IMDb")])
+
+        movie = Movie.objects.get()
+        self.assertIsNone(movie.release)
+        self.assertEqual(movie.description, "A movie")
+        self.assertEqual(sorted(movie.data_sources.values_list("name", flat=True)), ["IMDb", "Metacritic"])
+
+    def test_movie_with_release(self):
+        self.write_movies([self.movie_item("IMDb", release=2001), self.movie_item("Metacritic", release=2001)])
+        self.write_movies([self.movie_item("IMDb")])
+
+        self.assertEqual(sorted(Movie.objects.values_list("release", flat=True), key=str), [2001, None])
+        self.assertEqual(DataSource.objects.filter(movie__release=2001).count(), 2)
+
+
+class SearchCursorTestCase(UnmanagedModelsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ids = [Movie.objects.create(title=f"Movie {i}", release=2000, duration=90, genres=["Drama"]).id
+                   for i in range(30)][::-1]
+
+    def setUp(self):
+        search_cursors.cache.clear()
+        patcher = mock.patch("api.views.perform_search", return_value=[str(pk) for pk in self.ids])
+        self.perform_search = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def search(self, **params):
+        response = self.client.get('/api/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    @staticmethod
+    def cursor(link):
+        return parse_qs(urlparse(link).query)["cursor"][0]
+
+    def test_pages_reuse_ranking(self):
+        first = self.search(q="movie")
+        second = self.search(q="movie", page=2, cursor=self.cursor(first["next"]))
+
+        self.assertEqual(self.perform_search.call_count, 1)
+        self.assertEqual(first["count"], 30)
+        self.assertEqual([movie["id"] for movie in first["results"] + second["results"]], self.ids)
+        self.assertIsNone(second["next"])
+        self.assertEqual(self.cursor(second["previous"]), self.cursor(first["next"]))
+
+    def test_cursor_of_other_query(self):
+        first = self.search(q="movie")
+        self.search(q="other", page=2, cursor=self.cursor(first["next"]))
+        self.assertEqual(self.perform_search.call_count, 2)
+        self.assertEqual(self.perform_search.call_args.args[0], "other")
+
+    def test_expired_cursor(self):
+        first = self.search(q="movie")
+        search_cursors.cache.clear()
+        second = self.search(q="movie", page=2, cursor=self.cursor(first["next"]))
+
+        self.assertEqual(self.perform_search.call_count, 2)
+        self.assertEqual([movie["id"] for movie in second["results"]], self.ids[20:])
+        # the links carry the cursor of the new ranking
+        self.assertNotEqual(self.cursor(second["previous"]), self.cursor(first["next"]))
+
+
+class DocumentStoreTestCase(UnmanagedModelsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.movie = Movie.objects.create(title="Movie", release=2000, duration=-1, genres=["Drama"],
+                                         image_url="https://images.com/1")
+        DataSource.objects.create(movie=cls.movie, name="IMDb", url="https://imdb.com/1", score=float("nan"),
+                                  critic_score=7.5)
+        DataSource.objects.create(movie=cls.movie, name="Rotten Tomatoes", url="https://rottentomatoes.com/1",
+                                  page_title="Movie", score=8.0)
+        cls.other = Movie.objects.create(title="Other", release=2001, duration=120, genres=[])
+
+    def documents(self):
+        with connection.cursor() as cursor:
+            cursor.execute(DOCUMENTS_QUERY)
+            columns = [column[0] for column in cursor.description]
+            return [(row[0], document_record(dict(zip(columns, row)))) for row in cursor.fetchall()]
+
+    def test_documents_match_serializer(self):
+        ids = [self.movie.id, self.other.id]
+        expected = json.loads(JSONRenderer().render(MovieSerializer(Movie.retrieve_sorted(ids), many=True).data))
+        self.assertEqual([document for _, document in self.documents()], expected)
+
+    def test_store_keeps_rank_order(self):
+        with tempfile.TemporaryDirectory() as index_path:
+            # the store is only used with the version of the index it was written for
+            open(os.path.join(index_path, "data.properties"), "w").close()
+            DocumentStore.write(index_path, self.documents())
+
+            documents = DocumentStore(index_path).get([self.other.id, -1, self.movie.id])
+            self.assertEqual([document["id"] for document in documents], [self.other.id, self.movie.id])
+            self.assertEqual(documents[1]["data_sources"]["imdb"]["score"], None)
+
+    def test_store_reloaded_when_rewritten(self):
+        with tempfile.TemporaryDirectory() as index_path:
+            properties = os.path.join(index_path, "data.properties")
+            open(properties, "w").close()
+            DocumentStore.write(index_path, self.documents())
+            store = DocumentStore(index_path, check_interval=0)
+            self.assertEqual(len(store.get([self.movie.id, self.other.id])), 2)
+
+            # a new version of the index and of its store: the readers switch to the new files at once
+            os.utime(properties, (time.time() + 10, time.time() + 10))
+            DocumentStore.write(index_path, [document for document in self.documents() if document[0] == self.other.id])
+            self.assertEqual([document["id"] for document in store.get([self.movie.id, self.other.id])],
+                             [self.other.id])
+
+    def test_store_missing(self):
+        with tempfile.TemporaryDirectory() as index_path:
+            self.assertIsNone(DocumentStore(index_path).get([self.movie.id]))
+
+
+class MovieFragmentsTestCase(UnmanagedModelsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.movies = [Movie.objects.create(title=f"Movie {i}", release=2000 + i, duration=90, genres=["Drama"])
+                      for i in range(3)]
+        for movie in cls.movies:
+            DataSource.objects.create(movie=movie, name="IMDb", url=f"https://imdb.com/{movie.id}", score=7.5)
+
+    def serialized(self, ids):
+        return JSONRenderer().render(MovieSerializer(Movie.retrieve_sorted(ids), many=True).data)
+
+    def test_same_as_serializer(self):
+        ids = [movie.id for movie in self.movies][::-1]
+        self.assertEqual(join_fragments(MovieFragments().get_many(ids + [-1])), self.serialized(ids))
+
+    def test_cached_page_query_count(self):
+        fragments = MovieFragments()
+        ids = [movie.id for movie in self.movies]
+        fragments.get_many(ids)
+
+        # only the versions of the movies are checked
+        with self.assertNumQueries(1):
+            fragments.get_many(ids)
+        self.assertEqual(fragments.hits, len(ids))
+
+    def test_invalidated_by_crawl(self):
+        fragments = MovieFragments()
+        movie = self.movies[0]
+        fragments.get_many([movie.id])
+
+        Movie.objects.filter(id=movie.id).update(title="New title")
+        DataSource.objects.filter(movie=movie).update(last_crawled=timezone.now())
+
+        self.assertEqual(json.loads(fragments.get_many([movie.id])[0])["title"], "New title")
+
+    def test_sqlite_backing(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "fragments.sqlite3")
+            ids = [movie.id for movie in self.movies]
+            MovieFragments(path=path).get_many(ids)
+
+            # a new process finds the rendered movies in the file
+            fragments = MovieFragments(path=path)
+            self.assertEqual(join_fragments(fragments.get_many(ids)), self.serialized(ids))
+            self.assertEqual(fragments.misses, 0)
+
+    def test_sqlite_errors_fall_back(self):
+        with tempfile.TemporaryDirectory() as folder:
+            ids = [movie.id for movie in self.movies]
+            fragments = MovieFragments(path=os.path.join(folder, "fragments.sqlite3"))
+            fragments.db.close()  # every read and write of the file fails
+
+            self.assertEqual(join_fragments(fragments.get_many(ids)), self.serialized(ids))
+            self.assertEqual(join_fragments(fragments.get_many(ids)), self.serialized(ids))
+            self.assertEqual((fragments.hits, fragments.misses), (3, 3))
+
+
+class BoundedExecutorTestCase(TestCase):
+    def test_rejects_when_saturated(self):
+        executor = BoundedExecutor(max_workers=1, max_queue=1)
+        release = threading.Event()
+
+        async def run():
+            # one task runs, one waits: the third is rejected without waiting
+            tasks = [asyncio.ensure_future(executor.run(release.wait)) for _ in range(2)]
+            await asyncio.sleep(0)
+            with self.assertRaises(ExecutorSaturated):
+                await executor.run(release.wait)
+            release.set()
+            return await asyncio.gather(*tasks)
+
+        self.assertEqual(asyncio.run(run()), [True, True])
+        self.assertEqual(executor.rejected, 1)
+        self.assertEqual(executor.pending, 0)
+
+    def test_cancelled_task_pending_until_done(self):
+        executor = BoundedExecutor(max_workers=1, max_queue=0)
+        release = threading.Event()
+
+        async def run():
+            task = asyncio.ensure_future(executor.run(release.wait))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            await asyncio.sleep(0.05)
+            # the function still runs on the pool: its thread is not free for another task
+            self.assertEqual(executor.pending, 1)
+            with self.assertRaises(ExecutorSaturated):
+                await executor.run(release.wait)
+
+        asyncio.run(run())
+        release.set()
+        executor.executor.shutdown(wait=True)
+        self.assertEqual(executor.pending, 0)
+
+
+class ResultCacheTestCase(TestCase):
+    @staticmethod
+    def results(n):
+        return pd.DataFrame({"docno": [str(i) for i in range(n)], "rank": range(n)})
+
+    def test_cut_result_set_not_used_for_larger_limit(self):
+        cache = ResultCache()
+        # fewer results than the limit once the replaced documents are removed, but cut by the limit
+        cache.put("query", 10, self.results(8))
+        self.assertIsNone(cache.get("query", 20))
+        self.assertEqual(len(cache.get("query", 5)), 5)
+
+    def test_complete_result_set_used_for_any_limit(self):
+        cache = ResultCache()
+        cache.put("query", 10, self.results(8), complete=True)
+        self.assertEqual(len(cache.get("query", 100)), 8)
+
+    def test_expired_entry_replaced(self):
+        cache = ResultCache(ttl=0.05)
+        cache.put("query", 100, self.results(50))
+        time.sleep(0.1)
+        cache.put("query", 10, self.results(10))
+        self.assertEqual(len(cache.get("query", 10)), 10)
+
+
+class StubRetriever:
+    """
+    Answers every query with the docnos [length of the query, 1]: "slow" takes half a second, "fail" raises.
+    """
+
+    def perform_query(self, query, limit=1000):
+        if query == "fail":
+            raise ValueError("cannot parse the query")
+        if query == "slow":
+            time.sleep(0.5)
+        return {"docno": [str(len(query)), "1"][:limit]}
+
+    def recommend(self, query, limit=10):
+        return {"docno": ["7"]}
+
+
+class RetrievalServerTestCase(TestCase):
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.socket_path = os.path.join(folder.name, "retrieval.sock")
+
+        # the server runs in another thread, as in its own process, until its task is cancelled
+        self.server = RetrievalServer(StubRetriever(), workers=4)
+        started = threading.Event()
+
+        async def serve():
+            self.serving = (asyncio.get_running_loop(), asyncio.current_task())
+            started.set()
+            try:
+                await self.server.serve(self.socket_path)
+            except asyncio.CancelledError:
+                pass
+
+        thread = threading.Thread(target=asyncio.run, args=(serve(),), daemon=True)
+        thread.start()
+        started.wait()
+        self.addCleanup(self.stop_server, thread)
+
+        client = RetrievalClient(self.socket_path)
+        for _ in range(100):
+            try:
+                client.ping()
+                break
+            except OSError:
+                time.sleep(0.01)  # not listening yet
+        client.close()
+
+    def stop_server(self, thread):
+        loop, task = self.serving
+        loop.call_soon_threadsafe(task.cancel)
+        thread.join()
+        self.server.executor.shutdown(wait=False)
+
+    def connect(self, timeout=5):
+        client = RetrievalClient(self.socket_path, timeout=timeout)
+        self.addCleanup(client.close)
+        return client
+
+    def test_out_of_order_responses(self):
+        client = self.connect()
+        slow = client.submit("search", query="slow")
+        quick = client.submit("search", query="quick")
+
+        self.assertEqual(quick.result(5)["docnos"], [5, 1])
+        self.assertFalse(slow.done())
+        self.assertEqual(slow.result(5)["docnos"], [4, 1])
+
+    def test_error(self):
+        client = self.connect()
+        with self.assertRaisesRegex(RetrievalError, "cannot parse the query"):
+            client.search("fail")
+        # the connection is still used by the next requests
+        self.assertEqual(client.recommend("movie"), [7])
+        self.assertEqual(self.server.errors, 1)
+
+    def test_invalid_request(self):
+        client = self.connect()
+        client.ping()
+        client._connection.sock.sendall(HEADER.pack(2) + b"[]")
+        self.assertEqual(client.ping()["errors"], 1)
+
+    def test_reconnect_after_server_closed_connection(self):
+        client = self.connect()
+        self.assertEqual(client.search("movie"), [5, 1])
+
+        # the server closes the connection after a message that is not JSON
+        connection = client._connection
+        connection.sock.sendall(HEADER.pack(3) + b"{{{")
+        connection._reader.join(5)
+        self.assertTrue(connection.closed)
+
+        self.assertEqual(client.search("movie"), [5, 1])
+        self.assertIsNot(client._connection, connection)
+
+    def test_search_many(self):
+        client = self.connect()
+        self.assertEqual(client.search_many(["slow", "a", "quick"], limit=1), [[4], [1], [5]])
+
+    def test_timeout_discards_request(self):
+        client = self.connect(timeout=0.1)
+        with self.assertRaises(concurrent.futures.TimeoutError):
+            client.search("slow")
+        self.assertEqual(client._connection.pending, {})
+
+    def test_send_error_fails_only_its_request(self):
+        client = self.connect()
+        slow = client.submit("search", query="slow")
+        connection = client._connection
+
+        sendall = socket.socket.sendall
+        failed = []
+
+        def fail_once(sock, data):
+            if not failed:
+                failed.append(sock)
+                raise BrokenPipeError()
+            return sendall(sock, data)
+
+        # the request is sent again on a new connection, the one already sent gets its response on the old one
+        with mock.patch.object(socket.socket, "sendall", fail_once):
+            self.assertEqual(client.search("quick"), [5, 1])
+        self.assertIsNot(client._connection, connection)
+        self.assertEqual(slow.result(5)["docnos"], [4, 1])
+
+    def test_rejects_when_saturated(self):
+        self.server.max_queue = 0
+        client = self.connect()
+        # the four workers are busy: the fifth request is rejected without waiting
+        slow = [client.submit("search", query="slow") for _ in range(4)]
+        with self.assertRaises(RetrievalSaturated):
+            client.search("quick")
+        self.assertEqual([future.result(5)["docnos"] for future in slow], [[4, 1]] * 4)
+        self.assertEqual(client.ping()["rejected"], 1)
+        self.assertEqual(self.server.pending, 0)
+
+
+class ReadyTestCase(TestCase):
+    def setUp(self):
+        self.status = warm_up.status
+
+    def tearDown(self):
+        warm_up.status = self.status
+
+    def test_not_ready_during_warm_up(self):
+        warm_up.status = "running"
+        response = self.client.get('/api/ready/')
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.json()["ready"])
+
+    def test_ready_after_warm_up(self):
+        for status in ("ready", "disabled"):
+            warm_up.status = status
+            response = self.client.get('/api/ready/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["status"], status)
+
+
+class WarmUpTestCase(TestCase):
+    def test_replays_queries_on_retriever(self):
+        retriever = mock.Mock()
+        with mock.patch("api.services.retrieval_client", None), \
+                mock.patch("api.services.get_retriever", return_value=retriever):
+            process_warm_up = WarmUp(["matrix", "godfather"])
+            process_warm_up.run()
+
+        self.assertEqual(process_warm_up.status, "ready")
+        self.assertTrue(process_warm_up.ready)
+        # the searches skip the result cache, so the pipelines really run
+        self.assertEqual(retriever.batch_retrieve.call_args_list,
+                         [mock.call("matrix", use_cache=False), mock.call("godfather", use_cache=False)])
+        self.assertEqual(retriever.recommend.call_count, 2)
+
+    def test_replays_queries_on_retrieval_server(self):
+        client = mock.Mock()
+        with mock.patch("api.services.retrieval_client", client):
+            process_warm_up = WarmUp(["matrix", "godfather"])
+            process_warm_up.run()
+
+        self.assertEqual(process_warm_up.status, "ready")
+        client.ping.assert_called_once_with()
+        client.search_many.assert_called_once_with(["matrix", "godfather"])
+        self.assertEqual(client.recommend.call_count, 2)
+
+    def test_failure(self):
+        retriever = mock.Mock()
+        retriever.batch_retrieve.side_effect = FileNotFoundError("no index")
+        with mock.patch("api.services.retrieval_client", None), \
+                mock.patch("api.services.get_retriever", return_value=retriever):
+            process_warm_up = WarmUp(["matrix"])
+            process_warm_up.run()
+
+        self.assertEqual(process_warm_up.status, "failed")
+        self.assertFalse(process_warm_up.ready)
+        self.assertEqual(process_warm_up.report()["error"], "FileNotFoundError: no index")
+
+    def test_started_only_by_serving_processes(self):
+        with mock.patch.dict(os.environ, {"RUN_MAIN": "true"}):
+            self.assertTrue(serving_process(["manage.py", "runserver"]))
+            self.assertFalse(serving_process(["manage.py", "test"]))
+        with mock.patch.dict(os.environ):
+            os.environ.pop("RUN_MAIN", None)
+            # the autoreloader only watches the files
+            self.assertFalse(serving_process(["manage.py", "runserver"]))
+            self.assertTrue(serving_process(["manage.py", "runserver", "--noreload"]))
+        self.assertTrue(serving_process(["/usr/bin/uvicorn", "backend.asgi:application"]))
+        # started by the hook of gunicorn.conf.py in each worker, not by the master loading the application
+        self.assertFalse(serving_process(["/usr/bin/gunicorn", "--preload", "backend.wsgi"]))
+
+    def test_gunicorn_hook(self):
+        config = runpy.run_path(os.path.join(os.path.dirname(__file__), "..", "gunicorn.conf.py"))
+        with mock.patch("api.services.start_warm_up") as start:
+            config["post_worker_init"](mock.Mock())
+        start.assert_called_once_with()
 
-# Create your tests here.
+    def test_disabled(self):
+        status = warm_up.status
+        self.addCleanup(setattr, warm_up, "status", status)
+        warm_up.status = "not started"
+        with self.settings(RETRIEVAL_WARMUP=False):
+            start_warm_up()
+        self.assertEqual(warm_up.status, "disabled")
+        self.assertEqual(self.client.get('/api/ready/').status_code, 200)
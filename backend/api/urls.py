@@ -1,7 +1,17 @@
-from .views import MovieSearchViewSet, MovieViewSet
+from django.conf import settings
 from django.urls import path
 
-urlpatterns = [
-    path('search/', MovieSearchViewSet.as_view({'get': 'list'})),
-    path('recommend/', MovieViewSet.as_view({'get': 'list'})),
-]
\ No newline at end of file
+from .views import MovieSearchViewSet, MovieViewSet, AsyncMovieSearchView, AsyncMovieRecommendView, ready
+
+if settings.ASYNC_API_VIEWS:
+    urlpatterns = [
+        path('search/', AsyncMovieSearchView.as_view()),
+        path('recommend/', AsyncMovieRecommendView.as_view()),
+    ]
+else:
+    urlpatterns = [
+        path('search/', MovieSearchViewSet.as_view({'get': 'list'})),
+        path('recommend/', MovieViewSet.as_view({'get': 'list'})),
+    ]
+
+urlpatterns += [path('ready/', ready)]
@@ -6,12 +6,54 @@ from rest_framework import viewsets
 from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
 
-from django.http import HttpResponse
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse
 from django.conf import settings
+from django.views import View
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
 
+from .cursors import search_cursors
+from .pagination import SearchCursorPagination
 from .serializers import MovieSerializer, DataSourceSerializer
 
-from .services import perform_search, retrieve_recommended
+from .executor import retrieval_executor, ExecutorSaturated
+from .fragments import movie_fragments, join_fragments, render_fragment
+from .services import perform_search, retrieve_recommended, movie_records, warm_up, RetrievalSaturated
+
+
+def rendered_movies(docnos):
+    """
+    Return the JSON of the movies with the given docnos, in the same order, from the document store or from the cache
+    of the rendered movies, serializing the movies when both are disabled.
+    """
+    fragments = movie_records(docnos)
+    if fragments is None and movie_fragments is not None:
+        fragments = movie_fragments.get_many(docnos)
+    if fragments is None:
+        fragments = [render_fragment(data) for data in MovieSerializer(Movie.retrieve_sorted(docnos), many=True).data]
+    return fragments
+
+
+# The views below and their async versions (see ASYNC_API_VIEWS) share these functions: only the way they wait for the
+# queries differs.
+
+def cached_search(q, cursor):
+    """
+    :return: the (cursor, docnos) of a search whose ranking was stored for the cursor by its first page, None if the
+             cursor is missing, expired or of another query
+    """
+    docnos = search_cursors.get(cursor, q)
+    return None if docnos is None else (cursor, docnos)
+
+
+def new_search(q, docnos):
+    """
+    Store the ranking of a new search, so that its next pages are sliced from it.
+
+    :return: the (cursor, docnos) of the search
+    """
+    return search_cursors.create(q, docnos), [int(docno) for docno in docnos]
 
 
 # create a viewset for the Movie model
@@ -21,23 +63,23 @@ from .services import perform_search, retrieve_recommended
 class MovieSearchViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Movie.objects.all()
     serializer_class = MovieSerializer
+    pagination_class = SearchCursorPagination
 
-    def get_queryset(self):
-        request = self.request
+    def list(self, request, *args, **kwargs):
         # retrieve the 'q' query parameter
         q = request.query_params.get('q', None)
 
         # if the parameter is not provided, return an error
         if q is None:
-            return Response({"error": "missing query parameter 'q'"})
+            return Response({"error": "missing query parameter 'q'"}, status=400)
 
-        page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
-        page = int(request.query_params.get('page', 1))
-        next_end = (page + 1) * page_size  # always show a next page
+        # the ranking is computed only for the first page, the next pages reuse it through the cursor
+        cursor = request.query_params.get(SearchCursorPagination.cursor_query_param, None)
+        self.cursor, docnos = cached_search(q, cursor) or new_search(q, perform_search(q))
 
-        docnos = perform_search(q, next_end)
-        queryset = Movie.retrieve_sorted(docnos)
-        return queryset
+        # only the movies of the requested page are loaded, from the document store or from the database
+        page = self.paginate_queryset(docnos)
+        return self.paginator.get_paginated_fragments_response(rendered_movies(page))
 
 
 class MovieViewSet(viewsets.ReadOnlyModelViewSet):
@@ -45,14 +87,73 @@ class MovieViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = MovieSerializer
     pagination_class = None
 
-    def get_queryset(self):
-        request = self.request
+    def list(self, request, *args, **kwargs):
         q = request.query_params.get('q', None)
         if q is None:
-            return Response({"error": "missing query parameter 'q'"})
+            return Response({"error": "missing query parameter 'q'"}, status=400)
 
         docnos = retrieve_recommended(q)
+        return HttpResponse(join_fragments(rendered_movies(docnos)), content_type="application/json")
+
+
+def ready(request):
+    """
+    Readiness probe: 200 when the warm-up is done (the index is loaded), 503 until then or if it failed.
+    """
+    report = warm_up.report()
+    return JsonResponse(report, status=200 if report["ready"] else 503)
+
+
+# Async versions of the views above (see ASYNC_API_VIEWS): the queries run on `retrieval_executor` and the movies are
+# loaded from the database in Django's thread for synchronous code, so a worker serves other requests while they run.
+# When too many queries are waiting the requests are rejected with 503.
+
+def error_response(message, status):
+    return JsonResponse({"error": message}, status=status)
+
+
+def saturated_response():
+    response = error_response("too many queries in progress, retry later", 503)
+    response["Retry-After"] = "1"
+    return response
+
+
+class AsyncMovieSearchView(View):
+    async def get(self, request, *args, **kwargs):
+        q = request.GET.get('q', None)
+        if q is None:
+            return error_response("missing query parameter 'q'", 400)
+
+        # the ranking is computed only for the first page, the next pages reuse it through the cursor
+        search = cached_search(q, request.GET.get(SearchCursorPagination.cursor_query_param, None))
+        if search is None:
+            try:
+                search = new_search(q, await retrieval_executor.run(perform_search, q))
+            except (ExecutorSaturated, RetrievalSaturated):
+                return saturated_response()
+        self.cursor, docnos = search
+
+        paginator = SearchCursorPagination()
+        try:
+            page = paginator.paginate_queryset(docnos, Request(request), view=self)
+        except NotFound as e:
+            return error_response(str(e.detail), 404)
+
+        # thread-sensitive: the database connections are the ones Django closes at the end of the request
+        fragments = await sync_to_async(rendered_movies)(page)
+        return paginator.get_paginated_fragments_response(fragments)
+
+
+class AsyncMovieRecommendView(View):
+    async def get(self, request, *args, **kwargs):
+        q = request.GET.get('q', None)
+        if q is None:
+            return error_response("missing query parameter 'q'", 400)
 
-        qs = Movie.retrieve_sorted(docnos)
+        try:
+            docnos = await retrieval_executor.run(retrieve_recommended, q)
+        except (ExecutorSaturated, RetrievalSaturated):
+            return saturated_response()
 
-        return qs
+        fragments = await sync_to_async(rendered_movies)(docnos)
+        return HttpResponse(join_fragments(fragments), content_type="application/json")
@@ -85,5 +85,43 @@ STATIC_URL = "static/"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+          # rankings of the searches, see api.cursors
+          "search_cursors": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "search-cursors",
+                             "TIMEOUT": 15 * 60, "OPTIONS": {"MAX_ENTRIES": 1000}}, }
+
+SEARCH_CURSORS_CACHE = "search_cursors"
+
+# Render the results of the searches and of the recommendations from the document store written by the indexing
+# (see retrieval.retriever.DocumentStore) instead of loading the movies from the database
+SEARCH_DOCUMENT_STORE = os.getenv("SEARCH_DOCUMENT_STORE", "false").lower() == "true"
+
+# Address of the retrieval server (retrieval/server.py): the path of its UNIX socket, or host:port. If not set, each
+# process of the backend loads the index
+RETRIEVAL_SERVER = os.getenv("RETRIEVAL_SERVER") or None
+# Number of seconds to wait for a response of the retrieval server
+RETRIEVAL_SERVER_TIMEOUT = 30
+
+# Load the index and replay RETRIEVAL_WARMUP_QUERIES when the server starts (see api.services.WarmUp); /api/ready/
+# answers 503 until it is done
+RETRIEVAL_WARMUP = os.getenv("RETRIEVAL_WARMUP", "true").lower() == "true"
+RETRIEVAL_WARMUP_QUERIES = ["the godfather", "star wars", "batman", "romantic comedy", "space adventure",
+                            "christopher nolan", "horror movie in a haunted house", "leonardo dicaprio"]
+
+# Serve the API with async views (run the server with an ASGI server to get the benefits, see backend.asgi)
+ASYNC_API_VIEWS = os.getenv("ASYNC_API_VIEWS", "false").lower() == "true"
+# Number of threads running the queries of the async views, in each process
+RETRIEVAL_WORKERS = 4
+# Number of queries waiting for a thread; when exceeded, the requests are rejected with 503
+RETRIEVAL_MAX_QUEUE = 32
+
+# Number of movies whose rendered JSON is cached by each process (see api.fragments), 0 to disable the cache
+MOVIE_FRAGMENTS_MAX_SIZE = 10000
+# Optional sqlite file where the rendered movies are also stored, shared by the processes and kept across restarts
+MOVIE_FRAGMENTS_PATH = os.getenv("MOVIE_FRAGMENTS_PATH") or None
+
 REST_FRAMEWORK = {"DEFAULT_AUTHENTICATION_CLASSES": [], "DEFAULT_PERMISSION_CLASSES": [],
                   'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination', 'PAGE_SIZE': 20}
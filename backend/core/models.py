@@ -23,16 +23,23 @@ class Movie(models.Model):
     class Meta:
         managed = False  # no need to create/insert/delete anything, just to lookup
         db_table = 'movies'
-        unique_together = (('title', 'directors', 'release'),)
+        constraints = [models.UniqueConstraint(fields=['title', 'directors', 'release'], name='superkey_crosswebsite')]
 
     @staticmethod
     def retrieve_sorted(ids):
-        preserved = [models.Case(*[models.When(pk=pk, then=pos)]) for pos, pk in enumerate(ids)]
-        return Movie.objects.filter(pk__in=ids).order_by(*preserved)
+        """
+        Return the list of the movies with the given ids, in the same order as `ids`.
+
+        The data sources of the movies are prefetched, so the movies and their data sources are loaded with two queries
+        regardless of the number of movies; the order is restored in Python.
+        """
+        ids = [int(pk) for pk in ids]
+        movies = Movie.objects.prefetch_related('data_sources').in_bulk(ids)
+        return [movies[pk] for pk in ids if pk in movies]
 
 
 class DataSource(models.Model):
-    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='data_sources')
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='data_sources', db_index=False)
     movie_source_uid = models.CharField(max_length=255, blank=True, null=True)
     name = models.CharField(max_length=255)
     url = models.TextField(unique=True)
@@ -44,3 +51,18 @@ class DataSource(models.Model):
     class Meta:
         managed = False
         db_table = 'data_sources'
+        # same index as the one created by the scraper with the table, used to aggregate the data sources of a movie
+        indexes = [models.Index(fields=['movie'], name='data_sources_movie_id_idx')]
+
+
+class Review(models.Model):
+    id = models.CharField(max_length=48, primary_key=True)
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='reviews', db_index=False)
+    title = models.TextField()
+    content = models.TextField(blank=True, null=True)
+    score = models.FloatField(blank=True, null=True)
+
+    class Meta:
+        managed = False
+        db_table = 'reviews'
+        indexes = [models.Index(fields=['movie'], name='reviews_movie_id_idx')]
@@ -0,0 +1,9 @@
+# gunicorn.conf.py
+# Configuration of gunicorn, read from the current folder: run the backend from here with `gunicorn backend.wsgi`.
+
+
+def post_worker_init(worker):
+    # each worker loads the index and replays the warm-up queries once it has loaded the application, also with
+    # --preload, where the application is loaded by the master before the fork (see api.apps.serving_process)
+    from api.services import start_warm_up
+    start_warm_up()
@@ -0,0 +1,128 @@
+# benchmark.py
+# Micro-benchmarks of the indexing and retrieval functions, run with `python benchmark.py` from the `retrieval` folder.
+import argparse
+import random
+import time
+
+import loader
+
+
+def synthetic_movie_rows(num_rows, seed=0):
+    """
+    Generate rows with the same structure of the rows returned by `loader.DATA_QUERY`.
+    """
+    rng = random.Random(seed)
+    genres = ["Action", "Adventure", "Comedy", "Crime", "Drama", "Fantasy", "Horror", "Romance", "Sci-Fi", "Thriller"]
+    for i in range(num_rows):
+        num_reviews = rng.randint(0, 20)
+        yield {
+            "docno": i,
+            "title": f"Movie {i}",
+            "description": "A description of the movie. " * rng.randint(1, 5),
+            "release": rng.randint(1920, 2023),
+            "duration": rng.randint(60, 200),
+            "genres": rng.sample(genres, rng.randint(1, 3)),
+            "directors": [f"Director {rng.randint(0, 1000)}"],
+            "actors": [f"Actor {rng.randint(0, 10000)}" for _ in range(rng.randint(1, 10))],
+            "plot": "The plot of the movie. " * rng.randint(0, 20),
+            "urls": [f"https://www.imdb.com/title/tt{i:07d}/"],
+            "page_titles": [f"Movie {i} - IMDb"],
+            "reviews": [f"Review {j} - Content of the review." for j in range(num_reviews)] or [None],
+        }
+
+
+def benchmark_formatters(num_rows):
+    """
+    Compare the per-row DataFrame formatter with the streaming formatter, checking that their output is the same.
+    """
+    start_time = time.perf_counter()
+    expected = [loader.format_movie_data_dict(row) for row in synthetic_movie_rows(num_rows)]
+    pandas_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    actual = [loader.format_movie_data_row(row) for row in synthetic_movie_rows(num_rows)]
+    streaming_time = time.perf_counter() - start_time
+
+    assert actual == expected, "the formatters have different output"
+
+    print(f"format_movie_data_dict: {num_rows / pandas_time:.0f} rows/s ({pandas_time:.2f} seconds)")
+    print(f"format_movie_data_row: {num_rows / streaming_time:.0f} rows/s ({streaming_time:.2f} seconds)")
+    print(f"Speedup: {pandas_time / streaming_time:.1f}x")
+
+
+# DATA_QUERY before the reviews and the data sources were aggregated separately
+LEGACY_DATA_QUERY = """
+SELECT
+    m.id AS docno,
+    m.title, m.description, m.release, m.duration, m.genres, m.directors, m.actors, m.plot,
+    ARRAY_AGG(DISTINCT ds.url) AS urls,
+    ARRAY_AGG(DISTINCT ds.page_title) AS page_titles,
+    ARRAY_AGG(r.title || ' - ' || r.content) AS reviews
+FROM
+    movies m
+LEFT JOIN
+    data_sources ds ON ds.movie_id = m.id
+LEFT JOIN
+    reviews r ON r.movie_id = m.id
+GROUP BY
+    m.id;
+"""
+
+
+def measure_data_query(cursor, query):
+    """
+    Run `query` on the database, returning the number of rows, the total size of the rows in bytes, the number of
+    reviews in the rows and the elapsed time.
+    """
+    start_time = time.perf_counter()
+    cursor.execute(f"""
+        SELECT COUNT(*) AS num_rows, SUM(pg_column_size(q.*)) AS size,
+               SUM(COALESCE(cardinality(ARRAY_REMOVE(q.reviews, NULL)), 0)) AS num_reviews
+        FROM ({query.strip().rstrip(";")}) q
+    """)
+    result = cursor.fetchone()
+    return result["num_rows"], result["size"], result["num_reviews"], time.perf_counter() - start_time
+
+
+def benchmark_data_queries():
+    """
+    Compare `loader.DATA_QUERY` with the legacy query on the database configured in the .env file, checking that each
+    review is loaded only once.
+    """
+    import dotenv
+    dotenv.load_dotenv(override=True)
+
+    connection, cursor = loader.setup_postgres_connection()
+    try:
+        cursor.execute("SELECT COUNT(*) AS num_reviews FROM reviews WHERE title IS NOT NULL AND content IS NOT NULL")
+        num_reviews = cursor.fetchone()["num_reviews"]
+
+        legacy_rows, legacy_size, legacy_reviews, legacy_time = measure_data_query(cursor, LEGACY_DATA_QUERY)
+        rows, size, reviews, elapsed = measure_data_query(cursor, loader.DATA_QUERY)
+    finally:
+        cursor.close()
+        connection.close()
+
+    assert rows == legacy_rows, "the queries return a different number of movies"
+    assert reviews == num_reviews, "some reviews are loaded more than once"
+
+    print(f"Legacy query: {legacy_rows} movies, {legacy_reviews} reviews, {legacy_size / 2 ** 20:.1f} MiB, "
+          f"{legacy_time:.2f} seconds")
+    print(f"DATA_QUERY: {rows} movies, {reviews} reviews, {size / 2 ** 20:.1f} MiB, {elapsed:.2f} seconds")
+    print(f"Size reduction: {1 - size / legacy_size:.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the retrieval module")
+    parser.add_argument("--rows", type=int, default=100_000, help="number of synthetic movies")
+    parser.add_argument("--database", action="store_true",
+                        help="also compare the data queries on the database configured in the .env file")
+    args = parser.parse_args()
+
+    benchmark_formatters(args.rows)
+    if args.database:
+        benchmark_data_queries()
+
+
+if __name__ == "__main__":
+    main()
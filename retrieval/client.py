@@ -0,0 +1,250 @@
+# client.py
+# Client of the retrieval server (see server.py), used by the backend instead of loading the index in every process.
+#
+# Protocol: each message is a JSON object preceded by its length in bytes (4 bytes, big-endian). A request is
+# {"id": <int>, "method": "search" | "recommend" | "ping", "query": <str>, "limit": <int>}, and its response is
+# {"id": <int>, "docnos": [...]} or {"id": <int>, "error": <str>}, with "saturated": true if the server rejected the
+# request because too many were waiting. The responses carry the id of their request and can arrive in any order, so a
+# client can send several requests on the same connection without waiting (pipelining).
+import itertools
+import json
+import socket
+import struct
+import threading
+from concurrent.futures import Future, TimeoutError
+
+HEADER = struct.Struct(">I")
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+
+
+class RetrievalError(Exception):
+    """
+    Raised when the retrieval server fails to perform a request.
+    """
+
+
+class RetrievalSaturated(RetrievalError):
+    """
+    Raised when the retrieval server rejects a request because too many requests are already waiting.
+    """
+
+
+def parse_address(address):
+    """
+    Return the socket family and address of the server: `host:port` for TCP, otherwise the path of a UNIX socket.
+    """
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit() and "/" not in address:
+        return socket.AF_INET, (host, int(port))
+    return socket.AF_UNIX, address
+
+
+def encode_message(message):
+    data = json.dumps(message, separators=(",", ":")).encode()
+    return HEADER.pack(len(data)) + data
+
+
+def decode_message(data):
+    return json.loads(data)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1024 * 1024))
+        if not chunk:
+            raise ConnectionError("connection closed by the retrieval server")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_message(sock):
+    (size,) = HEADER.unpack(_recv_exactly(sock, HEADER.size))
+    if size > MAX_MESSAGE_SIZE:
+        raise ConnectionError(f"message of {size} bytes from the retrieval server")
+    return decode_message(_recv_exactly(sock, size))
+
+
+class _Connection:
+    """
+    A connection to the server, with a thread reading the responses and completing the futures of their requests.
+    """
+
+    def __init__(self, address, timeout):
+        family, address = parse_address(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(address)
+        # the reader waits for the responses without a timeout, the callers wait on their futures with it
+        self.sock.settimeout(None)
+        if family == socket.AF_INET:
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        self.pending = {}  # request id -> future
+        self.closed = False  # no new requests are sent on a closed connection
+        self._lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read_responses, name="retrieval-client", daemon=True)
+        self._reader.start()
+
+    def send(self, request_id, message, future):
+        with self._lock:
+            if self.closed:
+                raise ConnectionError("connection to the retrieval server closed")
+            self.pending[request_id] = future
+            try:
+                self.sock.sendall(message)
+            except OSError:
+                # part of the message may have been sent: no other request can follow it on this connection, but the
+                # responses of the requests already sent are still read, until the server closes the connection
+                self.pending.pop(request_id, None)
+                self.closed = True
+                try:
+                    self.sock.shutdown(socket.SHUT_WR)
+                except OSError:
+                    pass
+                raise
+
+    def discard(self, request_id):
+        """
+        Forget a request whose caller stopped waiting for the response (the response is ignored if it arrives).
+        """
+        with self._lock:
+            self.pending.pop(request_id, None)
+
+    def _read_responses(self):
+        error = None
+        try:
+            while True:
+                response = read_message(self.sock)
+                with self._lock:
+                    future = self.pending.pop(response.get("id"), None)
+                if future is None:
+                    continue
+                if response.get("saturated"):
+                    future.set_exception(RetrievalSaturated(response["error"]))
+                elif "error" in response:
+                    future.set_exception(RetrievalError(response["error"]))
+                else:
+                    future.set_result(response)
+        except (OSError, ValueError) as e:
+            error = e
+        finally:
+            self.close(error)
+
+    def close(self, error=None):
+        with self._lock:
+            self.closed = True
+            pending, self.pending = self.pending, {}
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        for future in pending.values():
+            future.set_exception(ConnectionError(f"connection to the retrieval server lost: {error}"))
+
+
+class RetrievalClient:
+    """
+    Performs the queries on the retrieval server.
+
+    The client is shared by all the threads of a process: they send their requests on the same connection, which is
+    opened on the first request and reused by all the following ones; the connection is opened again if the server
+    closes it (e.g. when it is restarted). Several requests can be sent at once with `submit`, without waiting for the
+    responses of the previous ones.
+    """
+
+    def __init__(self, address, timeout=30):
+        """
+        :param address: the path of the UNIX socket of the server, or `host:port`
+        :param timeout: the number of seconds to wait for a connection or a response
+        """
+        self.address = address
+        self.timeout = timeout
+        self._connection = None
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def _get_connection(self):
+        with self._lock:
+            if self._connection is None or self._connection.closed:
+                self._connection = _Connection(self.address, self.timeout)
+            return self._connection
+
+    def _send(self, method, params):
+        """
+        :return: the id of the request, the connection it was sent on and the future of its response
+        """
+        request_id = next(self._ids)
+        message = encode_message({"id": request_id, "method": method, **params})
+        future = Future()
+        connection = self._get_connection()
+        try:
+            connection.send(request_id, message, future)
+        except OSError:
+            # the connection no longer accepts requests (e.g. the server closed it since the last request): send this
+            # one on a new connection, the requests of the other threads keep waiting for their responses on the old one
+            connection = self._get_connection()
+            connection.send(request_id, message, future)
+        return request_id, connection, future
+
+    def _wait(self, request):
+        """
+        Wait for the response of a request sent with `_send`.
+
+        :raises TimeoutError: if there is no response after `timeout` seconds; the request is then discarded
+        """
+        request_id, connection, future = request
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            connection.discard(request_id)
+            raise
+
+    def submit(self, method, **params):
+        """
+        Send a request to the server without waiting for its response.
+
+        :return: a `Future` completed with the response
+        """
+        return self._send(method, params)[2]
+
+    def call(self, method, **params):
+        """
+        Send a request and wait for its response. The requests only read the index, so a request whose connection is
+        lost is sent again once on a new connection.
+        """
+        try:
+            return self._wait(self._send(method, params))
+        except ConnectionError:
+            return self._wait(self._send(method, params))
+
+    def search(self, query, limit=1000):
+        """
+        :return: the ranked docnos of the movies matching the query
+        """
+        return self.call("search", query=query, limit=limit)["docnos"]
+
+    def recommend(self, query, limit=10):
+        """
+        :return: the docnos of the movies recommended for the query
+        """
+        return self.call("recommend", query=query, limit=limit)["docnos"]
+
+    def search_many(self, queries, limit=1000):
+        """
+        Perform several searches, sending all the requests before waiting for the responses.
+
+        :return: the ranked docnos of each query, in the same order
+        """
+        requests = [self._send("search", {"query": query, "limit": limit}) for query in queries]
+        return [self._wait(request)["docnos"] for request in requests]
+
+    def ping(self):
+        return self.call("ping")
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
@@ -1,30 +1,47 @@
 # indexer.py
+import json
+import os
+import shutil
 from typing import Generator
 
 import pandas as pd
 import loader
 import pyterrier as pt
 
+import retriever
+
+DEFAULT_META = {"docno": 20, "genres": 100}
+
+# state of the incremental indexing, stored in the folder of the index
+STATE_FILE = "state.json"
 
 
 def create_index(index_path, df: pd.DataFrame, meta=None):
     import time
 
-    indexing_pipeline = pt.IterDictIndexer(index_path, meta=meta, overwrite=True, blocks=True)
+    # built aside and then published as the base index, see create_full_index
+    base_path = os.path.join(index_path, retriever.BASE_FOLDER)
+    os.makedirs(index_path, exist_ok=True)
+    new_base_path = retriever.new_folder_version(base_path)
+
+    indexing_pipeline = pt.IterDictIndexer(new_base_path, meta=meta, overwrite=True, blocks=True)
     fields = df.columns.tolist()
 
     start_time = time.time()
     indexing_pipeline.index(df.to_dict(orient="records"), fields=fields)
     end_time = time.time()
 
+    retriever.publish_folder(new_base_path, base_path)
+    remove_delta_index(index_path)
+    remove_legacy_base_index(index_path)
     print(f"Indexed {len(df)} documents in {end_time - start_time} seconds")
 
 
-def create_index_serverside(index_path, ss_iterator, meta=None):
+def create_index_serverside(index_path, ss_iterator, meta=None, overwrite=False):
     import time
     from datetime import datetime
 
-    indexing_pipeline = pt.IterDictIndexer(index_path, meta=meta, overwrite=False, blocks=True)
+    indexing_pipeline = pt.IterDictIndexer(index_path, meta=meta, overwrite=overwrite, blocks=True)
 
     start_time = time.time()
     print(f"Starting indexing at {datetime.now()}")
@@ -32,3 +49,189 @@ def create_index_serverside(index_path, ss_iterator, meta=None):
     end_time = time.time()
 
     print(f"Indexed documents in {end_time - start_time} seconds")
+
+
+def read_index_state(index_path):
+    try:
+        with open(os.path.join(index_path, STATE_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_index_state(index_path, state):
+    with open(os.path.join(index_path, STATE_FILE), "w") as f:
+        json.dump(state, f, indent=2)
+
+
+def number_of_documents(index_path):
+    return pt.IndexFactory.of(index_path).getCollectionStatistics().getNumberOfDocuments()
+
+
+def remove_legacy_base_index(index_path):
+    """
+    Remove the base index stored directly in `index_path` (both when it is a single index and when it is split in
+    shards) by the versions that did not publish it in its own folder.
+    """
+    for folder in retriever.shard_folders(index_path):
+        shutil.rmtree(folder)
+    if os.path.isdir(index_path):
+        for name in os.listdir(index_path):
+            if name.startswith("data."):
+                os.remove(os.path.join(index_path, name))
+
+
+def remove_delta_index(index_path):
+    """
+    Remove the delta index from `index_path`: its link first, so the backends stop loading it at once, then its
+    versions.
+    """
+    delta_path = os.path.join(index_path, retriever.DELTA_FOLDER)
+    if os.path.islink(delta_path):
+        os.remove(delta_path)
+    else:
+        shutil.rmtree(delta_path, ignore_errors=True)
+    if os.path.isdir(index_path):
+        for name in os.listdir(index_path):
+            if name.startswith(f"{retriever.DELTA_FOLDER}.") and name[len(retriever.DELTA_FOLDER) + 1:].isdigit():
+                shutil.rmtree(os.path.join(index_path, name), ignore_errors=True)
+
+
+def index_shard(shard_path, min_id, max_id, meta):
+    """
+    Index the movies with id in [min_id, max_id) in the shard stored in `shard_path`.
+
+    This function runs in a worker process, with its own JVM and database connection.
+
+    :return: the number of indexed documents and the elapsed seconds
+    """
+    import time
+
+    retriever.init()
+
+    start_time = time.time()
+    movies = loader.ServerSideMovieLoader(movie_condition=loader.ID_RANGE_CONDITION,
+                                          params={"min_id": min_id, "max_id": max_id},
+                                          cursor_name=f"movies_cursor_{os.path.basename(shard_path)}")
+    create_index_serverside(shard_path, iter(movies), meta=meta, overwrite=True)
+    return number_of_documents(shard_path), time.time() - start_time
+
+
+def create_sharded_index(index_path, meta, num_shards):
+    """
+    Index all the movies in `num_shards` shards, built in parallel by a pool of processes.
+
+    The movies are partitioned in ranges of ids with about the same number of movies; the retriever searches all the
+    shards together.
+
+    :return: the total number of indexed documents
+    """
+    import multiprocessing
+    import time
+    from concurrent.futures import ProcessPoolExecutor
+
+    id_ranges = loader.movie_id_ranges(num_shards)
+    shard_paths = [os.path.join(index_path, f"{retriever.SHARD_FOLDER_PREFIX}{i:02d}") for i in range(len(id_ranges))]
+
+    os.makedirs(index_path, exist_ok=True)
+
+    start_time = time.time()
+    # each worker starts its own JVM: the processes are spawned instead of forked from the one running the JVM
+    with ProcessPoolExecutor(max_workers=len(id_ranges), mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(index_shard, shard_path, min_id, max_id, meta)
+                   for shard_path, (min_id, max_id) in zip(shard_paths, id_ranges)]
+        results = [future.result() for future in futures]
+    elapsed = time.time() - start_time
+
+    print("Shard  Ids                   Documents  Seconds  Documents/s")
+    for shard_path, (min_id, max_id), (documents, seconds) in zip(shard_paths, id_ranges, results):
+        print(f"{os.path.basename(shard_path):<6} {f'[{min_id}, {max_id})':<21} {documents:>9} {seconds:>8.1f} "
+              f"{documents / max(seconds, 1e-9):>12.1f}")
+
+    total_documents = sum(documents for documents, _ in results)
+    print(f"Indexed {total_documents} documents in {len(id_ranges)} shards in {elapsed:.1f} seconds")
+    return total_documents
+
+
+def create_full_index(index_path, meta=None, num_shards=1):
+    """
+    Index all the movies in the base index, removing the delta index.
+
+    The time of the database when the loading starts is stored as watermark: the movies crawled after it are indexed
+    by the next incremental indexing.
+
+    :param index_path: the folder of the index
+    :param meta: the metadata of the documents
+    :param num_shards: the number of shards of the base index, built in parallel; 1 creates a single index
+    """
+    meta = meta or DEFAULT_META
+
+    watermark = loader.database_now()
+
+    # the new base index is created aside, while the backends keep serving the current one, and then replaces it at
+    # once; the delta index, older than the new base index, is ignored by the backends from then on (see
+    # retriever.index_parts) and removed
+    base_path = os.path.join(index_path, retriever.BASE_FOLDER)
+    os.makedirs(index_path, exist_ok=True)
+    new_base_path = retriever.new_folder_version(base_path)
+
+    if num_shards > 1:
+        base_documents = create_sharded_index(new_base_path, meta, num_shards)
+    else:
+        create_index_serverside(new_base_path, iter(loader.ServerSideMovieLoader()), meta=meta, overwrite=True)
+        base_documents = number_of_documents(new_base_path)
+
+    retriever.publish_folder(new_base_path, base_path)
+    remove_delta_index(index_path)
+    remove_legacy_base_index(index_path)
+
+    write_index_state(index_path, {"watermark": watermark.isoformat(),
+                                   "base_documents": base_documents,
+                                   "delta_documents": 0,
+                                   "shards": num_shards})
+
+
+def create_delta_index(index_path, meta=None, merge_ratio=0.1, num_shards=1):
+    """
+    Index the movies crawled since the base index was created in the delta index, which replaces the previous one.
+
+    The retriever serves the base and the delta index together, the documents of the delta index replacing the ones
+    of the base index with the same docno. When the delta index would contain more than `merge_ratio` times the
+    documents of the base index, the two are merged by creating the full index again instead.
+
+    :param index_path: the folder of the index
+    :param meta: the metadata of the documents
+    :param merge_ratio: the maximum size of the delta index, relative to the base index
+    :param num_shards: the number of shards of the base index, when it has to be created again
+    """
+    meta = meta or DEFAULT_META
+
+    state = read_index_state(index_path)
+    if state is None:
+        print("No base index to update, creating the full index")
+        create_full_index(index_path, meta, num_shards)
+        return
+
+    params = {"since": state["watermark"]}
+    num_changed = loader.count_movies(loader.CHANGED_SINCE_CONDITION, params)
+    print(f"{num_changed} movies changed since {state['watermark']}")
+
+    if num_changed > merge_ratio * state["base_documents"]:
+        print("The delta index is too large, merging it with the base index")
+        create_full_index(index_path, meta, num_shards)
+        return
+    if num_changed == 0:
+        return
+
+    # the new delta index is created aside and then replaces the old one at once: the backends reloading the index
+    # meanwhile see either the old or the new delta index, never the base index alone
+    delta_path = os.path.join(index_path, retriever.DELTA_FOLDER)
+    new_delta_path = retriever.new_folder_version(delta_path)
+
+    movies = loader.ServerSideMovieLoader(movie_condition=loader.CHANGED_SINCE_CONDITION, params=params,
+                                          cursor_name="delta_movies_cursor")
+    create_index_serverside(new_delta_path, iter(movies), meta=meta, overwrite=True)
+    retriever.publish_folder(new_delta_path, delta_path)
+
+    state["delta_documents"] = number_of_documents(delta_path)
+    write_index_state(index_path, state)
@@ -1,3 +1,5 @@
+import math
+
 import pandas as pd
 import psycopg2
 import psycopg2.extras
@@ -18,38 +20,146 @@ def setup_postgres_connection(cursor_name=None):
     return connection, cursor
 
 
+def format_duration(duration):
+    return f"{duration // 60} hours {duration % 60} minutes"
+
+
+def join_values(values):
+    return "  ".join(values) if values and all(values) else ""
+
+
+JOINED_FIELDS = ["reviews", "urls", "page_titles", "genres"]
+
+
 def format_movie_data_df(movie_data):
-    movie_data["duration"] = movie_data["duration"].apply(lambda x: f"{x // 60} hours {x % 60} minutes")
-    movie_data["reviews"] = movie_data["reviews"].apply(lambda x: "  ".join(x) if x and all(x) else "")
-    movie_data["urls"] = movie_data["urls"].apply(lambda x: "  ".join(x) if x and all(x) else "")
-    movie_data["page_titles"] = movie_data["page_titles"].apply(lambda x: "  ".join(x) if x and all(x) else "")
-    movie_data["genres"] = movie_data["genres"].apply(lambda x: "  ".join(x) if x and all(x) else "")
+    movie_data["duration"] = movie_data["duration"].apply(format_duration)
+    for field in JOINED_FIELDS:
+        movie_data[field] = movie_data[field].apply(join_values)
     return movie_data
 
 def format_movie_data_dict(movie_data):
     return format_movie_data_df(pd.DataFrame([movie_data])).to_dict(orient="records")[0]
 
+
+def format_movie_data_row(movie_data):
+    """
+    Format a single movie in place, without pandas; the result is the same as `format_movie_data_dict`.
+
+    :param movie_data: a row of `DATA_QUERY`, as a dict
+    :return: the same dict, formatted
+    """
+    movie_data["duration"] = format_duration(movie_data["duration"])
+    for field in JOINED_FIELDS:
+        movie_data[field] = join_values(movie_data[field])
+    return movie_data
+
 DEFAULT_FIELDS = ["docno", "title", "description", "release", "duration", "genres", "directors", "actors", "plot", "urls",
                   "page_titles", "reviews"]
 
-DATA_QUERY = """
+# The data sources and the reviews are aggregated separately before being joined with the movies: joining both tables
+# directly would repeat each review once for every data source of the movie.
+DATA_QUERY_TEMPLATE = """
 SELECT
     m.id AS docno,
     m.title, m.description, m.release, m.duration, m.genres, m.directors, m.actors, m.plot,
-    ARRAY_AGG(DISTINCT ds.url) AS urls,
-    ARRAY_AGG(DISTINCT ds.page_title) AS page_titles,
-    ARRAY_AGG(r.title || ' - ' || r.content) AS reviews
+    ds.urls, ds.page_titles, r.reviews
 FROM
     movies m
-LEFT JOIN
-    data_sources ds ON ds.movie_id = m.id
-LEFT JOIN
-    reviews r ON r.movie_id = m.id
-GROUP BY
-    m.id;
+LEFT JOIN (
+    SELECT movie_id, ARRAY_AGG(DISTINCT url) AS urls, ARRAY_AGG(DISTINCT page_title) AS page_titles
+    FROM data_sources
+    {data_sources_filter}
+    GROUP BY movie_id
+) ds ON ds.movie_id = m.id
+LEFT JOIN (
+    SELECT movie_id, ARRAY_AGG(title || ' - ' || content) AS reviews
+    FROM reviews
+    {reviews_filter}
+    GROUP BY movie_id
+) r ON r.movie_id = m.id
+{movies_filter};
 """
 
 
+def data_query(movie_condition=None):
+    """
+    Return the query loading the movies, optionally only the ones satisfying `movie_condition`.
+
+    :param movie_condition: a SQL condition on the id of the movie, where `{movie_id}` stands for the id column; it is
+                            applied to the data sources and the reviews too, before they are aggregated
+    """
+    if not movie_condition:
+        return DATA_QUERY_TEMPLATE.format(data_sources_filter="", reviews_filter="", movies_filter="")
+    return DATA_QUERY_TEMPLATE.format(data_sources_filter="WHERE " + movie_condition.format(movie_id="movie_id"),
+                                      reviews_filter="WHERE " + movie_condition.format(movie_id="movie_id"),
+                                      movies_filter="WHERE " + movie_condition.format(movie_id="m.id"))
+
+
+DATA_QUERY = data_query()
+
+# movies with a data source crawled after %(since)s, used by the incremental indexing
+CHANGED_SINCE_CONDITION = "{movie_id} IN (SELECT movie_id FROM data_sources WHERE last_crawled > %(since)s)"
+
+
+# movies with id in [%(min_id)s, %(max_id)s), used by the sharded indexing
+ID_RANGE_CONDITION = "{movie_id} >= %(min_id)s AND {movie_id} < %(max_id)s"
+
+
+def movie_id_ranges(num_ranges):
+    """
+    Split the ids of the movies in (at most) `num_ranges` ranges with about the same number of movies.
+
+    :return: the list of the ranges, as (min_id, max_id) with max_id excluded
+    """
+    fractions = [i / num_ranges for i in range(num_ranges)]
+
+    connection, cursor = setup_postgres_connection()
+    try:
+        cursor.execute("""
+            SELECT percentile_disc(%s::float8[]) WITHIN GROUP (ORDER BY id) AS bounds, MAX(id) AS max_id FROM movies
+        """, (fractions,))
+        result = cursor.fetchone()
+    finally:
+        cursor.close()
+        connection.close()
+
+    if result["max_id"] is None:
+        return []
+
+    bounds = sorted(set(result["bounds"])) + [result["max_id"] + 1]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def database_now():
+    """
+    Return the current time of the database, in the same timezone of `data_sources.last_crawled`.
+    """
+    connection, cursor = setup_postgres_connection()
+    try:
+        cursor.execute("SELECT NOW()::timestamp AS now")
+        return cursor.fetchone()["now"]
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def count_movies(movie_condition=None, params=None):
+    """
+    Return the number of movies satisfying `movie_condition` (see `data_query`).
+    """
+    query = "SELECT COUNT(*) AS count FROM movies m"
+    if movie_condition:
+        query += " WHERE " + movie_condition.format(movie_id="m.id")
+
+    connection, cursor = setup_postgres_connection()
+    try:
+        cursor.execute(query, params)
+        return cursor.fetchone()["count"]
+    finally:
+        cursor.close()
+        connection.close()
+
+
 def load_crawled_data() -> pd.DataFrame:
     from time import time
     connection, cursor = setup_postgres_connection()
@@ -71,26 +181,96 @@ def load_crawled_data() -> pd.DataFrame:
 
     return movie_data
 
+def stream_movie_data(cursor_name="movies_cursor", batch_size=3000, movie_condition=None, params=None):
+    """
+    Load the movies with a server-side cursor, `batch_size` rows at a time, yielding them one by one already formatted.
+
+    :param movie_condition: optional condition on the movies to load, see `data_query`
+    :param params: the parameters of the condition
+    """
+    connection, cursor = setup_postgres_connection(cursor_name)
+    try:
+        cursor.execute(data_query(movie_condition), params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+
+            print(f"Loaded {len(rows)} movies")
+
+            for row in rows:
+                yield format_movie_data_row(row)
+    finally:
+        cursor.close()
+        connection.close()
+
+
+# The fields of the movies (and of their data sources) returned by the API, see `backend/api/serializers.py`
+DOCUMENTS_QUERY = """
+SELECT
+    m.id, m.title, m.description, m.release, m.duration, m.genres, m.image_url,
+    ARRAY_AGG(ds.name ORDER BY ds.id) FILTER (WHERE ds.id IS NOT NULL) AS source_names,
+    ARRAY_AGG(ds.url ORDER BY ds.id) FILTER (WHERE ds.id IS NOT NULL) AS source_urls,
+    ARRAY_AGG(ds.page_title ORDER BY ds.id) FILTER (WHERE ds.id IS NOT NULL) AS source_page_titles,
+    ARRAY_AGG(ds.score ORDER BY ds.id) FILTER (WHERE ds.id IS NOT NULL) AS source_scores,
+    ARRAY_AGG(ds.critic_score ORDER BY ds.id) FILTER (WHERE ds.id IS NOT NULL) AS source_critic_scores
+FROM
+    movies m
+LEFT JOIN data_sources ds ON ds.movie_id = m.id
+GROUP BY m.id
+ORDER BY m.id;
+"""
+
+
+def not_nan(value):
+    return None if isinstance(value, float) and math.isnan(value) else value
+
+
+def document_record(row):
+    """
+    Build the document returned by the API for a movie, the same as `MovieSerializer` does.
+
+    :param row: a row of `DOCUMENTS_QUERY`, as a dict
+    """
+    data_sources = {}
+    for name, url, page_title, score, critic_score in zip(row["source_names"] or [], row["source_urls"] or [],
+                                                          row["source_page_titles"] or [], row["source_scores"] or [],
+                                                          row["source_critic_scores"] or []):
+        data_sources[name.lower()] = {"url": url, "page_title": page_title, "score": not_nan(score),
+                                      "critic_score": not_nan(critic_score)}
+
+    return {"id": row["id"], "title": row["title"], "description": row["description"], "release": row["release"],
+            "duration": None if row["duration"] == -1 else row["duration"], "genres": row["genres"],
+            "image_url": row["image_url"], "data_sources": data_sources}
+
+
+def stream_documents(cursor_name="documents_cursor", batch_size=5000):
+    """
+    Load the documents returned by the API for all the movies (see `document_record`) with a server-side cursor,
+    sorted by id.
+
+    :return: a generator of (id, document)
+    """
+    connection, cursor = setup_postgres_connection(cursor_name)
+    try:
+        cursor.execute(DOCUMENTS_QUERY)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row["id"], document_record(row)
+    finally:
+        cursor.close()
+        connection.close()
+
+
 class ServerSideMovieLoader:
+    def __init__(self, batch_size=3000, movie_condition=None, params=None, cursor_name="movies_cursor"):
+        self.batch_size = batch_size
+        self.movie_condition = movie_condition
+        self.params = params
+        self.cursor_name = cursor_name
+
     def __iter__(self):
-        self.connection, self.cursor = setup_postgres_connection("movies_cursor")
-        self.cursor.execute(DATA_QUERY)
-        self.rows: pd.DataFrame = None
-        self.row_idx = 0
-        return self
-
-    def __next__(self):
-        if self.rows is None or self.row_idx >= len(self.rows):
-            self.rows = self.cursor.fetchmany(3000)
-            if not self.rows:
-                self.cursor.close()
-                self.connection.close()
-                raise StopIteration
-            
-            print(f"Loaded {len(self.rows)} movies")
-
-            self.row_idx = 0
-
-        row = self.rows[self.row_idx]
-        self.row_idx += 1
-        return format_movie_data_dict(row)
+        return stream_movie_data(self.cursor_name, self.batch_size, self.movie_condition, self.params)
@@ -9,28 +9,47 @@ import loader
 
 
 
-def index():
+def index(incremental=False, merge_ratio=0.1, shards=1):
     dotenv.load_dotenv(override=True)  # override JAVA_HOME if set in .env
 
     pt.init()
 
-    ss_iterator = iter(loader.ServerSideMovieLoader())
     # Creating an index
-    indexer.create_index_serverside(INDEX_PATH, ss_iterator, meta={"docno": 20, "genres": 100})
+    if incremental:
+        indexer.create_delta_index(INDEX_PATH, merge_ratio=merge_ratio, num_shards=shards)
+    else:
+        indexer.create_full_index(INDEX_PATH, num_shards=shards)
+
+    # precompute the genre vectors used by the recommendations
+    retriever.GenreMatrix.build(retriever.load_index(INDEX_PATH)).save(INDEX_PATH)
+
+    # the documents returned by the API, so that it can render the results without the database
+    retriever.DocumentStore.write(INDEX_PATH, loader.stream_documents())
 
 
 def retrieve():
     # Performing a query about a movie
-    index = retriever.load_index(INDEX_PATH)
-    print(index.getCollectionStatistics())
+    movie_retriever = retriever.load_retriever(INDEX_PATH)
+    print(movie_retriever.index.getCollectionStatistics())
 
     query = "The Matrix"
-    result_set = retriever.perform_query(index, query)
+    result_set = movie_retriever.perform_query(query)
     print(result_set)
 
 
 def main():
-    index()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Create the index of the movies")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only index the movies crawled since the last full indexing, in the delta index")
+    parser.add_argument("--merge-ratio", type=float, default=0.1,
+                        help="rebuild the full index when the delta index exceeds this fraction of the base index")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="split the base index in this number of shards, indexed in parallel")
+    args = parser.parse_args()
+
+    index(incremental=args.incremental, merge_ratio=args.merge_ratio, shards=args.shards)
     retrieve()
 
 
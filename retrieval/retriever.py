@@ -1,87 +1,796 @@
 # retriever.py
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
 import pandas as pd
 import pyterrier as pt
 
 INDEX_PATH = "./index"
 
 
+BASE_FOLDER = "base"
+DELTA_FOLDER = "delta"
+SHARD_FOLDER_PREFIX = "shard_"
+
+
+def new_folder_version(path):
+    """
+    Create and return a new, empty folder where the next version of the folder `path` is written before being
+    published with `publish_folder`.
+    """
+    new_folder = f"{path}.{time.time_ns()}.tmp"
+    os.makedirs(new_folder)
+    return new_folder
+
+
+def publish_folder(new_folder, path):
+    """
+    Replace the folder `path` with `new_folder` (created by `new_folder_version`) atomically.
+
+    `path` is a symbolic link to the current version of the folder, replaced with a single rename: the readers see
+    either the old or the new version, never a missing or partial one. The readers should resolve the link once (with
+    `os.path.realpath`) and read all the files from the resolved folder, so that a concurrent update cannot mix two
+    versions: the previous version is kept for them, the older ones are removed.
+
+    The publications are serialized with the lock file `<path>.lock`, also between processes; when two versions are
+    written at the same time, the one created last is kept.
+
+    A folder written by a version that did not use the links is moved aside once, and removed at the next update.
+    """
+    import fcntl
+    import shutil
+
+    parent, name = os.path.split(path)
+    version = new_folder[:-len(".tmp")]
+    os.rename(new_folder, version)
+
+    # the publications of the processes writing the folder (e.g. main.py and a backend saving its genre matrix) are
+    # serialized, so that one cannot remove the version published by another
+    with open(f"{path}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        previous = os.path.realpath(path) if os.path.islink(path) else None
+        if os.path.isdir(path) and previous is None:
+            previous = f"{path}.0"
+            shutil.rmtree(previous, ignore_errors=True)
+            os.rename(path, previous)
+
+        versions = [_version_number(folder) for folder in (version, previous) if folder is not None]
+        if previous is not None and versions[1] is not None and versions[1] > versions[0]:
+            # a version started later was already published: this one is outdated
+            shutil.rmtree(version, ignore_errors=True)
+            return
+
+        # a link of its own, not left behind by another publisher
+        link = f"{version}.link"
+        os.symlink(os.path.basename(version), link)
+        os.replace(link, path)
+
+        # only the versions older than both the published and the previous one
+        oldest_kept = min(number for number in versions if number is not None)
+        for other in os.listdir(parent or "."):
+            number = _version_number(other) if other.startswith(f"{name}.") else None
+            if number is not None and number < oldest_kept:
+                shutil.rmtree(os.path.join(parent, other), ignore_errors=True)
+
+
+def _version_number(folder):
+    """
+    :return: the number of a version of a folder published by `publish_folder` (0 for a legacy folder), None if it is
+             not a version
+    """
+    suffix = os.path.basename(folder).rsplit(".", 1)[-1]
+    return int(suffix) if suffix.isdigit() else None
+
+
+def shard_folders(index_path):
+    """
+    Return the folders of the shards of the base index created by the sharded indexing, sorted by shard number.
+    """
+    if not os.path.isdir(index_path):
+        return []
+    names = sorted(name for name in os.listdir(index_path) if name.startswith(SHARD_FOLDER_PREFIX))
+    return [os.path.join(index_path, name) for name in names]
+
+
+def index_parts(index_path):
+    """
+    Return the folders of the Terrier indexes that make up the index stored in `index_path`: the base index (a single
+    index, or its shards), followed by the delta index created by the incremental indexing, if any.
+
+    A document indexed in a later part replaces the documents with the same docno in the earlier parts. The base and
+    the delta index are links to their current versions (see `publish_folder`), resolved here so that the index is
+    loaded from a single version even if the links are replaced meanwhile; an index created before the links were
+    used has the base index directly in `index_path`.
+    """
+    base_path = os.path.join(index_path, BASE_FOLDER)
+    base_path = os.path.realpath(base_path) if os.path.lexists(base_path) else index_path
+    folders = [base_path, *shard_folders(base_path)]
+    parts = [folder for folder in folders if os.path.exists(os.path.join(folder, "data.properties"))]
+
+    # a delta index older than the base index was made for the previous base index, and is about to be removed
+    delta_path = os.path.realpath(os.path.join(index_path, DELTA_FOLDER))
+    delta_properties = os.path.join(delta_path, "data.properties")
+    if os.path.exists(delta_properties) and (not parts or os.path.getmtime(delta_properties) >=
+                                             max(os.path.getmtime(os.path.join(p, "data.properties")) for p in parts)):
+        parts.append(delta_path)
+    return parts
+
+
+def index_version(index_path):
+    """
+    Return a value that changes every time the index stored in `index_path` is rebuilt.
+
+    Terrier writes `data.properties` at the end of the indexing, so its modification time and size (for each part of
+    the index) are enough to detect a new index without reading it.
+
+    :param index_path: the folder of the index
+    :return: a string identifying the current version of the index, None if there is no index
+    """
+    versions = []
+    for folder in index_parts(index_path):
+        stat = os.stat(os.path.join(folder, "data.properties"))
+        versions.append(f"{os.path.relpath(folder, index_path)}:{stat.st_mtime_ns}:{stat.st_size}")
+    return "|".join(versions) or None
+
+
+class ResultCache:
+    """
+    In-process LRU cache for the result sets of `Retriever.batch_retrieve`.
+
+    Entries are evicted when the cache is full (least recently used first) or when they are older than `ttl` seconds.
+    The cache watches the folder of the index: when the index is rebuilt (e.g. by running `main.py`) all the entries
+    are dropped.
+
+    The limit is not part of the key: a result set retrieved with a larger limit is also used to answer the same query
+    with a smaller limit, so paging through the results does not run the query again. A result set that was not cut by
+    its limit (it is `complete`) answers the query with any limit.
+    """
+
+    def __init__(self, max_size=1024, ttl=60 * 60, check_interval=5):
+        """
+        :param max_size: the maximum number of result sets kept in memory
+        :param ttl: the number of seconds after which an entry expires
+        :param check_interval: the minimum number of seconds between two checks of the index on disk
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.check_interval = check_interval
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._index_path = None
+        self._index_version = None
+        self._last_check = 0.0
+
+    def watch(self, index_path):
+        """
+        Set the index whose changes invalidate the cache, dropping all the entries.
+        """
+        with self._lock:
+            self._index_path = index_path
+            self._index_version = index_version(index_path)
+            self._last_check = time.monotonic()
+            self._entries.clear()
+
+    def _check_index(self):
+        # must be called holding the lock
+        now = time.monotonic()
+        if self._index_path is None or now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+
+        version = index_version(self._index_path)
+        if version != self._index_version:
+            self._index_version = version
+            self._entries.clear()
+
+    def get(self, key, limit):
+        """
+        Return the cached result set for `key`, cut to `limit` results, or None if it is not cached.
+        """
+        with self._lock:
+            self._check_index()
+
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, entry_limit, complete, result_set = entry
+                if time.monotonic() - created > self.ttl:
+                    del self._entries[key]
+                elif entry_limit >= limit or complete:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return result_set.head(limit).copy()
+
+            self.misses += 1
+            return None
+
+    def put(self, key, limit, result_set, complete=False):
+        """
+        :param limit: the limit the result set was retrieved with
+        :param complete: True if the result set contains all the results of the query, i.e. it was not cut by the limit
+                         (its length alone does not tell, since the replaced documents are removed before the cut)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl and (entry[2] or entry[1] > limit):
+                return  # keep the result set with more results, unless it expired
+
+            self._entries[key] = (time.monotonic(), limit, complete, result_set.copy())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+def read_meta(index, key, chunk_size=10000):
+    """
+    Read the metadata `key` of all the documents of the index, in docid order.
+
+    The values are read in chunks with a single call to the meta index for each chunk, instead of one call per document.
+    """
+    meta_index = index.getMetaIndex()
+    num_documents = index.getCollectionStatistics().getNumberOfDocuments()
+
+    values = []
+    for start in range(0, num_documents, chunk_size):
+        docids = list(range(start, min(start + chunk_size, num_documents)))
+        values.extend(meta_index.getItems(key, docids))
+    return values
+
+
+class DocnoTable:
+    """
+    Mapping between the docids of the index and the docnos of the documents, backed by numpy arrays.
+
+    The docnos are read from the meta index once, when the table is created, so that converting docids to docnos (and
+    vice versa) does not need any call to the meta index.
+    """
+
+    def __init__(self, docnos):
+        """
+        :param docnos: the array of the docnos, indexed by docid
+        """
+        self.docnos = docnos
+
+        # when the index is made of several parts, a docno can appear more than once: only its last occurrence is live
+        _, last_reversed = np.unique(docnos[::-1], return_index=True)
+        self.live = np.zeros(len(docnos), dtype=bool)
+        self.live[len(docnos) - 1 - last_reversed] = True
+        self.all_live = bool(self.live.all())
+
+        live_docids = np.flatnonzero(self.live)
+        self._order = live_docids[np.argsort(docnos[live_docids], kind="stable")]  # live docids sorted by docno
+        self._sorted_docnos = docnos[self._order]
+
+    @staticmethod
+    def build(index):
+        return DocnoTable(np.array(read_meta(index, "docno")))
+
+    def __len__(self):
+        return len(self.docnos)
+
+    def docno(self, docids):
+        """
+        Return the list of the docnos of the documents with the given docids.
+        """
+        return self.docnos[np.asarray(docids, dtype=np.int64)].tolist()
+
+    def docid(self, docnos):
+        """
+        Return the array of the (live) docids of the documents with the given docnos, -1 for docnos not in the index.
+        """
+        docnos = np.asarray(docnos).astype(str)
+        if len(self._order) == 0:
+            return np.full(len(docnos), -1, dtype=np.int64)
+
+        positions = np.minimum(np.searchsorted(self._sorted_docnos, docnos), len(self._order) - 1)
+        return np.where(self._sorted_docnos[positions] == docnos, self._order[positions], -1)
+
+
+class GenreMatrix:
+    """
+    TF-IDF vectors of the genres of all the documents, used for the recommendations.
+
+    Row `i` of the (L2 normalized, sparse) matrix is the vector of the document with docid `i`, and `genres[i]` are its
+    genres; documents without genres have an empty row, so that rows and docids are always aligned.
+
+    The matrix is stored in the `genres` folder of the index and memory-mapped when loaded; it is rebuilt when the
+    index changes.
+    """
+
+    FOLDER = "genres"
+
+    def __init__(self, vectorizer, matrix, genres):
+        self.vectorizer = vectorizer
+        self.matrix = matrix
+        self.genres = genres
+
+    @staticmethod
+    def build(index):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        from scipy.sparse import csr_matrix
+
+        genres = read_meta(index, "genres")
+
+        vectorizer = TfidfVectorizer(sublinear_tf=True, analyzer="word", dtype=np.float32)
+        try:
+            vectorizer.fit([g for g in genres if g])
+        except ValueError:
+            # no document has genres (empty vocabulary): nothing can be recommended
+            return GenreMatrix(None, csr_matrix((len(genres), 0), dtype=np.float32), np.array(genres))
+        matrix = vectorizer.transform(genres).tocsr()
+        return GenreMatrix(vectorizer, matrix, np.array(genres))
+
+    def save(self, index_path):
+        """
+        Write the matrix in a new folder, which then replaces the one of the index at once (see `publish_folder`): the
+        backends may be reading the current one, and the indexing and a backend may save the matrix at the same time.
+        """
+        import json
+        import pickle
+
+        path = os.path.join(index_path, self.FOLDER)
+        folder = new_folder_version(path)
+
+        np.save(os.path.join(folder, "data.npy"), self.matrix.data)
+        np.save(os.path.join(folder, "indices.npy"), self.matrix.indices)
+        np.save(os.path.join(folder, "indptr.npy"), self.matrix.indptr)
+        np.save(os.path.join(folder, "genres.npy"), self.genres)
+        with open(os.path.join(folder, "vectorizer.pkl"), "wb") as f:
+            pickle.dump(self.vectorizer, f)
+
+        # written last: a folder without it is incomplete
+        with open(os.path.join(folder, "version.json"), "w") as f:
+            json.dump({"index_version": index_version(index_path), "shape": self.matrix.shape}, f)
+        publish_folder(folder, path)
+
+    @staticmethod
+    def load(index_path):
+        """
+        Load the matrix stored in the index, None if it is missing or it was built for another version of the index.
+        """
+        import json
+        import pickle
+        from scipy.sparse import csr_matrix
+
+        # all the files are read from the same version of the folder
+        folder = os.path.realpath(os.path.join(index_path, GenreMatrix.FOLDER))
+        try:
+            with open(os.path.join(folder, "version.json")) as f:
+                info = json.load(f)
+
+            version = index_version(index_path)
+            if info["index_version"] is None or info["index_version"] != version:
+                return None
+
+            data = np.load(os.path.join(folder, "data.npy"), mmap_mode="r")
+            indices = np.load(os.path.join(folder, "indices.npy"), mmap_mode="r")
+            indptr = np.load(os.path.join(folder, "indptr.npy"), mmap_mode="r")
+            genres = np.load(os.path.join(folder, "genres.npy"), mmap_mode="r")
+            with open(os.path.join(folder, "vectorizer.pkl"), "rb") as f:
+                vectorizer = pickle.load(f)
+        except FileNotFoundError:
+            # missing, or removed by a later update while it was read
+            return None
+
+        matrix = csr_matrix((data, indices, indptr), shape=tuple(info["shape"]), copy=False)
+        return GenreMatrix(vectorizer, matrix, genres)
+
+    @staticmethod
+    def load_or_build(index, index_path):
+        genre_matrix = GenreMatrix.load(index_path)
+        if genre_matrix is None:
+            genre_matrix = GenreMatrix.build(index)
+            genre_matrix.save(index_path)
+        return genre_matrix
+
+    def most_similar(self, docids, limit=10, live=None):
+        """
+        Return the docids of the `limit` documents whose genres are the most similar to the genres of the documents
+        `docids` (taken together), the most similar first.
+
+        :param docids: the docids of the documents
+        :param limit: the number of documents to return
+        :param live: optional boolean mask of the docids that can be returned
+        """
+        if self.vectorizer is None:
+            return []
+        genres = "  ".join(self.genres[np.asarray(docids, dtype=np.int64)].tolist())
+
+        # the vectors are L2 normalized: the dot product is the cosine similarity
+        query_vector = self.vectorizer.transform([genres])
+        similarities = (self.matrix @ query_vector.T).toarray().ravel()
+        if live is not None:
+            similarities[~live] = -np.inf
+            limit = min(limit, int(live.sum()))
+
+        limit = min(limit, len(similarities))
+        if limit == 0:
+            return []
+
+        top = np.argpartition(-similarities, limit - 1)[:limit]
+        return top[np.argsort(-similarities[top], kind="stable")]
+
+
+class DocumentStore:
+    """
+    The documents returned by the API (the fields of `MovieSerializer`), stored in the `docstore` folder of the index, so
+    that the results of the queries can be rendered without the database.
+
+    The documents are serialized as JSON and packed in `records.bin`; `docnos.npy` (sorted) and `offsets.npy` locate
+    the record of each docno. The files are memory-mapped, so they are shared by all the processes reading them.
+
+    The store is written by the indexing after each index is built; it is reloaded when the index changes, and not used
+    (`get` returns None) if it was built for another version of the index.
+    """
+
+    FOLDER = "docstore"
+
+    def __init__(self, index_path, check_interval=5):
+        """
+        :param index_path: the folder of the index
+        :param check_interval: the minimum number of seconds between two checks of the index on disk
+        """
+        self.index_path = index_path
+        self.check_interval = check_interval
+        self.version = None
+        # (docnos, offsets, records) of the loaded store, replaced at once when the store is reloaded
+        self.files = None
+        self._lock = threading.Lock()
+        self._last_check = None
+
+    @staticmethod
+    def write(index_path, documents):
+        """
+        Write the store of the index.
+
+        :param index_path: the folder of the index
+        :param documents: an iterable of (docno, document), sorted by docno
+        """
+        import json
+
+        folder = os.path.join(index_path, DocumentStore.FOLDER)
+        new_folder = new_folder_version(folder)
+
+        docnos, offsets = [], [0]
+        with open(os.path.join(new_folder, "records.bin"), "wb") as f:
+            for docno, document in documents:
+                # the same encoding as the JSON renderer of the API, so the records can be concatenated in a response
+                record = json.dumps(document, ensure_ascii=False, separators=(",", ":"))
+                record = record.replace("\u2028", "\\u2028").replace("\u2029", "\\u2029").encode("utf-8")
+                f.write(record)
+                docnos.append(int(docno))
+                offsets.append(offsets[-1] + len(record))
+
+        np.save(os.path.join(new_folder, "docnos.npy"), np.array(docnos, dtype=np.int64))
+        np.save(os.path.join(new_folder, "offsets.npy"), np.array(offsets, dtype=np.int64))
+        with open(os.path.join(new_folder, "version.json"), "w") as f:
+            json.dump({"index_version": index_version(index_path), "documents": len(docnos)}, f)
+
+        # the readers keep the files of the previous version mapped until they reload the store
+        publish_folder(new_folder, folder)
+        print(f"Document store written: {len(docnos)} documents")
+
+    def _load(self, version):
+        """
+        :return: the (docnos, offsets, records) of the store, or None if it was not written for this version of the
+                 index
+        """
+        import json
+
+        # all the files are read from the same version of the store, even if it is published again meanwhile
+        folder = os.path.realpath(os.path.join(self.index_path, self.FOLDER))
+        try:
+            with open(os.path.join(folder, "version.json")) as f:
+                info = json.load(f)
+            if info["index_version"] is None or info["index_version"] != version:
+                return None
+
+            docnos = np.load(os.path.join(folder, "docnos.npy"), mmap_mode="r")
+            offsets = np.load(os.path.join(folder, "offsets.npy"), mmap_mode="r")
+            # an empty file cannot be memory-mapped
+            records_path = os.path.join(folder, "records.bin")
+            records = np.memmap(records_path, dtype=np.uint8, mode="r") if os.path.getsize(records_path) else b""
+        except (OSError, ValueError, EOFError):
+            # missing, or removed by two updates of the store while it was read: loaded again at the next check
+            return None
+        return docnos, offsets, records
+
+    def _reload_if_changed(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._last_check is not None and now - self._last_check < self.check_interval:
+                return
+            self._last_check = now
+            version = index_version(self.index_path)
+            if self.files is None or self.version != version:
+                self.version = version
+                self.files = self._load(version)
+
+    def available(self):
+        self._reload_if_changed()
+        return self.files is not None
+
+    def get_records(self, docnos):
+        """
+        Return the serialized documents with the given docnos, in the same order; the docnos not in the store are
+        skipped. None if the store is not available.
+        """
+        self._reload_if_changed()
+        files = self.files  # read once: a reload replaces it with the files of the new version
+        if files is None:
+            return None
+
+        stored_docnos, offsets, records = files
+
+        if len(stored_docnos) == 0:
+            return []
+
+        docnos = np.asarray([int(docno) for docno in docnos], dtype=np.int64)
+        positions = np.minimum(np.searchsorted(stored_docnos, docnos), len(stored_docnos) - 1)
+        found = stored_docnos[positions] == docnos
+        return [bytes(records[offsets[position]:offsets[position + 1]]) for position in positions[found]]
+
+    def get(self, docnos):
+        """
+        Return the documents with the given docnos, in the same order; the docnos not in the store are skipped. None if
+        the store is not available.
+        """
+        import json
+
+        records = self.get_records(docnos)
+        if records is None:
+            return None
+        return [json.loads(record) for record in records]
+
+
+DEFAULT_FIELD_WEIGHTS = {"docno": (0, 0), "title": (25, 2.5), "description": (2, 1), "release": (5, 0.25),
+                         "duration": (1, 0.5), "genres": (2, 0.5), "directors": (4, 0.5), "actors": (1, 0.5),
+                         "plot": (0.1, 20), "urls": (1, 0.5), "page_titles": (0.5, 0.5), "reviews": (0.005, 100)}
+
+DEFAULT_METADATA = ("docno", "genres")
+
+
 def init():
     if not pt.started():
         pt.init()
 
 
+def default_index_path():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "index")
+
+
+def merge_indexes(indexes):
+    """
+    Combine the indexes in a single Terrier `MultiIndex`, where the docids of each index follow the ones of the
+    previous index.
+    """
+    multi_index = pt.autoclass("org.terrier.realtime.multi.MultiIndex")
+    statistics = indexes[0].getCollectionStatistics()
+    return multi_index(indexes, statistics.hasPositions(), statistics.getNumberOfFields() > 0)
+
+
 def load_index(index_path=None):
     if not index_path:
-        import os
-        index_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "index")
+        index_path = default_index_path()
     init()
-    return pt.IndexFactory.of(index_path)
+
+    parts = index_parts(index_path)
+    if not parts:
+        raise FileNotFoundError(f"There is no index in {index_path}: create it with main.py")
+    if len(parts) == 1:
+        return pt.IndexFactory.of(parts[0])
+    return merge_indexes([pt.IndexFactory.of(part) for part in parts])
 
 
-def batch_retrieve(index, query, field_weights=None, limit=1000, query_expansion=True, metadata=["docno", "genres"]):
-    import hashlib
+def load_retriever(index_path=None):
+    if not index_path:
+        index_path = default_index_path()
+    return Retriever(load_index(index_path), index_path)
 
+
+def normalize_query(query):
+    """
+    Replace the non-alphanumeric characters with spaces, lowercase the query and collapse the whitespaces.
+    Terrier tokenizes and lowercases the query in the same way, so the normalized query has the same results.
+    """
     query = "".join([x if x.isalnum() else " " for x in query])
+    return " ".join(query.lower().split())
 
-    field_names = index.getCollectionStatistics().fieldNames
-    if field_weights is None:
-        field_weights = {"docno": (0, 0), "title": (25, 2.5), "description": (2, 1), "release": (5, 0.25),
-                         "duration": (1, 0.5), "genres": (2, 0.5), "directors": (4, 0.5), "actors": (1, 0.5),
-                         "plot": (0.1, 20), "urls": (1, 0.5), "page_titles": (0.5, 0.5), "reviews": (0.005, 100)}
-    assert len(field_names) == len(field_weights)
 
-    # BM25F
-    controls = {"qe": "on", "qemodel": "Bo1"} if query_expansion else {}
-    for i, field_name in enumerate(field_names):
-        controls[f"w.{i}"] = field_weights[field_name][0]
-        controls[f"c.{i}"] = field_weights[field_name][1]
+class IndexState:
+    """
+    The index used by a `Retriever`, together with all the structures built from it.
+    """
 
-    br = pt.BatchRetrieve(index, wmodel="BM25F", controls=controls, metadata=metadata)
-    pipe = pt.rewrite.SDM() >> br
-    retrieve_pipeline = ~pipe % limit
+    def __init__(self, index, index_path=None):
+        self.index = index
+        self.version = index_version(index_path) if index_path else None
+        self.field_names = list(index.getCollectionStatistics().fieldNames)
 
-    # using the hashed query as the pipe we can cache the results based on the query
-    # instead of the qid
-    md5_query = hashlib.md5(query.encode()).hexdigest()
+        self.docno_table = DocnoTable.build(index)
+        if index_path:
+            self.genre_matrix = GenreMatrix.load_or_build(index, index_path)
+        else:
+            self.genre_matrix = GenreMatrix.build(index)
 
-    query_df = pt.new.queries([query], qid=[md5_query])
-    result_set = retrieve_pipeline.transform(query_df)
-    return result_set
+        # metadata served from the arrays instead of the meta index
+        self.local_metadata = {"docno": self.docno_table.docnos, "genres": self.genre_matrix.genres}
 
+        self.pipelines = {}
 
-def perform_query(index, query, limit=1000):
-    return batch_retrieve(index, query, limit=limit)
 
+class Retriever:
+    """
+    Performs queries on an index.
 
-def recommend(index, query):
-    from sklearn.feature_extraction.text import TfidfVectorizer
-    from sklearn.metrics.pairwise import cosine_similarity
+    The retrieval pipeline (SDM >> BM25F, optionally followed by Bo1 query expansion) is built only once for each
+    configuration of field weights, query expansion and metadata, and then reused by all the queries; the limit is
+    applied to the result set of each query.
 
-    num_query_results = 5
+    When the index on disk changes (e.g. the incremental indexing updates the delta index) the index is loaded again.
+    """
 
-    query_results = batch_retrieve(index, query, limit=num_query_results, metadata=["docno", "genres"])
-    query_genres = "  ".join(query_results["genres"].tolist())
+    def __init__(self, index, index_path=None, cache=None, check_interval=5):
+        """
+        :param index: the Terrier index
+        :param index_path: the folder of the index; if set, the index is reloaded (and the result cache invalidated)
+                           when the index on disk changes
+        :param cache: the `ResultCache` for the result sets, a new one is created if not set
+        :param check_interval: the minimum number of seconds between two checks of the index on disk
+        """
+        self.index_path = index_path
+        self.cache = cache if cache is not None else ResultCache()
+        if index_path:
+            self.cache.watch(index_path)
+        self.check_interval = check_interval
 
-    num_documents = index.getCollectionStatistics().getNumberOfDocuments()
-    genre_strings_all_documents = []
-    for docid in range(num_documents):
-        genres = index.getMetaIndex().getItem("genres", docid)
-        if genres:
-            genre_strings_all_documents.append(genres)
-
-    vectorizer = TfidfVectorizer(sublinear_tf=True, analyzer="word")
-    all_vectors = vectorizer.fit_transform(genre_strings_all_documents).toarray()
-    query_vectors = vectorizer.transform([query_genres]).toarray()
-
-    similarities = cosine_similarity(query_vectors, all_vectors)
-    similarities = similarities[0]
-
-    zipped = zip(range(num_documents), similarities)
-    sorted_zipped = sorted(zipped, key=lambda x: x[1], reverse=True)
-    sorted_zipped = sorted_zipped[:10]
-
-    docnos = [index.getMetaIndex().getItem("docno", docid) for docid, _ in sorted_zipped]
-    
-    # transform array to dataframe
-    df = pd.DataFrame(docnos, columns=['docno'])
-    return df
+        self.state = IndexState(index, index_path)
+
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._last_check = time.monotonic()
+
+    @property
+    def index(self):
+        return self.state.index
+
+    def reload_if_changed(self):
+        """
+        Load the index again if it changed on disk since it was loaded.
+        """
+        now = time.monotonic()
+        if not self.index_path or now - self._last_check < self.check_interval:
+            return
+        # a single thread checks and loads the index, the others keep using the current one in the meantime
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            if now - self._last_check < self.check_interval:
+                return
+            self._last_check = now
+
+            if index_version(self.index_path) != self.state.version:
+                # the new state is built without holding the lock, which the queries need to build their pipelines
+                state = IndexState(load_index(self.index_path), self.index_path)
+                with self._lock:
+                    # the new state replaces the old one at once, queries in progress keep using the old one
+                    self.state = state
+                    self.cache.clear()
+        finally:
+            self._reload_lock.release()
+
+    @staticmethod
+    def _build_pipeline(state, field_weights, query_expansion, metadata):
+        assert len(state.field_names) == len(field_weights)
+
+        # BM25F
+        controls = {"qe": "on", "qemodel": "Bo1"} if query_expansion else {}
+        for i, field_name in enumerate(state.field_names):
+            controls[f"w.{i}"] = field_weights[field_name][0]
+            controls[f"c.{i}"] = field_weights[field_name][1]
+
+        metadata = [key for key in metadata if key not in state.local_metadata]
+        br = pt.BatchRetrieve(state.index, wmodel="BM25F", controls=controls, metadata=metadata)
+        return pt.rewrite.SDM() >> br
+
+    def pipeline(self, field_weights=None, query_expansion=True, metadata=DEFAULT_METADATA, state=None):
+        """
+        Return the retrieval pipeline for the given configuration, building it the first time it is requested.
+        """
+        if state is None:
+            state = self.state
+        if field_weights is None:
+            field_weights = DEFAULT_FIELD_WEIGHTS
+
+        key = (tuple(sorted(field_weights.items())), query_expansion, tuple(metadata))
+        pipeline = state.pipelines.get(key)
+        if pipeline is None:
+            with self._lock:
+                pipeline = state.pipelines.get(key)
+                if pipeline is None:
+                    pipeline = self._build_pipeline(state, field_weights, query_expansion, metadata)
+                    state.pipelines[key] = pipeline
+        return pipeline
+
+    def batch_retrieve(self, query, field_weights=None, limit=1000, query_expansion=True, metadata=DEFAULT_METADATA,
+                       use_cache=True, state=None):
+        """
+        :param state: the `IndexState` to search, the current one if not set; the docids of the results refer to it
+        """
+        import hashlib
+
+        query = normalize_query(query)
+
+        if state is None:
+            self.reload_if_changed()
+            state = self.state
+        # the result sets of different versions of the index have different docids: a query still running on the old
+        # version after a reload must not be answered from, or stored in, the entries of the new one
+        cache_key = (state.version, query, tuple(sorted(field_weights.items())) if field_weights else None,
+                     query_expansion, tuple(metadata))
+
+        if use_cache:
+            result_set = self.cache.get(cache_key, limit)
+            if result_set is not None:
+                return result_set
+
+        retrieve_pipeline = self.pipeline(field_weights, query_expansion, metadata, state)
+
+        # the md5 of the query is used as qid, so that the same query always has the same qid
+        md5_query = hashlib.md5(query.encode()).hexdigest()
+
+        query_df = pt.new.queries([query], qid=[md5_query])
+        result_set = retrieve_pipeline.transform(query_df)
+
+        if not state.docno_table.all_live:
+            # drop the documents replaced by a later part of the index
+            result_set = result_set[state.docno_table.live[result_set["docid"].to_numpy(dtype=np.int64)]]
+            result_set = result_set.assign(rank=np.arange(len(result_set)))
+
+        complete = len(result_set) <= limit
+        result_set = result_set[result_set["rank"] < limit].copy()
+
+        docids = result_set["docid"].to_numpy(dtype=np.int64)
+        for key in metadata:
+            if key in state.local_metadata:
+                result_set[key] = state.local_metadata[key][docids].tolist()
+
+        # not stored if the index was reloaded while the query was running
+        if use_cache and state is self.state:
+            self.cache.put(cache_key, limit, result_set, complete)
+        return result_set
+
+    def perform_query(self, query, limit=1000):
+        return self.batch_retrieve(query, limit=limit)
+
+    def recommend(self, query, limit=10):
+        num_query_results = 5
+
+        self.reload_if_changed()
+        state = self.state
+
+        # the docids of the results index the structures of the same state
+        query_results = self.batch_retrieve(query, limit=num_query_results, metadata=["docno"], state=state)
+        live = None if state.docno_table.all_live else state.docno_table.live
+        docids = state.genre_matrix.most_similar(query_results["docid"].to_numpy(), limit, live)
+        docnos = state.docno_table.docno(docids)
+
+        # transform array to dataframe
+        df = pd.DataFrame(docnos, columns=['docno'])
+        return df
@@ -0,0 +1,150 @@
+# server.py
+# Retrieval server: loads the index once and performs the queries of all the processes of the backend, which connect to
+# it with `client.RetrievalClient` (see client.py for the protocol).
+#
+# Run it from the `retrieval` folder:
+#   python server.py --socket /tmp/retrieval.sock
+# or, to listen on TCP:
+#   python server.py --port 8765
+import argparse
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from client import HEADER, MAX_MESSAGE_SIZE, encode_message, decode_message
+from retriever import load_retriever
+
+
+class RetrievalServer:
+    """
+    Serves the queries of the clients on a pool of threads sharing the same `Retriever`.
+
+    The requests of a connection are read as soon as they arrive and performed concurrently, and each response is
+    written when its query completes, so the clients can pipeline their requests. When `max_queue` requests are already
+    waiting for a thread, the new ones are answered immediately with an error marked as "saturated".
+    """
+
+    def __init__(self, retriever, workers=4, max_queue=64):
+        self.retriever = retriever
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="retrieval")
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self.pending = 0  # requests performed or waiting for a thread
+        self._lock = threading.Lock()
+
+    def perform(self, request):
+        method = request.get("method")
+        if method == "search":
+            result_set = self.retriever.perform_query(request["query"], limit=request.get("limit", 1000))
+        elif method == "recommend":
+            result_set = self.retriever.recommend(request["query"], limit=request.get("limit", 10))
+        elif method == "ping":
+            return {"requests": self.requests, "errors": self.errors, "rejected": self.rejected}
+        else:
+            raise ValueError(f"unknown method {method!r}")
+        return {"docnos": [int(docno) for docno in result_set["docno"]]}
+
+    async def respond(self, request, writer, write_lock):
+        self.requests += 1
+        if not isinstance(request, dict):
+            self.errors += 1
+            request, response = {}, {"error": "ValueError: the request is not a JSON object"}
+        elif not self._acquire():
+            self.rejected += 1
+            response = {"error": "too many requests waiting, retry later", "saturated": True}
+        else:
+            try:
+                future = self.executor.submit(self.perform, request)
+            except BaseException:
+                self._release(None)
+                raise
+            # the request stays pending until it ends on the pool, even if its task is cancelled
+            future.add_done_callback(self._release)
+            try:
+                response = await asyncio.wrap_future(future)
+            except Exception as e:
+                self.errors += 1
+                response = {"error": f"{type(e).__name__}: {e}"}
+
+        try:
+            async with write_lock:
+                writer.write(encode_message({"id": request.get("id"), **response}))
+                await writer.drain()
+        except ConnectionError:
+            pass  # the client is gone
+
+    def _acquire(self):
+        with self._lock:
+            if self.pending >= self.workers + self.max_queue:
+                return False
+            self.pending += 1
+            return True
+
+    def _release(self, future):
+        with self._lock:
+            self.pending -= 1
+
+    async def handle_connection(self, reader, writer):
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                (size,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+                if size > MAX_MESSAGE_SIZE:
+                    break
+                request = decode_message(await reader.readexactly(size))
+                task = asyncio.create_task(self.respond(request, writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            pass  # the server is stopped: the connection is closed below
+        finally:
+            if tasks:
+                await asyncio.wait(tasks)
+            writer.close()
+
+    async def serve(self, socket_path=None, host="127.0.0.1", port=None):
+        if port is not None:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+            print(f"Retrieval server listening on {host}:{port}")
+        else:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            server = await asyncio.start_unix_server(self.handle_connection, socket_path)
+            print(f"Retrieval server listening on {socket_path}")
+
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the queries of the backend on a shared index.")
+    parser.add_argument("--socket", default="/tmp/retrieval.sock", help="path of the UNIX socket")
+    parser.add_argument("--host", default="127.0.0.1", help="host to listen on with --port")
+    parser.add_argument("--port", type=int, default=None, help="listen on TCP on this port instead of the socket")
+    parser.add_argument("--index", default=None, help="folder of the index")
+    parser.add_argument("--workers", type=int, default=4, help="number of queries performed at the same time")
+    parser.add_argument("--max-queue", type=int, default=64,
+                        help="number of queries waiting for a worker after which the new ones are rejected")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    retriever = load_retriever(args.index)
+    print(f"Index loaded in {time.time() - start_time:.2f} seconds")
+
+    server = RetrievalServer(retriever, workers=args.workers, max_queue=args.max_queue)
+    try:
+        asyncio.run(server.serve(args.socket, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import time
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from ..fixtures import load_fixtures, fixture_response, replay, save_golden, check_golden
+
+
+class Command(ScrapyCommand):
+    """
+    Replay the recorded responses (see FixtureRecorderMiddleware) through the callbacks of the spiders, without
+    network access, and report how many pages per second each spider parses.
+
+    With --synthetic, the pages generated by `synthetic.py` are written to the fixtures directory (by default
+    SYNTHETIC_FIXTURES_DIR) and parsed instead of the recorded ones.
+
+    Usage: scrapy parsebench [spider ...] [--fixtures DIR] [--synthetic] [--repeat N] [--save-golden | --check-golden]
+    """
+
+    requires_project = True
+    default_settings = {"LOG_LEVEL": "WARNING"}
+
+    def syntax(self):
+        return "[options] [spider ...]"
+
+    def short_desc(self):
+        return "Benchmark the parsing of the recorded pages of the spiders"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--fixtures", default=None, help="directory of the recorded pages (default: FIXTURES_DIR)")
+        parser.add_argument("--synthetic", action="store_true",
+                            help="generate the synthetic pages (see synthetic.py) and parse them")
+        parser.add_argument("--repeat", type=int, default=3, help="number of times each page is parsed")
+        parser.add_argument("--save-golden", action="store_true", help="save the items as the expected ones")
+        parser.add_argument("--check-golden", action="store_true", help="compare the items with the expected ones")
+
+    def run(self, args, opts):
+        if opts.save_golden and opts.check_golden:
+            raise UsageError("--save-golden and --check-golden cannot be used together")
+
+        if opts.synthetic:
+            from ..synthetic import write_synthetic_fixtures
+            fixtures_dir = opts.fixtures or self.settings.get("SYNTHETIC_FIXTURES_DIR")
+            write_synthetic_fixtures(fixtures_dir)
+        else:
+            fixtures_dir = opts.fixtures or self.settings.get("FIXTURES_DIR")
+        spider_loader = self.crawler_process.spider_loader
+        spider_names = args or spider_loader.list()
+
+        print(f"{'spider':<16}{'callback':<16}{'pages':>8}{'items':>8}{'pages/s':>12}")
+        for spider_name in spider_names:
+            spider = spider_loader.load(spider_name)()
+            spider.settings = self.settings  # e.g. -s STRUCTURED_DATA_EXTRACTION=true
+            fixtures = list(load_fixtures(fixtures_dir, spider_name))
+            if not fixtures:
+                print(f"{spider_name:<16}no recorded pages")
+                continue
+
+            # the responses are built once: only the parsing is measured, including the parsing of the document, which
+            # a response caches (each repetition parses a copy of the response)
+            responses = [(name, fixture, fixture_response(fixture)) for name, fixture in fixtures]
+            items = {}
+            timings: dict[str, list] = {}  # callback -> [pages, items, seconds]
+            for name, fixture, response in responses:
+                start = time.perf_counter()
+                for _ in range(opts.repeat):
+                    items[name] = replay(spider, fixture, response.replace())
+                elapsed = time.perf_counter() - start
+
+                timing = timings.setdefault(fixture["callback"], [0, 0, 0.0])
+                timing[0] += opts.repeat
+                timing[1] += len(items[name]) * opts.repeat
+                timing[2] += elapsed
+
+            for callback_name, (pages, num_items, seconds) in sorted(timings.items()):
+                print(f"{spider_name:<16}{callback_name:<16}{pages:>8}{num_items:>8}{pages / seconds:>12.1f}")
+
+            if opts.save_golden:
+                save_golden(fixtures_dir, spider_name, items)
+                print(f"{spider_name}: golden items saved")
+            elif opts.check_golden:
+                different = check_golden(fixtures_dir, spider_name, items)
+                for name in different:
+                    print(f"{spider_name}: items of {name} differ from the golden ones")
+                if different:
+                    self.exitcode = 1
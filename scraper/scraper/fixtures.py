@@ -0,0 +1,141 @@
+## FIXTURES
+#
+# Responses recorded from the websites (see FixtureRecorderMiddleware), replayed through the callbacks of the spiders
+# without network access, to benchmark the parsing and to check that a change to a spider does not change its items.
+#
+# Layout of the fixtures directory:
+# <spider name>/<callback name>/<sha1 of the url>.json.gz  one recorded response
+# <spider name>/golden.json                                 the items produced by the recorded responses
+
+import os
+from typing import Iterator
+
+GOLDEN_FILE = "golden.json"
+
+
+def fixture_path(fixtures_dir: str, spider_name: str, callback_name: str, url: str) -> str:
+    import hashlib
+    name = hashlib.sha1(url.encode()).hexdigest()
+    return os.path.join(fixtures_dir, spider_name, callback_name, f"{name}.json.gz")
+
+
+def save_fixture(path: str, response, callback_name: str, cb_kwargs: dict):
+    """
+    Save a response to disk, with the callback (and its arguments) that parses it.
+    """
+    import base64
+    import gzip
+    import json
+
+    fixture = {
+        "url": response.url,
+        "status": response.status,
+        "headers": {key.decode(): [value.decode("latin-1") for value in values]
+                    for key, values in response.headers.items()},
+        "body": base64.b64encode(response.body).decode(),
+        "callback": callback_name,
+        "cb_kwargs": cb_kwargs,
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(fixture, f)
+
+
+def load_fixtures(fixtures_dir: str, spider_name: str) -> Iterator[tuple[str, dict]]:
+    """
+    Load the responses recorded for a spider.
+
+    :return: an iterator of (fixture name, fixture), sorted by name
+    """
+    import gzip
+    import json
+
+    spider_dir = os.path.join(fixtures_dir, spider_name)
+    if not os.path.isdir(spider_dir):
+        return
+    for callback_name in sorted(os.listdir(spider_dir)):
+        callback_dir = os.path.join(spider_dir, callback_name)
+        if not os.path.isdir(callback_dir):
+            continue
+        for file_name in sorted(os.listdir(callback_dir)):
+            with gzip.open(os.path.join(callback_dir, file_name), "rt", encoding="utf-8") as f:
+                yield f"{callback_name}/{file_name}", json.load(f)
+
+
+def fixture_response(fixture: dict):
+    """
+    Rebuild the response of a fixture, with a request pointing to its callback (by name).
+    """
+    import base64
+    from scrapy import Request
+    from scrapy.http import Headers
+    from scrapy.responsetypes import responsetypes
+
+    headers = Headers(fixture["headers"])
+    body = base64.b64decode(fixture["body"])
+    response_class = responsetypes.from_args(headers=headers, url=fixture["url"], body=body)
+    request = Request(fixture["url"], cb_kwargs=fixture["cb_kwargs"])
+    return response_class(url=fixture["url"], status=fixture["status"], headers=headers, body=body, request=request)
+
+
+def replay(spider, fixture: dict, response=None) -> list:
+    """
+    Run the callback of a fixture on its response.
+
+    :param spider: the spider the fixture was recorded with
+    :param fixture: the fixture
+    :param response: the response of the fixture, if already built
+    :return: the items produced by the callback (the requests are discarded)
+    """
+    from scrapy import Request
+    from scrapy.utils.spider import iterate_spider_output
+
+    response = response or fixture_response(fixture)
+    callback = getattr(spider, fixture["callback"])
+    return [output for output in iterate_spider_output(callback(response, **fixture["cb_kwargs"]))
+            if not isinstance(output, Request)]
+
+
+def item_to_dict(item) -> dict:
+    """
+    Serialize an item for the golden file. The lists are sorted as `FormatPipeline` does, since some spiders build
+    them from sets.
+    """
+    import copy
+    import dataclasses
+    from .items import Movie
+    from .pipelines import FormatPipeline
+
+    if isinstance(item, Movie):
+        item = FormatPipeline().process_item(copy.deepcopy(item), None)
+    return {"type": type(item).__name__, **dataclasses.asdict(item)}
+
+
+def save_golden(fixtures_dir: str, spider_name: str, items: dict[str, list]):
+    """
+    :param items: fixture name -> items produced by the fixture
+    """
+    import json
+    with open(os.path.join(fixtures_dir, spider_name, GOLDEN_FILE), "w") as f:
+        json.dump({name: [item_to_dict(item) for item in fixture_items] for name, fixture_items in items.items()}, f,
+                  indent=1, sort_keys=True)
+
+
+def check_golden(fixtures_dir: str, spider_name: str, items: dict[str, list]) -> list[str]:
+    """
+    Compare the items produced by the fixtures with the golden file of the spider.
+
+    :param items: fixture name -> items produced by the fixture
+    :return: the names of the fixtures whose items differ from the golden file
+    """
+    import json
+
+    with open(os.path.join(fixtures_dir, spider_name, GOLDEN_FILE)) as f:
+        golden = json.load(f)
+
+    # compare the JSON dumps: NaN scores are equal to each other there
+    def dump(fixture_items):
+        return json.dumps(fixture_items, sort_keys=True)
+
+    return [name for name, fixture_items in items.items()
+            if dump([item_to_dict(item) for item in fixture_items]) != dump(golden.get(name))]
@@ -0,0 +1,117 @@
+## HTTP CACHE
+#
+# Storage for Scrapy's HttpCacheMiddleware (see HTTPCACHE_* in settings.py), used during development so that recrawls
+# and parser fixes do not download the pages again.
+
+import os
+import time
+
+from scrapy.extensions.httpcache import FilesystemCacheStorage
+
+
+class BoundedFilesystemCacheStorage(FilesystemCacheStorage):
+    """
+    Filesystem cache (compressed with HTTPCACHE_GZIP) with:
+    - an expiration time for each type of page, i.e. for each callback parsing it (HTTPCACHE_EXPIRATION_BY_CALLBACK):
+      the listing pages change often, the movie pages rarely;
+    - a maximum size (HTTPCACHE_MAX_SIZE_MB): when exceeded, the least recently stored pages are removed;
+    - the number of hits and misses for each type of page in the Scrapy stats (`httpcache/hit/<callback>`, ...) and
+      the hit rate, logged when the spider closes.
+    """
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.expiration_by_callback: dict = settings.getdict("HTTPCACHE_EXPIRATION_BY_CALLBACK")
+        # the expiration is checked in `retrieve_response` for each callback: the base class, which applies
+        # HTTPCACHE_EXPIRATION_SECS to all the pages, must not expire the pages kept longer than it
+        self.default_expiration = self.expiration_secs
+        self.expiration_secs = 0
+        self.max_size = settings.getfloat("HTTPCACHE_MAX_SIZE_MB", 0) * 1024 * 1024
+        self.size = 0
+        self.stats = None
+
+    @staticmethod
+    def callback_name(request) -> str:
+        # the requests without a callback (e.g. the start urls) are parsed by `parse`
+        return getattr(request.callback, "__name__", None) or "parse"
+
+    def expiration(self, request) -> float:
+        """
+        :return: the number of seconds after which the cached response of the request expires (0: never)
+        """
+        return self.expiration_by_callback.get(self.callback_name(request), self.default_expiration)
+
+    @staticmethod
+    def entry_size(path: str) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+    def entries(self, spider) -> list[tuple[float, str]]:
+        """
+        :return: the (time it was stored, path) of the cached responses of the spider
+        """
+        entries = []
+        spider_dir = os.path.join(self.cachedir, spider.name)
+        if not os.path.isdir(spider_dir):
+            return entries
+        for prefix in os.scandir(spider_dir):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                meta_path = os.path.join(entry.path, "pickled_meta")
+                if entry.is_dir() and os.path.exists(meta_path):
+                    entries.append((os.stat(meta_path).st_mtime, entry.path))
+        return entries
+
+    def open_spider(self, spider):
+        super().open_spider(spider)
+        self.stats = spider.crawler.stats
+        if self.max_size > 0:
+            self.size = sum(self.entry_size(path) for _, path in self.entries(spider))
+
+    def close_spider(self, spider):
+        super().close_spider(spider)
+        hits = self.stats.get_value("httpcache/hit", 0)
+        misses = self.stats.get_value("httpcache/miss", 0)
+        if hits + misses > 0:
+            self.stats.set_value("httpcache/hit_rate", hits / (hits + misses))
+            spider.logger.info(f"HTTP cache: {hits} hits, {misses} misses ({hits / (hits + misses):.1%} hit rate)")
+
+    def retrieve_response(self, spider, request):
+        callback_name = self.callback_name(request)
+
+        meta_path = os.path.join(self._get_request_path(spider, request), "pickled_meta")
+        expiration = self.expiration(request)
+        if expiration > 0 and os.path.exists(meta_path) and time.time() - os.stat(meta_path).st_mtime > expiration:
+            response = None  # expired
+        else:
+            response = super().retrieve_response(spider, request)
+
+        self.stats.inc_value(f"httpcache/{'hit' if response is not None else 'miss'}/{callback_name}")
+        return response
+
+    def store_response(self, spider, request, response):
+        if self.max_size <= 0:
+            super().store_response(spider, request, response)
+            return
+
+        # an expired response is overwritten: its size is replaced, not added again
+        path = self._get_request_path(spider, request)
+        previous_size = self.entry_size(path) if os.path.isdir(path) else 0
+        super().store_response(spider, request, response)
+
+        self.size += self.entry_size(path) - previous_size
+        if self.size > self.max_size:
+            self.evict(spider)
+
+    def evict(self, spider):
+        """
+        Remove the least recently stored responses until the cache is 90% of its maximum size.
+        """
+        import shutil
+
+        for _, path in sorted(self.entries(spider)):
+            if self.size <= self.max_size * 0.9:
+                break
+            self.size -= self.entry_size(path)
+            shutil.rmtree(path, ignore_errors=True)
+            self.stats.inc_value("httpcache/evicted")
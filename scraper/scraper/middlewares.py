@@ -117,3 +117,237 @@ class ScraperDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalize the URL of a page, so that the URL of a request can be compared with the canonical URL stored in the
+    database: the query, the fragment and the trailing slash are removed, the scheme is always https.
+
+    :param url: the URL
+    :return: the normalized URL
+    """
+    from urllib.parse import urlsplit
+    parts = urlsplit(url)
+    return f"https://{parts.netloc.lower()}{parts.path.rstrip('/')}"
+
+
+class RecrawlMiddleware:
+    """
+    Skip the movie pages crawled recently, and download the others with a conditional request.
+
+    When the spider starts, the URL, the last crawl time and the validators (ETag, Last-Modified) of every page of the
+    website stored in `data_sources` are loaded with a single query. Then:
+    - the requests for movie pages crawled less than `recrawl_after` seconds ago are dropped;
+    - the other requests for known movie pages carry `If-None-Match`/`If-Modified-Since`, and a `304 Not Modified`
+      response only updates `last_crawled` (the page is not parsed again);
+    - the validators of the pages downloaded again are stored, to be used by the next crawl.
+    The updates are written in batches, in a thread so that the queries do not block the reactor.
+    """
+
+    SOURCE_NAMES = {"imdb": "IMDb", "metacritic": "Metacritic", "rottentomatoes": "Rotten Tomatoes"}
+
+    # the callback parsing the movie pages, in all the spiders
+    MOVIE_CALLBACK = "parse_movie"
+
+    def __init__(self, recrawl_after: float, conditional: bool = True, flush_size: int = 200, stats=None):
+        """
+        :param recrawl_after: the number of seconds after which a movie page is downloaded again
+        :param conditional: whether to send conditional requests for the pages downloaded again
+        :param flush_size: the number of pending updates after which they are written to the database
+        """
+        self.recrawl_after = recrawl_after
+        self.conditional = conditional
+        self.flush_size = flush_size
+        self.stats = stats
+
+        # normalized url -> (stored url, last crawl time, etag, last modified)
+        self.pages: dict[str, tuple] = {}
+        self.crawled_urls: list[str] = []  # pages not modified since their last crawl
+        self.validators: list[tuple[str, str, str]] = []  # (stored url, etag, last modified)
+        self.connection = None
+        self.write_lock = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        middleware = cls(crawler.settings.getfloat("RECRAWL_AFTER_DAYS", 7) * 24 * 60 * 60,
+                         crawler.settings.getbool("RECRAWL_CONDITIONAL", True),
+                         crawler.settings.getint("RECRAWL_FLUSH_SIZE", 200),
+                         crawler.stats)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_opened(self, spider):
+        import time
+        from dotenv import load_dotenv
+        from twisted.internet import defer
+        from .utils import setup_postgres_connection
+
+        source_name = self.SOURCE_NAMES.get(spider.name)
+        if source_name is None:
+            return
+
+        load_dotenv("../.env")
+        self.write_lock = defer.DeferredLock()
+        self.connection, cur = setup_postgres_connection()
+        # last_crawled is a local time of the database (timestamp without time zone): its age is computed there, and
+        # turned into a UNIX timestamp here
+        cur.execute("""
+            SELECT url, EXTRACT(EPOCH FROM LOCALTIMESTAMP - last_crawled), etag, last_modified FROM data_sources
+            WHERE name = %s
+            """, (source_name,))
+        now = time.time()
+        for url, age, etag, last_modified in cur:
+            self.pages[normalize_url(url)] = (url, now - float(age) if age is not None else 0, etag, last_modified)
+        cur.close()
+        self.connection.commit()
+        spider.logger.info(f"{len(self.pages)} pages already crawled from {source_name}")
+
+    def spider_closed(self, spider):
+        if self.connection is None:
+            return None
+
+        def close(_):
+            self.connection.close()
+            self.connection = None
+
+        # the crawl ends when the last updates are written
+        return self.flush().addBoth(close)
+
+    def inc_stat(self, key: str):
+        if self.stats is not None:
+            self.stats.inc_value(key)
+
+    def is_movie_page(self, request) -> bool:
+        return getattr(request.callback, "__name__", None) == self.MOVIE_CALLBACK
+
+    def process_request(self, request, spider):
+        import time
+        from scrapy.exceptions import IgnoreRequest
+
+        if not self.pages or not self.is_movie_page(request):
+            return None
+
+        page = self.pages.get(normalize_url(request.url))
+        if page is None:
+            return None
+
+        _, last_crawled, etag, last_modified = page
+        if last_crawled > time.time() - self.recrawl_after:
+            self.inc_stat("recrawl/skipped_fresh")
+            raise IgnoreRequest(f"Page crawled recently: {request.url}")
+
+        if self.conditional and (etag or last_modified):
+            if etag:
+                request.headers.setdefault("If-None-Match", etag)
+            if last_modified:
+                request.headers.setdefault("If-Modified-Since", last_modified)
+            self.inc_stat("recrawl/conditional")
+        return None
+
+    def process_response(self, request, response, spider):
+        from scrapy.exceptions import IgnoreRequest
+
+        if not self.pages or not self.is_movie_page(request):
+            return response
+
+        page = self.pages.get(normalize_url(request.url))
+        if page is None:
+            return response
+
+        stored_url = page[0]
+        if response.status == 304:
+            self.crawled_urls.append(stored_url)
+            self.inc_stat("recrawl/not_modified")
+            self.flush_if_needed()
+            raise IgnoreRequest(f"Page not modified: {request.url}")
+
+        if response.status == 200:
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            if etag or last_modified:
+                self.validators.append((stored_url, etag and etag.decode(), last_modified and last_modified.decode()))
+                self.flush_if_needed()
+        return response
+
+    def flush_if_needed(self):
+        if len(self.crawled_urls) + len(self.validators) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the pending updates to the database in a thread, so that the queries do not block the reactor; the
+        writes run one at a time on the connection of the middleware.
+
+        :return: a Deferred firing when the updates are written
+        """
+        from twisted.internet import defer
+        from twisted.internet.threads import deferToThread
+
+        if self.connection is None or not (self.crawled_urls or self.validators):
+            return defer.succeed(None)
+
+        crawled_urls, self.crawled_urls = self.crawled_urls, []
+        validators, self.validators = self.validators, []
+        return self.write_lock.run(deferToThread, self.write_updates, crawled_urls, validators)
+
+    def write_updates(self, crawled_urls: list[str], validators: list[tuple[str, str, str]]):
+        import psycopg2.extras
+
+        cur = self.connection.cursor()
+        try:
+            if crawled_urls:
+                cur.execute("UPDATE data_sources SET last_crawled = NOW() WHERE url = ANY(%s)", (crawled_urls,))
+            if validators:
+                psycopg2.extras.execute_values(cur, """
+                    UPDATE data_sources SET etag = v.etag, last_modified = v.last_modified
+                    FROM (VALUES %s) AS v (url, etag, last_modified)
+                    WHERE data_sources.url = v.url
+                    """, validators)
+            self.connection.commit()
+        except Exception as e:
+            self.connection.rollback()
+            print(f"Error while updating the crawled pages: {e}")
+        finally:
+            cur.close()
+
+
+class FixtureRecorderMiddleware:
+    """
+    Record to disk the responses parsed by some callbacks of the spiders, so that they can be replayed without network
+    access (see `scraper/fixtures.py` and the `parsebench` command).
+    """
+
+    def __init__(self, fixtures_dir: str, callbacks: list[str], limit: int):
+        """
+        :param fixtures_dir: the directory where the responses are saved
+        :param callbacks: the names of the callbacks whose responses are recorded
+        :param limit: the maximum number of responses recorded for each callback
+        """
+        self.fixtures_dir = fixtures_dir
+        self.callbacks = set(callbacks)
+        self.limit = limit
+        self.recorded: dict[str, int] = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings.get("FIXTURES_DIR"),
+                   crawler.settings.getlist("FIXTURES_RECORD_CALLBACKS"),
+                   crawler.settings.getint("FIXTURES_RECORD_LIMIT", 200))
+
+    def process_response(self, request, response, spider):
+        import os
+        from .fixtures import fixture_path, save_fixture
+
+        callback_name = getattr(request.callback, "__name__", None)
+        if response.status != 200 or callback_name not in self.callbacks:
+            return response
+        if self.recorded.get(callback_name, 0) >= self.limit:
+            return response
+
+        path = fixture_path(self.fixtures_dir, spider.name, callback_name, response.url)
+        if not os.path.exists(path):
+            save_fixture(path, response, callback_name, request.cb_kwargs)
+            self.recorded[callback_name] = self.recorded.get(callback_name, 0) + 1
+        return response
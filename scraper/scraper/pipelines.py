@@ -1,27 +1,42 @@
 ## PIPELINES
 #
 # Order of the pipelines:
-# MergePipeline -> FormatPipeline -> PostgresPipeline
+# MergePipeline -> FormatPipeline -> PostgresPipeline (or PostgresBulkPipeline)
 
 import psycopg2
+import psycopg2.errors
+import psycopg2.extras
 from dotenv import load_dotenv
 from scrapy import Spider
 from scrapy.exceptions import DropItem
 
 from .items import Movie, Plot
-from .items import Reviews
-from .utils import setup_postgres_connection
+from .items import Review, Reviews
+from .utils import setup_postgres_pool, copy_rows
 
 
 class PostgresPipeline:
     WHITELIST = ["imdb", "metacritic", "rottentomatoes"]
 
-    def __init__(self):
+    def __init__(self, pool_size=4, max_pending_writes=64):
+        """
+        :param pool_size: the number of threads writing to the database, each with its own connection
+        :param max_pending_writes: the maximum number of items written (or waiting to be written) at the same time
+        """
         load_dotenv("../.env")
 
-        self.connection, self.cur = setup_postgres_connection()
+        self.pool_size = pool_size
+        self.max_pending_writes = max_pending_writes
+        self.pool = setup_postgres_pool(pool_size)
+        self.threadpool = None
+        self.pending_writes = None
+        self.stats = None
+
+        # create the tables, if they do not exist yet
+        connection = self.pool.getconn()
+        cur = connection.cursor()
 
-        self.cur.execute("""
+        cur.execute("""
             CREATE TABLE IF NOT EXISTS reviews(
                 id varchar (48) PRIMARY KEY, 
                 movie_id integer NOT NULL,
@@ -32,7 +47,7 @@ class PostgresPipeline:
             )
             """)
 
-        self.cur.execute("""
+        cur.execute("""
             CREATE TABLE IF NOT EXISTS movies(
                 id serial PRIMARY KEY, 
                 title varchar (255) NOT NULL,
@@ -48,7 +63,7 @@ class PostgresPipeline:
             )
             """)
 
-        self.cur.execute("""
+        cur.execute("""
             CREATE TABLE IF NOT EXISTS data_sources(
                 id serial PRIMARY KEY,
                 movie_id integer NOT NULL,
@@ -63,24 +78,141 @@ class PostgresPipeline:
             )
             """)
 
-    def process_reviews(self, items: Reviews):
+        # validators of the page, used for conditional requests by RecrawlMiddleware
+        cur.execute("""
+            ALTER TABLE data_sources ADD COLUMN IF NOT EXISTS etag text, ADD COLUMN IF NOT EXISTS last_modified text
+            """)
+
+        # used by the retrieval loader to aggregate the reviews and the data sources of each movie
+        cur.execute("CREATE INDEX IF NOT EXISTS reviews_movie_id_idx ON reviews (movie_id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS data_sources_movie_id_idx ON data_sources (movie_id)")
+        connection.commit()
+
+        cur.close()
+        self.pool.putconn(connection)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = cls(crawler.settings.getint("POSTGRES_POOL_SIZE", 4),
+                       crawler.settings.getint("POSTGRES_MAX_PENDING_WRITES", 64))
+        pipeline.stats = crawler.stats
+        return pipeline
+
+    def open_spider(self, spider):
+        from twisted.internet import defer
+        from twisted.python.threadpool import ThreadPool
+
+        self.threadpool = ThreadPool(minthreads=1, maxthreads=self.pool_size, name="PostgresPipeline")
+        self.threadpool.start()
+        self.pending_writes = defer.DeferredSemaphore(self.max_pending_writes)
+
+    def run_in_thread(self, func, *args, **kwargs):
+        """
+        Run `func(cursor, *args, **kwargs)` in one of the database threads, with a connection taken from the pool.
+
+        The transaction is committed if `func` returns and rolled back if it raises. If the connection was lost, `func`
+        is executed once more with a new connection; the same happens on a unique violation, which happens when another
+        thread inserts the same movie at the same time (the second execution finds the movie inserted by the other), and
+        on a deadlock or a serialization failure between concurrent upserts.
+
+        When `max_pending_writes` calls are already running or waiting, the returned Deferred waits for one of them to
+        finish before the call is even queued: Scrapy keeps the item in progress in the meantime, which slows down the
+        crawl instead of letting the writes pile up in memory.
+
+        :return: a Deferred firing with the result of `func`
+        """
+        return self.run_in_pool(self.execute, func, *args, **kwargs)
+
+    def run_in_pool(self, func, *args, **kwargs):
+        """
+        Run `func(*args, **kwargs)` in one of the database threads, counting as a pending write as in `run_in_thread`;
+        `func` takes the connections itself (e.g. with `execute`).
+
+        :return: a Deferred firing with the result of `func`
+        """
+        from twisted.internet import reactor
+        from twisted.internet.threads import deferToThreadPool
+
+        return self.pending_writes.run(deferToThreadPool, reactor, self.threadpool, func, *args, **kwargs)
+
+    # errors caused by concurrent transactions, which succeed when executed again
+    RETRIED_ERRORS = (psycopg2.errors.UniqueViolation, psycopg2.errors.DeadlockDetected,
+                      psycopg2.errors.SerializationFailure)
+    MAX_ATTEMPTS = 2
+
+    def execute(self, func, *args, **kwargs):
+        for attempt in range(1, self.MAX_ATTEMPTS + 1):
+            # the connection is returned to the pool before the next attempt, which takes a new one: the threads
+            # retrying never hold two connections
+            connection = self.pool.getconn()
+            try:
+                with connection.cursor() as cur:
+                    result = func(cur, *args, **kwargs)
+                connection.commit()
+                self.pool.putconn(connection)
+                return result
+            except psycopg2.InterfaceError as e:
+                print("Connection to database lost: ", e)
+                self.pool.putconn(connection, close=True)
+                if attempt == self.MAX_ATTEMPTS:
+                    raise
+            except self.RETRIED_ERRORS:
+                connection.rollback()
+                self.pool.putconn(connection)
+                if attempt == self.MAX_ATTEMPTS:
+                    raise
+            except Exception:
+                connection.rollback()
+                self.pool.putconn(connection)
+                raise
+
+    def process_reviews(self, cur, items: Reviews) -> tuple[int, int]:
+        """
+        Insert the reviews of a movie, updating the ones already in the database (e.g. when a movie is crawled again).
+        If any review is inserted or changed, the data source of the movie is marked as crawled, so that the movie is
+        indexed again by the incremental indexing.
+
+        :param cur: the cursor used for the queries
+        :param items: the reviews of a movie
+        :return: the number of inserted and updated reviews
+        """
         # retrieve the id in the database of the movie based on data_sources
-        self.cur.execute("""SELECT movie_id FROM data_sources WHERE movie_source_uid = %s AND name = %s""",
+        cur.execute("""SELECT movie_id FROM data_sources WHERE movie_source_uid = %s AND name = %s""",
                          (items.reviews[0].movie_id, items.reviews[0].source_name))
-        movie_id = self.cur.fetchone()
+        movie_id = cur.fetchone()
 
         if movie_id is None:
             raise ValueError("Movie not found in database")
 
         movie_id = movie_id[0]
 
-        # insert the reviews
-        for item in items.reviews:
-            self.cur.execute("""
-                INSERT INTO reviews (id, movie_id, title, content, score) VALUES (%s, %s, %s, %s, %s)
-            """, (item.id, movie_id, item.title, item.content, item.score))
-
-    def process_movie(self, item: Movie):
+        # a review can appear twice in the same batch: a single statement cannot update a row twice
+        reviews = {item.id: item for item in items.reviews}
+
+        # insert the reviews; the existing ones are updated only if they changed
+        rows = psycopg2.extras.execute_values(cur, """
+            INSERT INTO reviews (id, movie_id, title, content, score) VALUES %s
+            ON CONFLICT (id) DO UPDATE SET
+                movie_id = EXCLUDED.movie_id,
+                title = EXCLUDED.title,
+                content = EXCLUDED.content,
+                score = EXCLUDED.score
+            WHERE (reviews.movie_id, reviews.title, reviews.content, reviews.score)
+                IS DISTINCT FROM (EXCLUDED.movie_id, EXCLUDED.title, EXCLUDED.content, EXCLUDED.score)
+            RETURNING (xmax = 0) AS inserted
+        """, [(item.id, movie_id, item.title, item.content, item.score) for item in reviews.values()], fetch=True)
+
+        inserted = sum(1 for (was_inserted,) in rows if was_inserted)
+        updated = len(rows) - inserted
+
+        if rows:
+            cur.execute("""
+                UPDATE data_sources SET last_crawled = NOW() WHERE movie_source_uid = %s AND name = %s
+            """, (items.reviews[0].movie_id, items.reviews[0].source_name))
+
+        return inserted, updated
+
+    def process_movie(self, cur, item: Movie):
         """
         If the movie does not exist in the database, insert it into the movies table
             and insert the current source into the data_sources table.
@@ -88,24 +220,26 @@ class PostgresPipeline:
         If the movie exists but the current source does not, insert the current source into the data_sources table.
         If the movie exists and the current source exists, update the last_crawled timestamp.
 
+        :param cur: the cursor used for the queries
         :param item: the movie item
         """
         if not isinstance(item, Movie):
             raise ValueError("Item must be a Movie")
-        self.cur.execute("""
-            SELECT id, description, plot, genres FROM movies WHERE title = %s AND directors = %s::varchar[] AND release = %s
+        cur.execute("""
+            SELECT id, description, plot, genres FROM movies
+            WHERE title = %s AND directors IS NOT DISTINCT FROM %s::varchar[] AND release IS NOT DISTINCT FROM %s
         """, (item.title, item.directors, item.release))
-        movie = self.cur.fetchone()
+        movie = cur.fetchone()
 
         if movie is None:
-            self.cur.execute("""
+            cur.execute("""
                 INSERT INTO movies (title, description, release, duration, genres, directors, actors, plot, image_url) 
                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id
             """, (item.title, item.description, item.release, item.duration, item.genres, item.directors, item.actors,
                   item.plot, item.metadata.image_url))
 
-            movie_id = self.cur.fetchone()[0]
-            self.cur.execute("""
+            movie_id = cur.fetchone()[0]
+            cur.execute("""
                 INSERT INTO data_sources (movie_id, movie_source_uid, name, url, page_title, score, critic_score) 
                 VALUES (%s, %s, %s, %s, %s, %s, %s)
             """, (movie_id, item.movie_id, item.metadata.source_name, item.metadata.url, item.metadata.page_title,
@@ -125,7 +259,7 @@ class PostgresPipeline:
         item.genres = list(set(item.genres + db_genre))
 
         # coalesce the data in the movie
-        self.cur.execute("""
+        cur.execute("""
             UPDATE movies SET 
                 description = COALESCE(description, %s),
                 duration = COALESCE(duration, %s),
@@ -138,55 +272,365 @@ class PostgresPipeline:
         """, (item.description, item.duration, item.genres, item.directors, item.actors, item.plot,
               item.metadata.image_url, movie_id))
 
-        self.cur.execute("""
+        cur.execute("""
             SELECT id FROM data_sources WHERE movie_id = %s AND name = %s
         """, (movie_id, item.metadata.source_name))
-        source_id = self.cur.fetchone()
+        source_id = cur.fetchone()
 
         if source_id is None:
-            self.cur.execute("""
+            cur.execute("""
                 INSERT INTO data_sources (movie_id, movie_source_uid, name, url, page_title, score, critic_score) 
                 VALUES (%s, %s, %s, %s, %s, %s, %s)
             """, (movie_id, item.movie_id, item.metadata.source_name, item.metadata.url, item.metadata.page_title,
                   item.score, item.critic_score))
         else:
-            self.cur.execute("""
+            cur.execute("""
                 UPDATE data_sources SET last_crawled = NOW() WHERE id = %s
             """, (source_id[0],))
 
-    def process_item(self, item, spider: Spider, retried=False):
+    def write_item(self, cur, item):
+        """
+        :return: the number of inserted and updated reviews
+        """
+        # check if item is a movie or a review
+        if isinstance(item, Movie):
+            self.process_movie(cur, item)
+            return 0, 0
+        return self.process_reviews(cur, item)
+
+    def count_reviews(self, counts: tuple[int, int]):
+        inserted, updated = counts
+        if self.stats is not None:
+            self.stats.inc_value("postgres/reviews_inserted", inserted)
+            self.stats.inc_value("postgres/reviews_updated", updated)
+
+    @staticmethod
+    def on_error(failure):
+        print("Error while inserting into database: ", failure.value)
+        failure.printTraceback()
+        return None
+
+    def process_item(self, item, spider: Spider):
         if spider.name not in self.WHITELIST:
             return item
-        try:
-            # check if item is a movie or a review
-            if isinstance(item, Movie):
-                self.process_movie(item)
+
+        d = self.run_in_thread(self.write_item, item)
+        d.addCallback(self.count_reviews)
+        d.addCallbacks(lambda _: item, self.on_error)
+        return d
+
+    def close_spider(self, spider):
+        # wait for the writes in progress, then release the threads and the connections
+        d = self.pending_writes.acquire()
+        for _ in range(self.max_pending_writes - 1):
+            d.addCallback(lambda _: self.pending_writes.acquire())
+
+        def close(_):
+            self.threadpool.stop()
+            self.pool.closeall()
+
+        d.addCallback(close)
+        return d
+
+
+class PostgresBulkPipeline(PostgresPipeline):
+    """
+    Buffered version of `PostgresPipeline`.
+
+    Movies and reviews are accumulated in memory and written every `POSTGRES_BULK_SIZE` items or every
+    `POSTGRES_BULK_INTERVAL` seconds. Each flush copies them (`COPY`) into temporary staging tables and merges them
+    into the real tables with a few set-based statements, in a single transaction; the result is the same as writing
+    the items one by one with `PostgresPipeline`.
+    """
+
+    MAX_REVIEW_ATTEMPTS = 3  # number of flushes a review waits for its movie to be in the database
+
+    # condition matching a staged movie `s` with the stored movie `m`, missing values included
+    SAME_MOVIE = ("m.title = s.title AND m.directors IS NOT DISTINCT FROM s.directors "
+                  "AND m.release IS NOT DISTINCT FROM s.release")
+
+    def __init__(self, bulk_size=500, bulk_interval=10.0, pool_size=4, max_pending_writes=64):
+        super().__init__(pool_size, max_pending_writes)
+        self.bulk_size = bulk_size
+        self.bulk_interval = bulk_interval
+
+        self.movies: list[Movie] = []
+        self.reviews: list[tuple[Review, int]] = []  # (review, number of flushes already attempted)
+        self.buffered_items = 0
+        self.flush_loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = cls(crawler.settings.getint("POSTGRES_BULK_SIZE", 500),
+                       crawler.settings.getfloat("POSTGRES_BULK_INTERVAL", 10.0),
+                       crawler.settings.getint("POSTGRES_POOL_SIZE", 4),
+                       crawler.settings.getint("POSTGRES_MAX_PENDING_WRITES", 64))
+        pipeline.stats = crawler.stats
+        return pipeline
+
+    def open_spider(self, spider):
+        from twisted.internet import task
+
+        super().open_spider(spider)
+
+        self.flush_loop = task.LoopingCall(self.flush)
+        self.flush_loop.start(self.bulk_interval, now=False)
+
+    @staticmethod
+    def create_staging_tables(cur):
+        # temporary tables are private to the connection and emptied at every commit
+        cur.execute("""
+            CREATE TEMPORARY TABLE IF NOT EXISTS staging_movies (
+                title varchar (255),
+                description text,
+                release int,
+                duration smallint,
+                genres varchar (128) [],
+                directors varchar (255) [],
+                actors varchar (255) [],
+                plot text,
+                image_url text
+            ) ON COMMIT DELETE ROWS
+            """)
+        cur.execute("""
+            CREATE TEMPORARY TABLE IF NOT EXISTS staging_data_sources (
+                title varchar (255),
+                directors varchar (255) [],
+                release int,
+                movie_source_uid varchar (255),
+                name varchar (255),
+                url text,
+                page_title text,
+                score float4,
+                critic_score float4
+            ) ON COMMIT DELETE ROWS
+            """)
+        cur.execute("""
+            CREATE TEMPORARY TABLE IF NOT EXISTS staging_reviews (
+                id varchar (48),
+                movie_source_uid varchar (255),
+                source_name varchar (255),
+                title text,
+                content text,
+                score float4
+            ) ON COMMIT DELETE ROWS
+            """)
+
+    @staticmethod
+    def merge_movies(movies: list[Movie]) -> tuple[list[Movie], list[Movie]]:
+        """
+        Merge the movies of a batch as `PostgresPipeline` would do inserting them one after the other: the first
+        occurrence of a movie wins, later occurrences only fill its missing fields; a data source is kept only the first
+        time it appears for a movie.
+
+        :return: the list of unique movies and the list of the movies with a unique data source
+        """
+        unique_movies: dict[tuple, Movie] = {}
+        unique_sources: dict[tuple, Movie] = {}
+        for movie in movies:
+            key = (movie.title, tuple(movie.directors), movie.release)
+            if key not in unique_movies:
+                unique_movies[key] = movie
             else:
-                self.process_reviews(item)
-        except psycopg2.InterfaceError as e:
-            print("Connection to database lost: ", e)
-
-            self.connection, self.cur = setup_postgres_connection()
-
-            if not retried:
-                return self.process_item(item, spider, retried=True)
-            return None
-        except Exception as e:
-            print("Error while inserting into database: ", e)
-            import traceback
-            traceback.print_exc()
-
-            self.connection.rollback()
-            return None
-        else:
-            # Execute insert of data into the database
-            self.connection.commit()
+                first = unique_movies[key]
+                for field in ["description", "duration", "genres", "directors", "actors", "plot"]:
+                    if getattr(first, field) is None:
+                        setattr(first, field, getattr(movie, field))
+                if first.metadata.image_url is None:
+                    first.metadata.image_url = movie.metadata.image_url
+
+            unique_sources.setdefault((key, movie.metadata.source_name), movie)
+        return list(unique_movies.values()), list(unique_sources.values())
+
+    def write_movies(self, cur, movies: list[Movie]):
+        unique_movies, unique_sources = self.merge_movies(movies)
+
+        copy_rows(cur, "staging_movies",
+                  ["title", "description", "release", "duration", "genres", "directors", "actors", "plot",
+                   "image_url"],
+                  ((m.title, m.description, m.release, m.duration, m.genres, m.directors, m.actors, m.plot,
+                    m.metadata.image_url) for m in unique_movies))
+        copy_rows(cur, "staging_data_sources",
+                  ["title", "directors", "release", "movie_source_uid", "name", "url", "page_title", "score",
+                   "critic_score"],
+                  ((m.title, m.directors, m.release, m.movie_id, m.metadata.source_name, m.metadata.url,
+                    m.metadata.page_title, m.score, m.critic_score) for m in unique_sources))
+
+        # existing movies get their missing fields filled in, new movies are inserted; the unique constraint does not
+        # match movies without release or directors (NULLs are distinct), so the movies are matched explicitly
+        cur.execute(f"""
+            UPDATE movies m SET
+                description = COALESCE(m.description, s.description),
+                duration = COALESCE(m.duration, s.duration),
+                genres = COALESCE(m.genres, s.genres),
+                directors = COALESCE(m.directors, s.directors),
+                actors = COALESCE(m.actors, s.actors),
+                plot = COALESCE(m.plot, s.plot),
+                image_url = COALESCE(m.image_url, s.image_url)
+            FROM staging_movies s
+            WHERE {self.SAME_MOVIE}
+            """)
+        cur.execute(f"""
+            INSERT INTO movies (title, description, release, duration, genres, directors, actors, plot, image_url)
+            SELECT title, description, release, duration, genres, directors, actors, plot, image_url
+            FROM staging_movies s
+            WHERE NOT EXISTS (SELECT 1 FROM movies m WHERE {self.SAME_MOVIE})
+            ON CONFLICT ON CONSTRAINT superkey_crosswebsite DO UPDATE SET
+                description = COALESCE(movies.description, EXCLUDED.description),
+                duration = COALESCE(movies.duration, EXCLUDED.duration),
+                genres = COALESCE(movies.genres, EXCLUDED.genres),
+                directors = COALESCE(movies.directors, EXCLUDED.directors),
+                actors = COALESCE(movies.actors, EXCLUDED.actors),
+                plot = COALESCE(movies.plot, EXCLUDED.plot),
+                image_url = COALESCE(movies.image_url, EXCLUDED.image_url)
+            """)
+
+        # the sources already stored for the movie are marked as crawled, the others are inserted
+        cur.execute(f"""
+            UPDATE data_sources ds SET last_crawled = NOW()
+            FROM staging_data_sources s
+            JOIN movies m ON {self.SAME_MOVIE}
+            WHERE ds.movie_id = m.id AND ds.name = s.name
+            """)
+        cur.execute(f"""
+            INSERT INTO data_sources (movie_id, movie_source_uid, name, url, page_title, score, critic_score)
+            SELECT m.id, s.movie_source_uid, s.name, s.url, s.page_title, s.score, s.critic_score
+            FROM staging_data_sources s
+            JOIN movies m ON {self.SAME_MOVIE}
+            WHERE NOT EXISTS (SELECT 1 FROM data_sources ds WHERE ds.movie_id = m.id AND ds.name = s.name)
+            ON CONFLICT (url) DO NOTHING
+            """)
+
+    def write_reviews(self, cur, reviews: list[tuple[Review, int]]) -> tuple[list[tuple[Review, int]], int, int]:
+        """
+        Write the reviews whose movie is in the database, updating the ones that changed, and mark the data sources of
+        their movies as crawled.
+
+        :return: the reviews whose movie is not in the database yet, to be written by one of the next flushes, the
+                 number of inserted reviews and the number of updated reviews
+        """
+        copy_rows(cur, "staging_reviews", ["id", "movie_source_uid", "source_name", "title", "content", "score"],
+                  ((r.id, r.movie_id, r.source_name, r.title, r.content, r.score) for r, _ in reviews))
+
+        cur.execute("""
+            INSERT INTO reviews (id, movie_id, title, content, score)
+            SELECT DISTINCT ON (s.id) s.id, ds.movie_id, s.title, s.content, s.score
+            FROM staging_reviews s
+            JOIN data_sources ds ON ds.movie_source_uid = s.movie_source_uid AND ds.name = s.source_name
+            ORDER BY s.id
+            ON CONFLICT (id) DO UPDATE SET
+                movie_id = EXCLUDED.movie_id,
+                title = EXCLUDED.title,
+                content = EXCLUDED.content,
+                score = EXCLUDED.score
+            WHERE (reviews.movie_id, reviews.title, reviews.content, reviews.score)
+                IS DISTINCT FROM (EXCLUDED.movie_id, EXCLUDED.title, EXCLUDED.content, EXCLUDED.score)
+            RETURNING movie_id, (xmax = 0) AS inserted
+            """)
+        rows = cur.fetchall()
+        inserted = sum(1 for _, was_inserted in rows if was_inserted)
+        updated = len(rows) - inserted
+
+        changed_movies = list({movie_id for movie_id, _ in rows})
+        if changed_movies:
+            cur.execute("UPDATE data_sources SET last_crawled = NOW() WHERE movie_id = ANY(%s)", (changed_movies,))
+
+        cur.execute("""
+            SELECT DISTINCT s.movie_source_uid, s.source_name
+            FROM staging_reviews s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM data_sources ds WHERE ds.movie_source_uid = s.movie_source_uid AND ds.name = s.source_name
+            )
+            """)
+        missing_movies = set(cur.fetchall())
+
+        pending_reviews = [(review, attempts + 1) for review, attempts in reviews
+                           if (review.movie_id, review.source_name) in missing_movies
+                           and attempts + 1 < self.MAX_REVIEW_ATTEMPTS]
+        return pending_reviews, inserted, updated
+
+    def write_batch(self, cur, movies: list[Movie], reviews: list[tuple[Review, int]]):
+        self.create_staging_tables(cur)
+        self.write_movies(cur, movies)
+        return self.write_reviews(cur, reviews)
+
+    def write_batch_or_split(self, movies: list[Movie], reviews: list[tuple[Review, int]]):
+        """
+        Write a batch in one transaction; if the data of an item is rejected by the database (which fails the whole
+        `COPY`), split the batch in two halves written separately, down to the single item, which is dropped. A batch
+        with one bad item is written with about 2 * log2(size) transactions.
+
+        Runs in one of the database threads.
+
+        :return: the same as `write_reviews`
+        """
+        try:
+            return self.execute(self.write_batch, movies, reviews)
+        except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+            items = [(True, movie) for movie in movies] + [(False, review) for review in reviews]
+            if len(items) <= 1:
+                print("Dropping item rejected by the database: ", e)
+                if self.stats is not None:
+                    self.stats.inc_value("postgres/bulk_dropped_items")
+                return [], 0, 0
+
+        # the movies stay before their reviews: a review whose movie ends in the other half waits for the next flush
+        middle = len(items) // 2
+        pending_reviews, inserted, updated = [], 0, 0
+        for half in (items[:middle], items[middle:]):
+            result = self.write_batch_or_split([item for is_movie, item in half if is_movie],
+                                               [item for is_movie, item in half if not is_movie])
+            pending_reviews.extend(result[0])
+            inserted += result[1]
+            updated += result[2]
+        return pending_reviews, inserted, updated
+
+    def flush(self):
+        """
+        Write the buffered items in one of the database threads.
+
+        :return: a Deferred firing when the items are written
+        """
+        from twisted.internet import defer
+
+        if not self.movies and not self.reviews:
+            return defer.succeed(None)
+
+        movies, self.movies = self.movies, []
+        reviews, self.reviews = self.reviews, []
+        self.buffered_items = 0
+
+        def written(result):
+            pending_reviews, inserted, updated = result
+            self.reviews.extend(pending_reviews)
+            self.count_reviews((inserted, updated))
+
+        d = self.run_in_pool(self.write_batch_or_split, movies, reviews)
+        d.addCallbacks(written, self.on_error)
+        return d
+
+    def process_item(self, item, spider: Spider):
+        if spider.name not in self.WHITELIST:
             return item
 
+        if isinstance(item, Movie):
+            self.movies.append(item)
+        else:
+            self.reviews.extend((review, 0) for review in item.reviews)
+        self.buffered_items += 1
+
+        if self.buffered_items >= self.bulk_size:
+            # the item completes when the batch is written, so the crawl slows down when the writes fall behind
+            return self.flush().addCallback(lambda _: item)
+        return item
+
     def close_spider(self, spider):
-        ## Close cursor & connection to database
-        self.cur.close()
-        self.connection.close()
+        if self.flush_loop is not None and self.flush_loop.running:
+            self.flush_loop.stop()
+
+        d = self.flush()
+        d.addCallback(lambda _: super(PostgresBulkPipeline, self).close_spider(spider))
+        return d
 
 
 class MergePipeline:
@@ -195,35 +639,233 @@ class MergePipeline:
 
     This pipeline is responsible for keeping a Movie object until its Plot object is found.
     They are then merged and the Movie object is yielded.
+
+    The buffer is bounded: a movie whose plot does not arrive within `timeout` seconds (e.g. because the plot request
+    failed) is emitted without a plot, and when more than `max_pending` movies (or plots) are waiting, the oldest ones
+    are moved to the on-disk store at `spill_path` or, if there is none, emitted without waiting any longer.
     """
 
-    def __init__(self):
-        self.movies: dict[str, Movie] = {}
-        self.plots: dict[str, Plot] = {}
+    MOVIE = "movie"
+    PLOT = "plot"
+
+    def __init__(self, max_pending=10000, timeout=600, spill_path=None, check_interval=60):
+        """
+        :param max_pending: the maximum number of movies (and of plots) kept in memory
+        :param timeout: the number of seconds after which a movie is emitted without its plot (0 to wait forever)
+        :param spill_path: the path of the sqlite file storing the items exceeding `max_pending`, if any
+        :param check_interval: the number of seconds between two checks for expired items
+        """
+        from collections import OrderedDict
+
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.spill_path = spill_path
+
+        # key -> (item, time it was added), oldest first
+        self.movies: OrderedDict[str, tuple[Movie, float]] = OrderedDict()
+        self.plots: OrderedDict[str, tuple[Plot, float]] = OrderedDict()
+
+        self.spill = None
+        self.crawler = None
+        self.stats = None
+        self.spider = None
+        self.expire_loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        from scrapy import signals
+
+        pipeline = cls(crawler.settings.getint("MERGE_MAX_PENDING", 10000),
+                       crawler.settings.getfloat("MERGE_TIMEOUT", 600),
+                       crawler.settings.get("MERGE_SPILL_PATH"),
+                       crawler.settings.getfloat("MERGE_CHECK_INTERVAL", 60))
+        pipeline.crawler = crawler
+        pipeline.stats = crawler.stats
+        crawler.signals.connect(pipeline.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(pipeline.start_expire_loop, signal=signals.spider_opened)
+        return pipeline
+
+    def open_spider(self, spider):
+        from .utils import SpillStore
+
+        self.spider = spider
+        if self.spill_path:
+            self.spill = SpillStore(self.spill_path)
+
+    def start_expire_loop(self, spider):
+        """
+        Start the periodic expiration on `spider_opened`, after the `open_spider` of all the pipelines: the first run
+        releases the expired movies left in the spill store by the previous crawl, which need the following pipelines
+        to be open.
+        """
+        from twisted.internet import task
+
+        if self.timeout > 0 and self.expire_loop is None:
+            self.expire_loop = task.LoopingCall(self.expire)
+            self.expire_loop.start(self.check_interval, now=True)
+
+    def close_spider(self, spider):
+        if self.expire_loop is not None and self.expire_loop.running:
+            self.expire_loop.stop()
+
+        if self.spill is not None:
+            # keep the movies still waiting, the next crawl emits them
+            for key, (movie, added) in self.movies.items():
+                self.spill.put(self.MOVIE, key, added, movie)
+            self.movies.clear()
+            self.spill.close()
+        elif self.movies:
+            print(f"MergePipeline: {len(self.movies)} movies were never emitted")
 
     @staticmethod
     def get_key(item: Movie or Plot) -> str:
         return item.movie_id
 
+    def update_stats(self):
+        if self.stats is None:
+            return
+        pending_movies, pending_plots = len(self.movies), len(self.plots)
+        if self.spill is not None:
+            pending_movies += self.spill.count(self.MOVIE)
+            pending_plots += self.spill.count(self.PLOT)
+        self.stats.set_value("merge/pending_movies", pending_movies)
+        self.stats.set_value("merge/pending_plots", pending_plots)
+
+    def inc_stat(self, key: str, count: int = 1):
+        if self.stats is not None and count:
+            self.stats.inc_value(key, count)
+
+    def add(self, kind: str, buffer, key: str, item):
+        import time
+
+        buffer[key] = (item, time.time())
+        buffer.move_to_end(key)
+
+        while len(buffer) > self.max_pending:
+            old_key, (old_item, added) = buffer.popitem(last=False)
+            if self.spill is not None:
+                self.spill.put(kind, old_key, added, old_item)
+                self.inc_stat("merge/spilled")
+            elif kind == self.MOVIE:
+                self.release(old_item)
+                self.inc_stat("merge/expired_movies")
+            else:
+                self.inc_stat("merge/expired_plots")
+
+    def take(self, kind: str, buffer, key: str):
+        """
+        Remove an item from the buffer (or from the spill store).
+
+        :return: the item, or None if it is not waiting
+        """
+        if key in buffer:
+            return buffer.pop(key)[0]
+        if self.spill is not None:
+            return self.spill.pop(kind, key)
+        return None
+
+    def release(self, movie: Movie):
+        """
+        Emit a movie without its plot, sending it through the pipelines following this one.
+
+        Scrapy has no public API to inject an item that no callback returned: the movie goes through the item pipeline
+        manager of the engine (`engine.scraper.itemproc`), an internal attribute of Scrapy (checked with the version
+        pinned in requirements.txt, 2.11).
+        """
+        from scrapy import signals
+
+        if self.crawler is None or self.spider is None:
+            return
+
+        itemproc = getattr(getattr(self.crawler.engine, "scraper", None), "itemproc", None)
+        if itemproc is None:
+            raise RuntimeError("MergePipeline cannot emit the movies: this version of Scrapy has no "
+                               "engine.scraper.itemproc")
+
+        movie.wait_for_plot = False  # this pipeline lets it pass
+        d = itemproc.process_item(movie, self.spider)
+
+        def scraped(item):
+            # let the feed exports and the other extensions see the item, as for the items returned by the spiders
+            return self.crawler.signals.send_catch_log_deferred(signal=signals.item_scraped, item=item,
+                                                                response=None, spider=self.spider)
+
+        def failed(failure):
+            if not failure.check(DropItem):
+                print(f"Error while emitting movie {movie.movie_id}: {failure.value}")
+
+        d.addCallbacks(scraped, failed)
+        return d
+
+    def expire(self):
+        """
+        Emit the movies that waited for their plot longer than `timeout` and forget the plots without a movie.
+        """
+        import time
+
+        deadline = time.time() - self.timeout
+
+        expired_movies = []
+        while self.movies and next(iter(self.movies.values()))[1] < deadline:
+            expired_movies.append(self.movies.popitem(last=False)[1][0])
+        expired_plots = 0
+        while self.plots and next(iter(self.plots.values()))[1] < deadline:
+            self.plots.popitem(last=False)
+            expired_plots += 1
+
+        if self.spill is not None:
+            expired_movies.extend(self.spill.pop_older_than(self.MOVIE, deadline))
+            expired_plots += len(self.spill.pop_older_than(self.PLOT, deadline))
+
+        for movie in expired_movies:
+            self.release(movie)
+        self.inc_stat("merge/expired_movies", len(expired_movies))
+        self.inc_stat("merge/expired_plots", expired_plots)
+        self.update_stats()
+
+    def spider_idle(self, spider):
+        """
+        When there are no more requests, no plot can arrive anymore: emit all the movies still waiting.
+        """
+        from scrapy.exceptions import DontCloseSpider
+
+        movies = [movie for movie, _ in self.movies.values()]
+        self.movies.clear()
+        self.plots.clear()
+        if self.spill is not None:
+            movies.extend(self.spill.pop_older_than(self.MOVIE))
+            self.spill.pop_older_than(self.PLOT)
+
+        for movie in movies:
+            self.release(movie)
+        self.inc_stat("merge/expired_movies", len(movies))
+        self.update_stats()
+
+        if movies:
+            # give the emitted movies the time to go through the pipelines
+            raise DontCloseSpider()
+
     def process_movie(self, item: Movie):
         key = self.get_key(item)
-        if key in self.plots:
-            item.plot = self.plots[key].text
-            del self.plots[key]
+        plot = self.take(self.PLOT, self.plots, key)
+        if plot is not None:
+            item.plot = plot.text
+            self.inc_stat("merge/merged")
             return item
         else:
-            self.movies[key] = item
+            self.add(self.MOVIE, self.movies, key, item)
             raise DropItem()
 
     def process_plot(self, item: Plot):
         key = self.get_key(item)
-        if key in self.movies:
-            movie = self.movies[key]
+        movie = self.take(self.MOVIE, self.movies, key)
+        if movie is not None:
             movie.plot = item.text
-            del self.movies[key]
+            self.inc_stat("merge/merged")
             return movie
         else:
-            self.plots[key] = item
+            self.add(self.PLOT, self.plots, key, item)
             raise DropItem()
 
     def process_item(self, item, spider):
@@ -55,9 +55,28 @@ COOKIES_ENABLED = False
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-# DOWNLOADER_MIDDLEWARES = {
-#    "scraper.middlewares.ScraperDownloaderMiddleware": 543,
-# }
+DOWNLOADER_MIDDLEWARES = {}
+
+# Build the movies of IMDb and Rotten Tomatoes from the JSON-LD block of the page, querying the DOM only for the
+# missing fields (see scraper/spiders/structured.py)
+STRUCTURED_DATA_EXTRACTION = os.getenv("STRUCTURED_DATA_EXTRACTION", "false").lower() != "false"
+
+# Custom commands (e.g. `scrapy parsebench`)
+COMMANDS_MODULE = "scraper.commands"
+
+# Directory of the recorded responses, replayed by `scrapy parsebench`
+FIXTURES_DIR = os.getenv("FIXTURES_DIR") or "fixtures"
+# Record the responses parsed by FIXTURES_RECORD_CALLBACKS while crawling (see FixtureRecorderMiddleware)
+FIXTURES_RECORD = os.getenv("FIXTURES_RECORD", "false").lower() != "false"
+FIXTURES_RECORD_CALLBACKS = ["parse_movie", "parse_plot"]
+# Maximum number of responses recorded for each callback
+FIXTURES_RECORD_LIMIT = 200
+# Directory of the generated pages (see synthetic.py), replayed by `scrapy parsebench --synthetic`
+SYNTHETIC_FIXTURES_DIR = "fixtures/synthetic"
+
+if FIXTURES_RECORD:
+    # after HttpCompressionMiddleware (590) and RedirectMiddleware (600): the final, decompressed responses are saved
+    DOWNLOADER_MIDDLEWARES["scraper.middlewares.FixtureRecorderMiddleware"] = 550
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
@@ -70,10 +89,50 @@ COOKIES_ENABLED = False
 
 ITEM_PIPELINES = {"scraper.pipelines.MergePipeline": 100, "scraper.pipelines.FormatPipeline": 150, }
 
+# sqlite file with the IMDb movies already crawled, kept between crawls (if not set, only the movies crawled in the
+# current crawl are skipped)
+IMDB_SEEN_PATH = os.getenv("IMDB_SEEN_PATH") or None
+# Number of days after which an IMDb movie is crawled again
+IMDB_RECRAWL_AFTER_DAYS = 30
+# Add the IMDb movies stored in the database to the seen movies when the spider starts (requires USE_POSTGRES)
+IMDB_SEEN_FROM_DATABASE = True
+
+# Maximum number of movies (and of plots) waiting to be merged in memory (see MergePipeline)
+MERGE_MAX_PENDING = 10000
+# Number of seconds after which a movie waiting for its plot is emitted without it (0 to wait until the end)
+MERGE_TIMEOUT = 600
+# Number of seconds between two checks for expired movies
+MERGE_CHECK_INTERVAL = 60
+# sqlite file storing the movies and the plots exceeding MERGE_MAX_PENDING (if not set, they are emitted right away)
+MERGE_SPILL_PATH = os.getenv("MERGE_SPILL_PATH") or None
+
 USE_POSTGRESQL = os.getenv("USE_POSTGRES", "false").lower() != "false"
 
+# Number of threads (and database connections) writing the items
+POSTGRES_POOL_SIZE = 4
+# Maximum number of writes in progress; when reached, the crawl waits for the database
+POSTGRES_MAX_PENDING_WRITES = 64
+
+# Buffer the movies and the reviews and write them in bulk (see PostgresBulkPipeline)
+POSTGRES_BULK = os.getenv("POSTGRES_BULK", "false").lower() != "false"
+# Number of items after which the buffer is written
+POSTGRES_BULK_SIZE = 500
+# Maximum number of seconds an item stays in the buffer
+POSTGRES_BULK_INTERVAL = 10
+
+# Number of days after which a movie page stored in the database is downloaded again (see RecrawlMiddleware)
+RECRAWL_AFTER_DAYS = 7
+# Send conditional requests (If-None-Match, If-Modified-Since) for the movie pages downloaded again
+RECRAWL_CONDITIONAL = True
+# Number of pending updates of data_sources after which they are written
+RECRAWL_FLUSH_SIZE = 200
+
 if USE_POSTGRESQL:
-    ITEM_PIPELINES["scraper.pipelines.PostgresPipeline"] = 200
+    DOWNLOADER_MIDDLEWARES["scraper.middlewares.RecrawlMiddleware"] = 100
+    if POSTGRES_BULK:
+        ITEM_PIPELINES["scraper.pipelines.PostgresBulkPipeline"] = 200
+    else:
+        ITEM_PIPELINES["scraper.pipelines.PostgresPipeline"] = 200
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
@@ -90,11 +149,24 @@ AUTOTHROTTLE_TARGET_CONCURRENCY = 16
 
 # Enable and configure HTTP caching (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
-# HTTPCACHE_ENABLED = True
-# HTTPCACHE_EXPIRATION_SECS = 0
-# HTTPCACHE_DIR = "httpcache"
-# HTTPCACHE_IGNORE_HTTP_CODES = []
-# HTTPCACHE_STORAGE = "scrapy.extensions.httpcache.FilesystemCacheStorage"
+HTTPCACHE_ENABLED = os.getenv("HTTPCACHE_ENABLED", "false").lower() != "false"
+HTTPCACHE_DIR = "httpcache"
+HTTPCACHE_GZIP = True
+HTTPCACHE_IGNORE_HTTP_CODES = [403, 429, 500, 502, 503, 504]
+HTTPCACHE_STORAGE = "scraper.httpcache.BoundedFilesystemCacheStorage"
+# Default expiration of the cached pages, in seconds (0: never)
+HTTPCACHE_EXPIRATION_SECS = 24 * 60 * 60
+# Expiration of the cached pages for each callback parsing them: the listing pages change often, the movies rarely
+HTTPCACHE_EXPIRATION_BY_CALLBACK = {
+    "parse": 60 * 60,
+    "parse_movie_list": 60 * 60,
+    "parse_browse_page": 60 * 60,
+    "parse_movie": 7 * 24 * 60 * 60,
+    "parse_plot": 7 * 24 * 60 * 60,
+    "extract_reviews": 24 * 60 * 60,
+}
+# Maximum size of the cache of each spider; when exceeded, the oldest pages are removed (0: unbounded)
+HTTPCACHE_MAX_SIZE_MB = 2048
 
 # Set settings whose default value is deprecated to a future-proof value
 REQUEST_FINGERPRINTER_IMPLEMENTATION = "2.7"
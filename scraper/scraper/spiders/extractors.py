@@ -0,0 +1,147 @@
+## EXTRACTORS
+#
+# XPath expressions used by the spiders, compiled once when the module is imported.
+#
+# `response.xpath`/`response.css` translate and compile the query and wrap every result in a `Selector` at each call,
+# and the absolute queries (`//...`) visit the whole document. Here the queries are compiled with lxml once, run on the
+# lxml tree of the response (`response.selector.root`), and are relative to the section of the page that contains the
+# field whenever possible: the section is found once, then all its fields are extracted from it.
+#
+# The CSS queries are translated with the same translator used by `response.css`, so they match the same elements.
+
+from lxml import etree
+from parsel.csstranslator import HTMLTranslator
+
+_css_translator = HTMLTranslator()
+
+
+def xpath(query: str) -> etree.XPath:
+    """
+    Compile an XPath query; the strings it returns are plain `str`, not bound to the document.
+    """
+    return etree.XPath(query, smart_strings=False)
+
+
+def css(query: str) -> etree.XPath:
+    """
+    Compile a CSS query (supporting the `::text` and `::attr(name)` pseudo-elements, as `response.css`).
+    The query is relative to the node it is run on.
+    """
+    return xpath(_css_translator.css_to_xpath(query))
+
+
+def first(results: list, default=None):
+    """
+    :return: the first result of a query, as `.get()` does
+    """
+    return results[0] if results else default
+
+
+def first_of(query: etree.XPath, nodes: list, default=None):
+    """
+    :return: the first result of a query run on several nodes, in order
+    """
+    for node in nodes:
+        results = query(node)
+        if results:
+            return results[0]
+    return default
+
+
+def all_of(query: etree.XPath, nodes: list) -> list:
+    """
+    :return: the results of a query run on several nodes, concatenated
+    """
+    return [result for node in nodes for result in query(node)]
+
+
+def document(response) -> etree._Element:
+    """
+    :return: the lxml tree of a response, parsed once by Scrapy and cached by the response
+    """
+    return response.selector.root
+
+
+# Metadata of the page, in the <head> of every website
+PAGE_TYPE = xpath("/html/head/meta[@property='og:type']/@content")
+CANONICAL_URL = xpath("/html/head/link[@rel='canonical']/@href")
+IMAGE_URL = xpath("/html/head/meta[@property='og:image']/@content")
+PAGE_TITLE = xpath("/html/head/title/text()")
+DESCRIPTION = xpath("/html/head/meta[@name='description']/@content")
+OG_DESCRIPTION = xpath("/html/head/meta[@property='og:description']/@content")
+
+
+class IMDb:
+    SIMILAR_MOVIES_SECTION = xpath("//div[@data-testid='shoveler-items-container']")
+    SIMILAR_MOVIE_URL = css("a.ipc-poster-card__title--clickable::attr(href)")
+
+    TITLE_HEADER = xpath("//h1")
+    TEXT = css("::text")  # the text of the node and of its descendants
+    # the release year is the first a child of the ul adjacent to the h1
+    RELEASE_YEAR = xpath("following-sibling::ul//a/text()")
+
+    TECH_SPECS_SECTION = xpath("//section[@cel_widget_id='StaticFeature_TechSpecs']")
+    TECH_SPEC = css("div.ipc-metadata-list-item__content-container::text")
+
+    GENRES_SECTION = xpath("//div[@data-testid='genres']")
+    GENRE = css("a.ipc-chip span::text")
+
+    SCORE = css("span.cMEQkK::text")
+
+    # the directors are the links of the first li of the first ul with class ipc-metadata-list
+    FIRST_METADATA_LIST = xpath(f"({_css_translator.css_to_xpath('ul.ipc-metadata-list')})[1]")
+    FIRST_ITEM = xpath("(descendant-or-self::li)[1]")
+    LINK_TEXT = css("a::text")
+
+    ACTORS = css("a.gCQkeh::text")
+
+    SYNOPSIS_SECTION = xpath("//div[@data-testid='sub-section-synopsis']")
+    SYNOPSIS = xpath(".//div[@class='ipc-html-content-inner-div']//text()")
+    SUMMARIES_SECTION = xpath("//div[@data-testid='sub-section-summaries']")
+    SUMMARY = xpath(".//li//div[@class='ipc-html-content-inner-div']/text()")
+
+    REVIEW = css("div.lister-item")
+    REVIEW_ID = xpath("./@data-review-id")
+    REVIEW_SCORE = xpath(".//div[@class='ipl-ratings-bar']//span[@class='rating-other-user-rating']//span//text()")
+    REVIEW_TITLE = xpath(".//a[@class='title']/text()")
+    REVIEW_TEXT = xpath(".//div[@class='text show-more__control']/text()")
+    REVIEWS_NEXT_KEY = xpath("//div[@class='load-more-data']/@data-key")
+
+
+class Metacritic:
+    MOVIE_URL = xpath("//div[@class='c-productListings']//a/@href")
+
+    TITLE = xpath(f"{_css_translator.css_to_xpath('div.c-productHero_title')}/div/text()")
+
+    HEADER_INFO = css("div.c-heroVariant_headerInfo")
+    HEADER_METADATA_ITEM = css("li.c-heroMetadata_item")
+    SPAN_TEXT = xpath(".//span/text()")
+
+    DETAILS_SECTION = xpath("//div[contains(@class, 'c-movieDetails_sectionContainer')]")
+    DURATION = xpath(".//span[contains(text(), 'Duration')]/following-sibling::span/text()")
+
+    GENRES = xpath("//ul[contains(@class, 'c-genreList')]//span/text()")
+
+    CRITIC_SCORE = xpath("//div[contains(@class, 'c-siteReviewScore_background-critic_medium')]//span/text()")
+    USER_SCORE = xpath("//div[contains(@class, 'c-siteReviewScore_background-user')]//span/text()")
+
+    DIRECTORS_SECTION = css("div.c-productDetails_staff_directors")
+    LINK_TEXT = css("a::text")
+
+    ACTORS = xpath("//div[contains(@data-cy, 'cast-')]//h3/text()")
+
+
+class RottenTomatoes:
+    TITLE = css("h1.title::text")
+
+    INFO_SECTION = xpath("//ul[@id='info']")
+    # the values of an entry of the info section, given its label (e.g. "Genre:")
+    INFO_VALUES = xpath(".//li[contains(.//b/text(), $label)]//span")
+    TEXT = xpath("./text()")
+    TIME_TEXT = xpath("./time/text()")
+    LINK_TEXT = xpath("./a/text()")
+
+    RELEASE_INFO = xpath("//p[@slot='info']/text()")
+    SCORE_DETAILS = xpath("//script[@id='scoreDetails']/text()")
+    SYNOPSIS = xpath("//p[@data-qa='movie-info-synopsis']/text()")
+    ACTORS = xpath("//div[contains(@class, 'cast-and-crew-item')]//a/p/text()")
@@ -3,9 +3,13 @@ from random import random, shuffle
 from typing import Generator, Any
 
 import scrapy
+from scrapy import signals
 from scrapy.http import Response
 
-from .utils import parse_duration
+from .extractors import IMDb, document, first, first_of, all_of
+from .extractors import PAGE_TYPE, CANONICAL_URL, IMAGE_URL, PAGE_TITLE, DESCRIPTION
+from .structured import structured_movie, is_enabled, field
+from .utils import parse_duration, SeenStore
 from ..items import Review, Movie, Plot, Reviews
 
 
@@ -21,6 +25,72 @@ class IMDBSpider(scrapy.Spider):
 
     REVIEWS_LIMIT = 50  # The API returns at most 1000 reviews
 
+    seen: SeenStore = None  # movies crawled by the previous crawls, if IMDB_SEEN_PATH is set
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.movies_list = []  # the movies of the top list not visited yet, filled by parse_movie_list
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+
+        seen_path = crawler.settings.get("IMDB_SEEN_PATH")
+        if seen_path:
+            recrawl_after = crawler.settings.getfloat("IMDB_RECRAWL_AFTER_DAYS", 30) * 24 * 60 * 60
+            spider.seen = SeenStore(seen_path, recrawl_after)
+            if crawler.settings.getbool("IMDB_SEEN_FROM_DATABASE") and crawler.settings.getbool("USE_POSTGRESQL"):
+                spider.seed_seen()
+            crawler.signals.connect(spider.close_seen, signal=signals.spider_closed)
+        return spider
+
+    def seed_seen(self):
+        """
+        Add to the seen movies the IMDb movies already stored in the database, with the time they were last crawled;
+        the movies never marked as crawled are left out, so they are crawled again.
+        """
+        import time
+        from dotenv import load_dotenv
+        from ..utils import setup_postgres_connection
+
+        load_dotenv("../.env")
+        connection, cur = setup_postgres_connection()
+        try:
+            # last_crawled is a local time of the database (timestamp without time zone): the age of the movies is
+            # computed there, so that the time they were seen does not depend on the time zone of the database
+            cur.execute("""
+                SELECT movie_source_uid, EXTRACT(EPOCH FROM LOCALTIMESTAMP - last_crawled) FROM data_sources
+                WHERE name = 'IMDb' AND movie_source_uid IS NOT NULL AND last_crawled IS NOT NULL
+                """)
+            now = time.time()
+            self.seen.add_many((movie_id, now - float(age)) for movie_id, age in cur)
+            self.seen.commit()
+        finally:
+            connection.close()
+        logging.info(f"{len(self.seen)} movies already seen")
+
+    def close_seen(self, spider):
+        self.seen.close()
+
+    def is_fresh(self, movie_url: str) -> bool:
+        """
+        :param movie_url: the URL of the movie
+        :return: True if the movie was crawled recently (by this crawl or by a previous one), so it can be skipped
+        """
+        return self.seen is not None and self.seen.is_fresh(self.get_movie_id(movie_url))
+
+    def pop_random_movie(self) -> str or None:
+        """
+        Remove from `movies_list` the next movie that was not crawled recently.
+
+        :return: the URL of the movie, or None if there is no such movie
+        """
+        while len(self.movies_list) > 0:
+            movie_url = self.movies_list.pop()
+            if not self.is_fresh(movie_url):
+                return movie_url
+        return None
+
     def get_movie_id(self, url: str) -> str:
         """
         Given a movie URL, return the movie id.
@@ -74,14 +144,14 @@ class IMDBSpider(scrapy.Spider):
         :param extracted: the number of reviews extracted so far for the current movie
         :return: a generator of reviews for the movie
         """
-        reviews = response.css("div.lister-item")
+        root = document(response)
+        reviews = IMDb.REVIEW(root)
         reviews_list = []
         for review in reviews:
-            review_id = review.xpath("./@data-review-id").get()
-            score = review.xpath(
-                ".//div[@class='ipl-ratings-bar']//span[@class='rating-other-user-rating']//span//text()").get()
-            title = review.xpath(".//a[@class='title']/text()").get().strip()
-            text = '\n'.join(review.xpath(".//div[@class='text show-more__control']/text()").getall())
+            review_id = first(IMDb.REVIEW_ID(review))
+            score = first(IMDb.REVIEW_SCORE(review))
+            title = first(IMDb.REVIEW_TITLE(review)).strip()
+            text = '\n'.join(IMDb.REVIEW_TEXT(review))
             if score and text:
                 extracted += 1
                 reviews_list.append(
@@ -91,27 +161,26 @@ class IMDBSpider(scrapy.Spider):
                     break
         if len(reviews_list) > 0:
             yield Reviews(reviews=reviews_list)
-        next_datakey = response.xpath("//div[@class='load-more-data']/@data-key")
+        next_datakey = first(IMDb.REVIEWS_NEXT_KEY(root))
 
         current_movie_id = self.get_movie_id(response.url)
         if extracted < self.REVIEWS_LIMIT and next_datakey:
-            next_datakey = next_datakey.get()
             next_url = self.reviews_api_url(f"tt{current_movie_id}", next_datakey)
             yield response.follow(next_url, callback=self.extract_reviews, cb_kwargs={"extracted": extracted})
 
     def parse_metadata(self, response: Response) -> Movie.Metadata:
-        url = response.xpath("//link[@rel='canonical']/@href").get()
-        image_url = response.xpath("//meta[@property='og:image']/@content").get()
-        page_title = response.xpath("//title/text()").get()
+        root = document(response)
+        url = first(CANONICAL_URL(root))
+        image_url = first(IMAGE_URL(root))
+        page_title = first(PAGE_TITLE(root))
         return Movie.Metadata(url=url, image_url=image_url, page_title=page_title, source_name="IMDb")
 
     def parse_plot(self, response: Response, movie_id: str):
-        plot = response.xpath(
-            "//div[@data-testid='sub-section-synopsis']//div[@class='ipc-html-content-inner-div']//text()").getall()
+        root = document(response)
+        plot = all_of(IMDb.SYNOPSIS, IMDb.SYNOPSIS_SECTION(root))
 
         if not plot:
-            summaries = response.xpath(
-                "//div[@data-testid='sub-section-summaries']//li//div[@class='ipc-html-content-inner-div']/text()").getall()
+            summaries = all_of(IMDb.SUMMARY, IMDb.SUMMARIES_SECTION(root))
             if not summaries or len(summaries) == 0:
                 plot = ""
             else:
@@ -119,6 +188,15 @@ class IMDBSpider(scrapy.Spider):
 
         yield Plot(movie_id=movie_id, text=''.join(plot))
 
+    def plot_failed(self, failure):
+        """
+        Called when the plot page of a movie cannot be downloaded: an empty plot is yielded, so that `MergePipeline`
+        emits the movie right away instead of waiting for the plot.
+        """
+        movie_id = failure.request.cb_kwargs["movie_id"]
+        logging.error(f"Error while downloading the plot of movie {movie_id}: {failure.value}")
+        yield Plot(movie_id=movie_id, text="")
+
     def parse_movie(self, response: Response, depth: int = 0) -> Generator[Any, None, None]:
         """
         Parse a movie page, yielding a `Movie` for the movie.
@@ -129,42 +207,54 @@ class IMDBSpider(scrapy.Spider):
         :return: a `Movie` for the movie
         """
         movie_id = self.get_movie_id(response.url)
-        page_type = response.xpath("//meta[@property='og:type']/@content")
-
-        similar_movies = response.xpath("//div[@data-testid='shoveler-items-container']").css(
-            "a.ipc-poster-card__title--clickable::attr(href)").getall()
+        root = document(response)
+        # the fields missing from the structured data (or all, if disabled) are extracted from the DOM; a page with a
+        # JSON-LD Movie is a movie page, without querying the <head>
+        structured = structured_movie(root) if is_enabled(self) else None
+        is_movie = structured is not None or first(PAGE_TYPE(root)) == "video.movie"
+        structured = structured or {}
+
+        # the links carry a tracking query (?ref_=...) that changes with the page linking the movie: without it, the
+        # same movie reached from several movies is requested (and its plot and reviews scheduled) only once
+        similar_movies = [url.split("?")[0]
+                          for url in all_of(IMDb.SIMILAR_MOVIE_URL, IMDb.SIMILAR_MOVIES_SECTION(root))]
         shuffle(similar_movies)  # increase randomness
+        similar_movies = [url for url in similar_movies if not self.is_fresh(self._DOMAIN + url)]
 
-        if page_type and page_type.get() == "video.movie":
+        if is_movie:
             try:
-                title = response.css("h1 ::text").get()
-                description = response.xpath("//meta[@name='description']/@content").get()
+                title = first_of(IMDb.TEXT, IMDb.TITLE_HEADER(root))
+                description = first(DESCRIPTION(root))
 
                 # release_year_str is the first a child of the ul adjacent to the h1
-                release_year_str = response.xpath("//h1/following-sibling::ul//a/text()").get()
+                release_year = field(structured, "release",
+                                     lambda: int(first_of(IMDb.RELEASE_YEAR, IMDb.TITLE_HEADER(root))))
 
-                release_year = int(release_year_str)
+                duration = field(structured, "duration", lambda: parse_duration(
+                    ''.join(all_of(IMDb.TECH_SPEC, IMDb.TECH_SPECS_SECTION(root)))))
 
-                duration_str = ''.join(response.xpath("//section[@cel_widget_id='StaticFeature_TechSpecs']").css(
-                    "div.ipc-metadata-list-item__content-container::text").getall())
-                duration = parse_duration(duration_str)
-
-                genres = response.xpath("//div[@data-testid='genres']").css("a.ipc-chip span::text").getall()
-                score = float(response.css("span.cMEQkK::text").get() or float('nan'))
+                genres = field(structured, "genres", lambda: all_of(IMDb.GENRE, IMDb.GENRES_SECTION(root)))
+                score = field(structured, "score", lambda: float(first(IMDb.SCORE(root)) or float('nan')))
 
                 # get all the a text of the first li of the first ul with class ipc-metadata-list
-                directors = response.css("ul.ipc-metadata-list")[0].css("li")[0].css("a::text").getall()
-                actors = response.css("a.gCQkeh::text").getall()
+                directors = field(structured, "directors", lambda: IMDb.LINK_TEXT(
+                    IMDb.FIRST_ITEM(IMDb.FIRST_METADATA_LIST(root)[0])[0]))
+                # the structured data lists only the main actors
+                actors = IMDb.ACTORS(root)
 
                 metadata = self.parse_metadata(response)
 
                 logging.info(f"Movie {movie_id} parsed (depth {depth})")
 
+                if self.seen is not None:
+                    self.seen.mark(movie_id)
+
                 yield Movie(movie_id=movie_id, title=title, description=description, release=release_year,
                             duration=duration, genres=genres, score=score, critic_score=score, directors=directors,
                             actors=actors, metadata=metadata, wait_for_plot=True)
 
                 yield response.follow(f"{self._DOMAIN}/title/tt{movie_id}/plotsummary/", callback=self.parse_plot,
+                                      errback=self.plot_failed,
                                       priority=2,  # highest priority: the plot is the most important information now
                                       cb_kwargs={"movie_id": movie_id})
 
@@ -179,11 +269,12 @@ class IMDBSpider(scrapy.Spider):
 
         # Both movie information and plot were scraped, go to the next movie
         if self.RANDOM_WALK:
-            if (len(self.movies_list) > 0  # There is actually a race condition here, but it should be fine
-                    and random() < self.RANDOM_WALK_PROBABILITY):
-                yield response.follow(self.movies_list.pop(), callback=self.parse_movie, priority=1,
-                                      cb_kwargs={"depth": 0})
-                logging.info("Following random link instead of the next one")
+            # when all the similar movies were already crawled, the walk would stop here: jump to a random movie
+            if not similar_movies or random() < self.RANDOM_WALK_PROBABILITY:
+                random_movie = self.pop_random_movie()  # There is actually a race condition here, but it should be fine
+                if random_movie is not None:
+                    yield response.follow(random_movie, callback=self.parse_movie, priority=1, cb_kwargs={"depth": 0})
+                    logging.info("Following random link instead of the next one")
 
         for movie_relative_url in similar_movies:
             logging.info(f"Following similar movie {movie_relative_url}")
@@ -199,15 +290,19 @@ class IMDBSpider(scrapy.Spider):
             # if the random walk is enabled, only the first movie is parsed; after this, there is a probability
             # (1 - RANDOM_WALK_PROBABILITY) of exploring the similar movies of the current movie, and a probability
             # RANDOM_WALK_PROBABILITY of following a random link in self.movies_list.
-            self.movies_list = [self._DOMAIN + movie_url for movie_url in reversed(movie_urls)]
+            self.movies_list = [self._DOMAIN + movie_url.split("?")[0] for movie_url in reversed(movie_urls)]
             # suffle the movies list
-            yield response.follow(self.movies_list.pop(), callback=self.parse_movie, priority=1, cb_kwargs={"depth": 0})
+            first_movie = self.pop_random_movie()
+            if first_movie is not None:
+                yield response.follow(first_movie, callback=self.parse_movie, priority=1, cb_kwargs={"depth": 0})
             return
 
         for relative_url in movie_urls:
             # url: /title/tt0000001/
             relative_url = relative_url.split("?")[0][:-1]
             url = self._DOMAIN + relative_url
+            if self.is_fresh(url + "/"):
+                continue
             yield response.follow(url + "/", callback=self.parse_movie, priority=1, cb_kwargs={"depth": 0})
 
         # no next page: the loading is with javascript  # if not ab:  #     next_page = self._DOMAIN + response.css("a.lister-page-next::attr(href)").get()  # else:  #     next_page = self.start_urls[0] + "&start=" + str(start + 250)  # if next_page:  #     if self._DOMAIN not in next_page:  #         next_page = self._DOMAIN + next_page  #     yield response.follow(next_page, callback=self.parse_movie_list, cb_kwargs={"start": start + 250})
@@ -5,6 +5,8 @@ from urllib.parse import urlparse, parse_qs
 import scrapy
 from scrapy.http import Response, Request
 
+from .extractors import Metacritic, document, first, first_of, all_of
+from .extractors import CANONICAL_URL, IMAGE_URL, PAGE_TITLE, DESCRIPTION
 from .utils import parse_duration, try_float
 from ..items import Movie, Review
 
@@ -74,7 +76,7 @@ class MetacriticSpider(scrapy.Spider):
         """
         Parse a browse page, yielding a `Request` for each movie in the page and a `Request` for the next page.
         """
-        movie_urls = response.xpath("//div[@class='c-productListings']//a/@href").extract()
+        movie_urls = Metacritic.MOVIE_URL(document(response))
         for movie_url in movie_urls:
             yield response.follow(f"{self.DOMAIN}{movie_url}", callback=self.parse_movie, priority=1)
 
@@ -82,9 +84,10 @@ class MetacriticSpider(scrapy.Spider):
             yield self.next_page(response)
 
     def parse_metadata(self, response: Response) -> Movie.Metadata:
-        url = response.xpath("//link[@rel='canonical']/@href").get()
-        image_url = response.xpath("//meta[@property='og:image']/@content").get()
-        page_title = response.xpath("//title/text()").get()
+        root = document(response)
+        url = first(CANONICAL_URL(root))
+        image_url = first(IMAGE_URL(root))
+        page_title = first(PAGE_TITLE(root))
         return Movie.Metadata(url=url, image_url=image_url, page_title=page_title, source_name="Metacritic")
 
     def parse_movie(self, response: Response):
@@ -96,37 +99,35 @@ class MetacriticSpider(scrapy.Spider):
         """
 
         movie_id = self.get_movie_id(response.url)
-        title = response.css("div.c-productHero_title").xpath("./div/text()").get().strip()
+        root = document(response)
+        title = first(Metacritic.TITLE(root)).strip()
 
-        description = response.xpath("//meta[@name='description']/@content").get()
+        description = first(DESCRIPTION(root))
         plot = ""  # avoid duplicate plot/description
 
-        release_year_str = response.css("div.c-heroVariant_headerInfo")[0].css("li.c-heroMetadata_item").xpath(
-            ".//span/text()").get().strip()
+        header_info = Metacritic.HEADER_INFO(root)[0]
+        release_year_str = first_of(Metacritic.SPAN_TEXT, Metacritic.HEADER_METADATA_ITEM(header_info)).strip()
         release_year = int(release_year_str)
 
-        duration_str = response.xpath(
-            "//div[contains(@class, 'c-movieDetails_sectionContainer')]//span[contains(text(), 'Duration')]/following-sibling::span/text()").get()
+        duration_str = first_of(Metacritic.DURATION, Metacritic.DETAILS_SECTION(root))
         duration = parse_duration(duration_str)
 
-        genres = response.xpath("//ul[contains(@class, 'c-genreList')]//span/text()")
-        genres = list(set(genres.get().strip() for genres in genres))
+        genres = Metacritic.GENRES(root)
+        genres = list(set(genre.strip() for genre in genres))
 
-        critic_score_str = response.xpath(
-            "//div[contains(@class, 'c-siteReviewScore_background-critic_medium')]//span/text()").get()
+        critic_score_str = first(Metacritic.CRITIC_SCORE(root))
         critic_score = try_float(critic_score_str) / 10
 
-        user_score_str = response.xpath(
-            "//div[contains(@class, 'c-siteReviewScore_background-user')]//span/text()").get()
+        user_score_str = first(Metacritic.USER_SCORE(root))
         user_score = try_float(user_score_str)
 
-        directors = response.css("div.c-productDetails_staff_directors")[0].css("a::text").getall()
+        directors = Metacritic.LINK_TEXT(Metacritic.DIRECTORS_SECTION(root)[0])
         directors = [director.strip() for director in directors]
         # directors could contain "," at the end of the name, remove it
         directors = [director[:-1] if director.endswith(",") else director for director in directors]
 
-        actors = response.xpath("//div[contains(@data-cy, 'cast-')]//h3/text()")
-        actors = list(set(actors.get().strip() for actors in actors))
+        actors = Metacritic.ACTORS(root)
+        actors = list(set(actor.strip() for actor in actors))
 
         metadata = self.parse_metadata(response)
 
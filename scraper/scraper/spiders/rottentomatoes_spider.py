@@ -4,6 +4,9 @@ from typing import Any
 import scrapy
 from scrapy.http import Response
 
+from .extractors import RottenTomatoes, document, first, first_of, all_of
+from .extractors import PAGE_TYPE, CANONICAL_URL, IMAGE_URL, PAGE_TITLE, OG_DESCRIPTION
+from .structured import structured_movie, is_enabled, field, complete
 from .utils import parse_duration
 from ..items import Movie
 
@@ -17,7 +20,7 @@ class RottenTomatoesSpider(scrapy.Spider):
     start_urls = [PAGE_LIST_URL]
 
     def parse_scores(self, response: Response):
-        json_str = response.xpath("//script[@id='scoreDetails']/text()").get()
+        json_str = first(RottenTomatoes.SCORE_DETAILS(document(response)))
         scores_json = json.loads(json_str)
         scoreboard = scores_json["scoreboard"]
         if not scoreboard or len(scoreboard) == 0:
@@ -33,43 +36,60 @@ class RottenTomatoesSpider(scrapy.Spider):
 
         return critic_score, audience_score
 
-    def parse_movie(self, response: Response):
-        page_type = response.xpath("//meta[@property='og:type']/@content")
-        if page_type.get() == "video.movie":
-            movie_id = response.url.split("/")[4]
-            title = response.css("h1.title::text").get().strip()
-            description = response.xpath("//meta[@property='og:description']/@content").get().strip()
+    @staticmethod
+    def parse_release_year(root) -> int:
+        release_year_str = first(RottenTomatoes.RELEASE_INFO(root)).split(",")[0].strip()
+        return int(release_year_str)  # if the year is not an int it's something else, i.e. let it throw
+
+    @staticmethod
+    def parse_genres(movie_info_selector) -> list[str]:
+        genre = first_of(RottenTomatoes.TEXT, movie_info_selector("Genre:"))
+        return [g.strip() for g in genre.split(",")]
 
-            movie_info = response.xpath("//ul[@id='info']")
-            movie_info_selector = lambda title: movie_info.xpath(f"//li[contains(.//b/text(), '{title}')]//span")
+    @staticmethod
+    def parse_duration(movie_info_selector) -> int:
+        duration_str = first_of(RottenTomatoes.TIME_TEXT, movie_info_selector("Runtime:"))
+        # parse_duration expects a space between numbers and units
+        duration_str = duration_str.replace("m", " m").replace("h", " h")
+        return parse_duration(duration_str)
 
-            release_year_str = response.xpath("//p[@slot='info']/text()").get().split(",")[0].strip()
-            release_year = int(release_year_str)  # if the year is not an int it's something else, i.e. let it throw
+    def parse_movie(self, response: Response):
+        root = document(response)
+        # the fields missing from the structured data (or all, if disabled) are extracted from the DOM; a page with a
+        # JSON-LD Movie is a movie page, without querying the <head>
+        structured = structured_movie(root) if is_enabled(self) else None
+        if structured is not None or first(PAGE_TYPE(root)) == "video.movie":
+            structured = structured or {}
+            movie_id = response.url.split("/")[4]
 
-            genre = movie_info_selector("Genre:").xpath("./text()").get()
-            genre = [g.strip() for g in genre.split(",")]
+            title = first(RottenTomatoes.TITLE(root)).strip()
+            description = first(OG_DESCRIPTION(root)).strip()
 
-            duration_str = movie_info_selector("Runtime:").xpath("./time/text()").get()
-            # parse_duration expects a space between numbers and units
-            duration_str = duration_str.replace("m", " m").replace("h", " h")
-            duration = parse_duration(duration_str)
+            # the entries are searched only inside the info section, which is not needed if they are all structured
+            movie_info = [] if complete(structured, ("genres", "duration", "directors")) \
+                else RottenTomatoes.INFO_SECTION(root)
+            movie_info_selector = lambda label: [value for section in movie_info
+                                                 for value in RottenTomatoes.INFO_VALUES(section, label=label)]
 
-            directors = movie_info_selector("Director:").xpath("./a/text()").getall()
+            release_year = field(structured, "release", lambda: self.parse_release_year(root))
+            genre = field(structured, "genres", lambda: self.parse_genres(movie_info_selector))
+            duration = field(structured, "duration", lambda: self.parse_duration(movie_info_selector))
+            directors = field(structured, "directors",
+                              lambda: all_of(RottenTomatoes.LINK_TEXT, movie_info_selector("Director:")))
 
             critic_score, audience_score = self.parse_scores(response)
 
-            metadata = Movie.Metadata(url=response.xpath("//link[@rel='canonical']/@href").get(),
-                                      image_url=response.xpath("//meta[@property='og:image']/@content").get(),
-                                      page_title=response.css("title::text").get().strip(),
+            metadata = Movie.Metadata(url=first(CANONICAL_URL(root)),
+                                      image_url=first(IMAGE_URL(root)),
+                                      page_title=first(PAGE_TITLE(root)).strip(),
                                       source_name="Rotten Tomatoes")
 
-            plot = response.xpath("//p[@data-qa='movie-info-synopsis']/text()").get().strip()
+            plot = first(RottenTomatoes.SYNOPSIS(root)).strip()
             if plot == description:
                 plot = ""  # if the plot is the same as the description, it's not a plot
 
             # get the div that contains the class .cast-and-crew-item
-            actors = response.xpath("//div[contains(@class, 'cast-and-crew-item')]//a/p/text()").getall()
-            actors = [a.strip() for a in actors]
+            actors = field(structured, "actors", lambda: [a.strip() for a in RottenTomatoes.ACTORS(root)])
 
             yield Movie(movie_id=movie_id, title=title, description=description, release=release_year,
                         duration=duration, genres=genre, score=audience_score, critic_score=critic_score,
@@ -0,0 +1,147 @@
+## STRUCTURED DATA
+#
+# IMDb and Rotten Tomatoes describe the movie of the page with a JSON-LD block
+# (<script type="application/ld+json">, see https://schema.org/Movie), decoded with `json`.
+#
+# The spiders use it when STRUCTURED_DATA_EXTRACTION is enabled: a page is a movie page if it has a JSON-LD Movie, and
+# the DOM is queried only for the fields missing from it. The title and the description are always taken from the DOM:
+# in the block they can differ from the ones shown on the page (e.g. IMDb gives the original title of the movie there),
+# and the title identifies the movie across the websites. The document is still parsed, since the links to the similar
+# movies (IMDb) and the synopsis and audience score (Rotten Tomatoes) are only in the DOM, so the block is read from it
+# instead of searching the text of the page again.
+
+import html
+import json
+import re
+
+from .extractors import xpath
+
+JSON_LD = xpath("/html/head/script[@type='application/ld+json']/text()"
+                " | /html/body/script[@type='application/ld+json']/text()")
+ISO_DURATION = re.compile(r"^PT(?:(\d+)H)?(?:(\d+)M)?")
+
+
+def is_enabled(spider) -> bool:
+    """
+    :return: True if the spider should extract the movie from the structured data of the page
+    """
+    settings = getattr(spider, "settings", None)
+    return settings is not None and settings.getbool("STRUCTURED_DATA_EXTRACTION")
+
+
+def json_ld(root, schema_type: str = "Movie") -> dict or None:
+    """
+    Find the JSON-LD object of a given type in a page.
+
+    :param root: the lxml tree of the page (see `extractors.document`)
+    :param schema_type: the type of the object (its `@type`)
+    :return: the object, or None if the page does not contain it
+    """
+    for block in JSON_LD(root):
+        try:
+            data = json.loads(block)
+        except ValueError:
+            continue
+
+        candidates = data if isinstance(data, list) else data.get("@graph", [data])
+        for candidate in candidates:
+            types = candidate.get("@type") if isinstance(candidate, dict) else None
+            if types == schema_type or (isinstance(types, list) and schema_type in types):
+                return candidate
+    return None
+
+
+def unescape(value):
+    """
+    The strings in the JSON-LD blocks can contain HTML entities (e.g. `&apos;`): decode them.
+    """
+    if isinstance(value, str):
+        return html.unescape(value)
+    if isinstance(value, list):
+        return [unescape(v) for v in value]
+    return value
+
+
+def names(value) -> list[str]:
+    """
+    :param value: a Person (or Organization), or a list of them
+    :return: the names
+    """
+    if isinstance(value, dict):
+        value = [value]
+    return [unescape(entity["name"]).strip() for entity in value or []
+            if isinstance(entity, dict) and entity.get("name")]
+
+
+def parse_iso_duration(duration: str) -> int or None:
+    """
+    :param duration: an ISO 8601 duration, e.g. "PT2H22M"
+    :return: the duration in minutes, or None if it cannot be parsed
+    """
+    match = ISO_DURATION.match(duration or "")
+    if not match or not any(match.groups()):
+        return None
+    hours, minutes = match.groups()
+    return int(hours or 0) * 60 + int(minutes or 0)
+
+
+def movie_fields(data: dict) -> dict:
+    """
+    Extract the fields of a `Movie` from a JSON-LD Movie object.
+
+    :return: the fields found in the object (release, duration, genres, score, directors, actors); the missing fields
+             are not in the dictionary
+    """
+    fields = {}
+    release = str(data.get("datePublished") or data.get("dateCreated") or "")[:4]
+    if release.isdigit():
+        fields["release"] = int(release)
+
+    duration = parse_iso_duration(data.get("duration"))
+    if duration is not None:
+        fields["duration"] = duration
+
+    genres = data.get("genre")
+    if genres:
+        fields["genres"] = [unescape(genre).strip() for genre in ([genres] if isinstance(genres, str) else genres)]
+
+    rating = (data.get("aggregateRating") or {}).get("ratingValue")
+    if rating is not None:
+        try:
+            fields["score"] = float(rating)
+        except (TypeError, ValueError):
+            pass
+
+    directors = names(data.get("director"))
+    if directors:
+        fields["directors"] = directors
+    actors = names(data.get("actor"))
+    if actors:
+        fields["actors"] = actors
+    return fields
+
+
+def structured_movie(root) -> dict or None:
+    """
+    :param root: the lxml tree of the page (see `extractors.document`)
+    :return: the fields of the movie found in the JSON-LD block of the page, or None if the page has no JSON-LD Movie
+    """
+    data = json_ld(root)
+    return movie_fields(data) if data is not None else None
+
+
+def complete(fields: dict, names: tuple) -> bool:
+    """
+    :return: True if all the given fields were found in the structured data, i.e. their section of the DOM is not needed
+    """
+    return all(name in fields for name in names)
+
+
+def field(fields: dict, name: str, from_dom):
+    """
+    :param fields: the fields found in the structured data
+    :param name: the name of the field
+    :param from_dom: a function extracting the field from the DOM, called only if the field is missing
+    :return: the value of the field
+    """
+    return fields[name] if name in fields else from_dom()
@@ -62,3 +62,63 @@ class AtomicId:
         with self._lock:
             self._id += 1
             return self._id
+
+
+class SeenStore:
+    """
+    Persistent set (sqlite) of the movies already crawled, with the time they were crawled.
+
+    Unlike the Scrapy dupefilter, which only lives as long as a crawl, the store is kept between crawls, so that the
+    movies crawled recently are not downloaded again.
+    """
+
+    def __init__(self, path: str, recrawl_after: float, commit_every: int = 100):
+        """
+        :param path: the path of the sqlite file
+        :param recrawl_after: the number of seconds after which a movie can be crawled again
+        :param commit_every: the number of movies marked as seen after which the changes are written to disk
+        """
+        import sqlite3
+        self.recrawl_after = recrawl_after
+        self.commit_every = commit_every
+        self._uncommitted = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS seen (movie_id TEXT PRIMARY KEY, seen_at REAL NOT NULL)")
+        self.connection.commit()
+
+    def is_fresh(self, movie_id: str) -> bool:
+        """
+        :return: True if the movie was crawled less than `recrawl_after` seconds ago
+        """
+        import time
+        row = self.connection.execute("SELECT seen_at FROM seen WHERE movie_id = ?", (movie_id,)).fetchone()
+        return row is not None and row[0] > time.time() - self.recrawl_after
+
+    def mark(self, movie_id: str, seen_at: float = None):
+        import time
+        self.add_many([(movie_id, seen_at or time.time())])
+
+    def add_many(self, movies):
+        """
+        Mark several movies as seen, keeping the most recent time for the movies already in the store.
+
+        :param movies: an iterable of (movie id, time it was crawled as a UNIX timestamp)
+        """
+        cursor = self.connection.executemany("""
+            INSERT INTO seen (movie_id, seen_at) VALUES (?, ?)
+            ON CONFLICT (movie_id) DO UPDATE SET seen_at = MAX(seen_at, excluded.seen_at)
+            """, movies)
+        self._uncommitted += cursor.rowcount
+        if self._uncommitted >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        self.connection.commit()
+        self._uncommitted = 0
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+
+    def close(self):
+        self.commit()
+        self.connection.close()
@@ -0,0 +1,235 @@
+## SYNTHETIC FIXTURES
+#
+# Pages with the structure of the IMDb, Metacritic and Rotten Tomatoes pages parsed by the spiders (the elements and
+# attributes targeted by `spiders/extractors.py`, and the JSON-LD block of IMDb and Rotten Tomatoes), padded with
+# unrelated markup to the size of the real pages. They are generated deterministically, so the items they produce can
+# be compared with the golden files committed in `fixtures/synthetic` without recording pages from the websites:
+#
+#   scrapy parsebench --synthetic --check-golden
+#
+# They complement the pages recorded with FixtureRecorderMiddleware, which remain the reference for the real websites.
+
+import html
+import json
+import random
+
+GENRES = ["Drama", "Crime", "Action", "Comedy", "Sci-Fi", "Thriller"]
+NAMES = ["Frank Darabont", "Francis Ford Coppola", "Christopher Nolan", "Lana Wachowski", "Lilly Wachowski",
+         "Tim Robbins", "Morgan Freeman", "Bob Gunton", "Al Pacino", "Marlon Brando", "Christian Bale", "O'Neil Smith"]
+TITLES = ["The Shawshank Redemption", "The Godfather", "The Dark Knight", "The Matrix", "Amélie & Co."]
+
+
+def filler(n: int) -> str:
+    """
+    :return: `n` blocks of navigation-like markup, not matched by the queries of the spiders
+    """
+    return "\n".join(f'<div class="nav-item sc-{i % 97}"><a href="/nav/{i}?ref_=nv_{i}">Link {i}</a>'
+                     f'<span class="label">Some text {i} for the navigation</span><ul><li>a</li><li>b</li></ul></div>'
+                     for i in range(n))
+
+
+def page_data_script(n: int) -> str:
+    """
+    :return: a large JSON script, as the page data embedded by the websites
+    """
+    data = {"props": {"items": [{"id": i, "text": "lorem ipsum dolor sit amet " * 3, "tags": ["a", "b", "c"]}
+                                for i in range(n)]}}
+    return f'<script id="__NEXT_DATA__" type="application/json">{json.dumps(data)}</script>'
+
+
+def synthetic_movie(i: int, rng: random.Random) -> dict:
+    return {
+        "id": f"{111161 + i * 1000:07d}",
+        "title": TITLES[i % len(TITLES)],
+        # as on the real pages, the JSON-LD block of IMDb can have the original title instead of the displayed one
+        "original_title": f"{TITLES[i % len(TITLES)]} (original)" if i % 3 == 1 else TITLES[i % len(TITLES)],
+        "year": 1990 + i,
+        "hours": 1 + i % 2,
+        "minutes": 10 + i * 7 % 50,
+        "genres": rng.sample(GENRES, 1 + i % 3),
+        "score": round(rng.uniform(5, 9.5), 1) if i % 4 != 3 else None,  # some movies have no score
+        "directors": NAMES[i % 3: i % 3 + 1 + (i % 2)],
+        "actors": rng.sample(NAMES[5:], 4),
+        "description": f"Description of movie {i}: two imprisoned men bond over a number of years & find solace.",
+        "synopsis": i % 3 != 2,  # the others only have summaries
+    }
+
+
+def imdb_movie_page(m: dict) -> str:
+    ld = {"@context": "https://schema.org", "@type": "Movie", "name": m["original_title"],
+          "description": m["description"], "datePublished": f"{m['year']}-09-23",
+          "duration": f"PT{m['hours']}H{m['minutes']}M", "genre": m["genres"],
+          "director": [{"@type": "Person", "name": d} for d in m["directors"]],
+          "actor": [{"@type": "Person", "name": a} for a in m["actors"]]}
+    score = ""
+    if m["score"] is not None:
+        ld["aggregateRating"] = {"@type": "AggregateRating", "ratingValue": m["score"]}
+        score = f'<span class="sc-bde20123-1 cMEQkK">{m["score"]}</span>'
+    genres = "".join(f'<a class="ipc-chip ipc-chip--on-baseAlt"><span class="ipc-chip__text">{g}</span></a>'
+                     for g in m["genres"])
+    directors = "".join(f'<a href="/name/nm{k}">{html.escape(d)}</a>' for k, d in enumerate(m["directors"]))
+    actors = "".join(f'<div><a class="sc-bfec09a1-1 gCQkeh" href="/name/nm9{k}">{html.escape(a)}</a></div>'
+                     for k, a in enumerate(m["actors"]))
+    similar = "".join(f'<div class="ipc-poster-card"><a class="ipc-poster-card__title '
+                      f'ipc-poster-card__title--clickable" href="/title/tt{9000000 + k:07d}/?ref_=tt_sims_tt_t_{k}">'
+                      f'Similar {k}</a></div>' for k in range(12))
+    return f"""<!DOCTYPE html><html lang="en"><head>
+<meta charset="utf-8"/>
+<title>{html.escape(m['title'])} ({m['year']}) - IMDb</title>
+<meta property="og:type" content="video.movie"/>
+<meta property="og:image" content="https://m.media-amazon.com/images/M/{m['id']}.jpg"/>
+<meta name="description" content="{html.escape(m['description'])}"/>
+<link rel="canonical" href="https://www.imdb.com/title/tt{m['id']}/"/>
+<script type="application/ld+json">{json.dumps(ld)}</script>
+</head><body>
+{filler(1500)}
+<section class="hero"><h1 data-testid="hero__pageTitle"><span>{html.escape(m['title'])}</span></h1>
+<ul class="ipc-inline-list"><li><a href="/title/tt{m['id']}/releaseinfo">{m['year']}</a></li><li><a>R</a></li></ul>
+</section>
+<div data-testid="hero-rating-bar__aggregate-rating__score">{score}<span>/10</span></div>
+<div data-testid="genres">{genres}</div>
+<ul class="ipc-metadata-list ipc-metadata-list--dividers-all">
+<li class="ipc-metadata-list__item"><span>Director</span><div>{directors}</div></li>
+<li class="ipc-metadata-list__item"><span>Writers</span><div><a>Stephen King</a></div></li></ul>
+<div data-testid="title-cast">{actors}</div>
+<section cel_widget_id="StaticFeature_TechSpecs"><ul class="ipc-metadata-list"><li><span>Runtime</span>
+<div class="ipc-metadata-list-item__content-container">{m['hours']}<!-- --> <!-- -->hours<!-- --> <!-- -->{m['minutes']}<!-- --> <!-- -->minutes</div>
+</li></ul></section>
+<section><div data-testid="shoveler-items-container">{similar}</div></section>
+{filler(1500)}
+{page_data_script(1500)}
+</body></html>"""
+
+
+def imdb_plot_page(m: dict) -> str:
+    if m["synopsis"]:
+        plot = (f'<div data-testid="sub-section-synopsis"><ul><li><div class="ipc-html-content ipc-html-content--base">'
+                f'<div class="ipc-html-content-inner-div">The synopsis of {html.escape(m["title"])}. <i>Andy</i> '
+                f'escapes &amp; lives.</div></div></li></ul></div>')
+    else:
+        plot = ('<div data-testid="sub-section-summaries"><ul>' +
+                "".join(f'<li><div class="ipc-html-content ipc-html-content--base">'
+                        f'<div class="ipc-html-content-inner-div">Summary {k} of the movie {"with more words " * k}'
+                        f'</div></div></li>' for k in range(4)) +
+                '</ul></div>')
+    return f"<html><head><title>Plot</title></head><body>{filler(800)}{plot}{filler(800)}</body></html>"
+
+
+def imdb_reviews_page(m: dict) -> str:
+    reviews = []
+    for k in range(10):
+        rating = ""
+        if k % 5:
+            rating = (f'<div class="ipl-ratings-bar"><span class="rating-other-user-rating"><svg></svg>'
+                      f'<span>{1 + k % 10}</span><span class="point-scale">/10</span></span></div>')
+        reviews.append(f'<div class="lister-item mode-detail imdb-user-review collapsable" '
+                       f'data-review-id="rw{m["id"]}{k}"><div class="review-container"><div class="lister-item-content">'
+                       f'{rating}<a href="/review/rw{k}/" class="title"> Review title {k}\n</a>'
+                       f'<div class="content"><div class="text show-more__control">Line one of review {k}.<br/>'
+                       f'Line two.</div></div></div></div></div>')
+    return (f'<html><body><div class="lister-list">{"".join(reviews)}</div>'
+            f'<div class="load-more-data" data-key="g4wp7cbkry"></div></body></html>')
+
+
+def metacritic_movie_page(m: dict, slug: str) -> str:
+    genres = "".join(f'<li class="c-genreList_item"><a><span class="c-globalButton_label"> {g} </span></a></li>'
+                     for g in m["genres"])
+    directors = "".join(f'<a href="/person/{k}"> {html.escape(d)}{"," if k < len(m["directors"]) - 1 else ""} </a>'
+                        for k, d in enumerate(m["directors"]))
+    actors = "".join(f'<div data-cy="cast-{k}"><h3 class="c-globalPersonCard_name"> {html.escape(a)} </h3></div>'
+                     for k, a in enumerate(m["actors"]))
+    return f"""<!DOCTYPE html><html><head>
+<title>{html.escape(m['title'])} reviews - Metacritic</title>
+<meta property="og:type" content="video.movie"/>
+<meta name="description" content="{html.escape(m['description'])}"/>
+<meta property="og:image" content="https://www.metacritic.com/a/img/{m['id']}.jpg"/>
+<link rel="canonical" href="https://www.metacritic.com/movie/{slug}/"/>
+</head><body>
+{filler(1500)}
+<div class="c-productHero_title g-inner-spacing-bottom-medium"><div> {html.escape(m['title'])} </div></div>
+<div class="c-heroVariant_headerInfo"><ul><li class="c-heroMetadata_item u-inline"><span> {m['year']} </span></li>
+<li class="c-heroMetadata_item"><span>R</span></li></ul></div>
+<div class="c-siteReviewScore_background c-siteReviewScore_background-critic_medium"><div class="c-siteReviewScore">
+<span>{80 + m['year'] % 10}</span></div></div>
+<div class="c-siteReviewScore_background c-siteReviewScore_background-user"><div class="c-siteReviewScore">
+<span>{'tbd' if m['score'] is None else m['score']}</span></div></div>
+<ul class="c-genreList">{genres}</ul>
+<div class="c-productDetails_staff_directors"><span>Directed By:</span>{directors}</div>
+<div class="c-movieDetails_sectionContainer g-inner-spacing-medium"><span class="g-text-bold">Duration</span>
+<span class="g-outer-spacing-left-medium-fluid"> {m['hours']} h {m['minutes']} m </span></div>
+<div class="c-globalCarousel">{actors}</div>
+{filler(1500)}
+{page_data_script(1000)}
+</body></html>"""
+
+
+def rottentomatoes_movie_page(m: dict, slug: str) -> str:
+    ld = {"@context": "http://schema.org", "@type": "Movie", "name": m["title"], "description": m["description"],
+          "dateCreated": f"{m['year']}-01-01", "genre": m["genres"],
+          "director": [{"@type": "Person", "name": d} for d in m["directors"]],
+          "actor": [{"@type": "Person", "name": a} for a in m["actors"]]}
+    scores = {"scoreboard": {"tomatometerScore": {"value": 91}, "audienceScore": {"value": 98}}} \
+        if m["score"] is not None else {"scoreboard": {}}
+    directors = ", ".join(f'<a href="/celebrity/{k}">{html.escape(d)}</a>' for k, d in enumerate(m["directors"]))
+    actors = "".join(f'<div class="cast-and-crew-item"><a href="/celebrity/a{k}"><p> {html.escape(a)} </p></a></div>'
+                     for k, a in enumerate(m["actors"]))
+    return f"""<!DOCTYPE html><html><head>
+<title>{html.escape(m['title'])} | Rotten Tomatoes</title>
+<meta property="og:type" content="video.movie"/>
+<meta property="og:description" content=" {html.escape(m['description'])} "/>
+<meta property="og:image" content="https://resizing.flixster.com/{m['id']}.jpg"/>
+<link rel="canonical" href="https://www.rottentomatoes.com/m/{slug}"/>
+<script type="application/ld+json">{json.dumps(ld)}</script>
+</head><body>
+{filler(1500)}
+<h1 class="title" slot="title"> {html.escape(m['title'])} </h1>
+<p slot="info">{m['year']}, {', '.join(m['genres'])}, {m['hours']}h {m['minutes']}m</p>
+<script id="scoreDetails" type="application/json">{json.dumps(scores)}</script>
+<p data-qa="movie-info-synopsis"> The synopsis of {html.escape(m['title'])}. </p>
+<ul id="info">
+<li><b data-qa="movie-info-item-label">Director:</b> <span data-qa="movie-info-item-value">{directors}</span></li>
+<li><b data-qa="movie-info-item-label">Genre:</b> <span data-qa="movie-info-item-value">{', '.join(m['genres'])}</span></li>
+<li><b data-qa="movie-info-item-label">Runtime:</b> <span data-qa="movie-info-item-value">
+<time datetime="P{m['hours']}h{m['minutes']}mM">{m['hours']}h {m['minutes']}m</time></span></li>
+</ul>
+<div class="cast-and-crew">{actors}</div>
+{filler(1500)}
+{page_data_script(1000)}
+</body></html>"""
+
+
+def write_synthetic_fixtures(fixtures_dir: str, num_movies: int = 8, seed: int = 42) -> int:
+    """
+    Write the synthetic pages of `num_movies` movies for every spider in `fixtures_dir`, in the layout of the recorded
+    fixtures (see `fixtures.py`).
+
+    :return: the number of pages written
+    """
+    from scrapy.http import HtmlResponse
+    from .fixtures import fixture_path, save_fixture
+
+    def write(spider_name, callback_name, url, body, cb_kwargs):
+        response = HtmlResponse(url=url, status=200, headers={"Content-Type": "text/html; charset=utf-8"},
+                                body=body.encode("utf-8"))
+        save_fixture(fixture_path(fixtures_dir, spider_name, callback_name, url), response, callback_name, cb_kwargs)
+
+    rng = random.Random(seed)
+    pages = set()
+    for i in range(num_movies):
+        m = synthetic_movie(i, rng)
+        imdb_url = f"https://www.imdb.com/title/tt{m['id']}/"
+        slug = m["title"].lower().replace(" ", "-").replace("&", "and").replace(".", "")
+        rt_slug = slug.replace("-", "_")
+        for spider_name, callback_name, url, body, cb_kwargs in [
+            ("imdb", "parse_movie", imdb_url, imdb_movie_page(m), {"depth": 0}),
+            ("imdb", "parse_plot", f"{imdb_url}plotsummary/", imdb_plot_page(m), {"movie_id": m["id"]}),
+            ("imdb", "extract_reviews", f"{imdb_url}reviews/_ajax?sort=reviewVolume&dir=desc&ratingFilter=0",
+             imdb_reviews_page(m), {"extracted": 0}),
+            ("metacritic", "parse_movie", f"https://www.metacritic.com/movie/{slug}/",
+             metacritic_movie_page(m, slug), {}),
+            ("rottentomatoes", "parse_movie", f"https://www.rottentomatoes.com/m/{rt_slug}",
+             rottentomatoes_movie_page(m, rt_slug), {}),
+        ]:
+            write(spider_name, callback_name, url, body, cb_kwargs)
+            pages.add((spider_name, url))
+    return len(pages)
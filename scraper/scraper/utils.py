@@ -1,3 +1,5 @@
+import io
+import math
 import os
 
 
@@ -11,3 +13,126 @@ def setup_postgres_connection():
     connection = psycopg2.connect(host=hostname, user=username, password=password, dbname=database)
     cursor = connection.cursor()
     return connection, cursor
+
+
+def setup_postgres_pool(max_connections: int):
+    """
+    Create a pool of connections to the database, safe to be used by several threads.
+
+    :param max_connections: the maximum number of connections open at the same time
+    """
+    from psycopg2.pool import ThreadedConnectionPool
+    hostname = os.environ["DB_HOST"]
+    username = os.environ["DB_USER"]
+    password = os.environ["DB_PASSWORD"]
+    database = os.environ["DB_NAME"]
+
+    return ThreadedConnectionPool(1, max_connections, host=hostname, user=username, password=password,
+                                  dbname=database)
+
+
+def pg_array(values) -> str:
+    """
+    Format a list of strings as a PostgreSQL array literal.
+    """
+    elements = []
+    for value in values:
+        if value is None:
+            elements.append("NULL")
+        else:
+            elements.append('"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"')
+    return "{" + ",".join(elements) + "}"
+
+
+def csv_value(value) -> str:
+    """
+    Format a value as a field of a CSV `COPY`: None is written unquoted (NULL), strings and arrays are always quoted.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return "NaN" if math.isnan(value) else repr(value)
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, (list, tuple)):
+        value = pg_array(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def copy_rows(cursor, table: str, columns: list, rows) -> None:
+    """
+    Insert the rows in `table` with a single `COPY`.
+
+    :param cursor: the psycopg2 cursor
+    :param table: the name of the table
+    :param columns: the names of the columns, in the same order of the values in the rows
+    :param rows: an iterable of tuples of values
+    """
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(",".join(csv_value(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+class SpillStore:
+    """
+    On-disk store (sqlite) of the items waiting to be merged, used by `MergePipeline` when its in-memory buffer is full.
+
+    Items are pickled and stored with the time they were added, so that they can expire; the store survives the crawl,
+    so the items still pending when a crawl ends are emitted by the next one.
+    """
+
+    def __init__(self, path: str):
+        import sqlite3
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS pending (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                added REAL NOT NULL,
+                item BLOB NOT NULL,
+                PRIMARY KEY (kind, key)
+            )""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS pending_added_idx ON pending (kind, added)")
+        self.connection.commit()
+
+    def put(self, kind: str, key: str, added: float, item):
+        import pickle
+        self.connection.execute("INSERT OR REPLACE INTO pending (kind, key, added, item) VALUES (?, ?, ?, ?)",
+                                (kind, key, added, pickle.dumps(item)))
+        self.connection.commit()
+
+    def pop(self, kind: str, key: str):
+        """
+        Remove an item from the store.
+
+        :return: the item, or None if it is not in the store
+        """
+        import pickle
+        row = self.connection.execute("SELECT item FROM pending WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+        if row is None:
+            return None
+        self.connection.execute("DELETE FROM pending WHERE kind = ? AND key = ?", (kind, key))
+        self.connection.commit()
+        return pickle.loads(row[0])
+
+    def pop_older_than(self, kind: str, deadline: float = float("inf")) -> list:
+        """
+        Remove the items added before `deadline` from the store (all the items, if no deadline is given).
+
+        :return: the removed items
+        """
+        import pickle
+        rows = self.connection.execute("SELECT item FROM pending WHERE kind = ? AND added < ?",
+                                       (kind, deadline)).fetchall()
+        self.connection.execute("DELETE FROM pending WHERE kind = ? AND added < ?", (kind, deadline))
+        self.connection.commit()
+        return [pickle.loads(item) for (item,) in rows]
+
+    def count(self, kind: str) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM pending WHERE kind = ?", (kind,)).fetchone()[0]
+
+    def close(self):
+        self.connection.close()